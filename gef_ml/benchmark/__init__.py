@@ -0,0 +1,37 @@
+from typing import TYPE_CHECKING
+
+from gef_ml.utils.lazy import lazy_attributes
+
+if TYPE_CHECKING:
+    from .fake_api import FakeTogetherServer
+    from .harness import (
+        BenchmarkReport,
+        generate_corpus,
+        run_embedding_benchmark,
+        run_inference_benchmark,
+        run_ingestion_benchmark,
+    )
+    from .legacy import legacy_clean
+
+__getattr__, __dir__ = lazy_attributes(
+    __name__,
+    {
+        "FakeTogetherServer": ".fake_api",
+        "BenchmarkReport": ".harness",
+        "generate_corpus": ".harness",
+        "run_embedding_benchmark": ".harness",
+        "run_inference_benchmark": ".harness",
+        "run_ingestion_benchmark": ".harness",
+        "legacy_clean": ".legacy",
+    },
+)
+
+__all__ = [
+    "FakeTogetherServer",
+    "BenchmarkReport",
+    "generate_corpus",
+    "run_embedding_benchmark",
+    "run_inference_benchmark",
+    "run_ingestion_benchmark",
+    "legacy_clean",
+]
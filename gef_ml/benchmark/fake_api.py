@@ -0,0 +1,286 @@
+"""
+This file contains the FakeTogetherServer, a local stand-in for the Together embeddings and chat completions endpoints.
+
+It serves the same request and response formats as the real API with configurable latency, per-endpoint rate limits and error injection, so ingestion and inference can be benchmarked offline and repeatably. Embeddings are derived from a hash of the input text, so the same text always gets the same vector and retrieval over them is deterministic.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import random
+import re
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, List, Optional
+
+import numpy as np
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+# Marker of the output format instructions llama-index adds for structured outputs
+_SCHEMA_MARKER = "Here's a JSON schema to follow:"
+
+
+@dataclass
+class EndpointStats:
+    """Counters of one endpoint and the server-side latencies (including the injected latency) of its successful requests."""
+
+    requests: int = 0
+    inputs: int = 0
+    errors: int = 0
+    rate_limited: int = 0
+    too_large: int = 0
+    # Estimated like the usage the server reports, four characters per token
+    prompt_tokens: int = 0
+    latencies: List[float] = field(default_factory=list)
+
+
+class _RateLimit:
+    """Sliding one second window of accepted requests."""
+
+    def __init__(self, max_per_second: float | None):
+        self.max_per_second = max_per_second
+        self._accepted: deque = deque()
+
+    def allow(self) -> bool:
+        if self.max_per_second is None:
+            return True
+        now = time.monotonic()
+        while self._accepted and now - self._accepted[0] >= 1:
+            self._accepted.popleft()
+        if len(self._accepted) >= self.max_per_second:
+            return False
+        self._accepted.append(now)
+        return True
+
+
+def fake_embedding(text: str, dim: int) -> List[float]:
+    """A unit vector seeded by the hash of the text."""
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(dim)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+def _fake_value(schema: dict, definitions: dict) -> Any:
+    if "$ref" in schema:
+        return _fake_value(definitions[schema["$ref"].split("/")[-1]], definitions)
+    if "enum" in schema:
+        return schema["enum"][0]
+    if "const" in schema:
+        return schema["const"]
+    for key in ("anyOf", "oneOf", "allOf"):
+        if key in schema:
+            options = [s for s in schema[key] if s.get("type") != "null"]
+            return _fake_value(options[0] if options else schema[key][0], definitions)
+
+    schema_type = schema.get("type")
+    if schema_type == "object":
+        return {
+            name: _fake_value(prop, definitions)
+            for name, prop in schema.get("properties", {}).items()
+        }
+    if schema_type == "array":
+        return [_fake_value(schema.get("items", {}), definitions)]
+    if schema_type == "integer":
+        return 1
+    if schema_type == "number":
+        return 1.0
+    if schema_type == "boolean":
+        return True
+    if schema_type == "null":
+        return None
+    return "Benchmark response"
+
+
+def fake_structured_output(prompt: str) -> Optional[str]:
+    """Builds a JSON object matching the schema in a structured output prompt, or returns None if the prompt has no schema."""
+    start = prompt.find(_SCHEMA_MARKER)
+    if start == -1:
+        return None
+    match = re.search(r"\{.*\}", prompt[start + len(_SCHEMA_MARKER) :], re.DOTALL)
+    if match is None:
+        return None
+    # The output parser escapes the braces of the schema for the prompt template, and the chat prompts keep them
+    schema_str = match.group(0).replace("{{", "{").replace("}}", "}")
+    try:
+        schema = json.loads(schema_str)
+    except json.JSONDecodeError:
+        return None
+    definitions = {**schema.get("definitions", {}), **schema.get("$defs", {})}
+    return json.dumps(_fake_value(schema, definitions))
+
+
+class FakeTogetherServer:
+    """
+    Local aiohttp server implementing `/v1/embeddings` and `/v1/chat/completions`.
+
+    Args:
+    - port: The port to listen on, 0 picks a free one.
+    - embed_latency / llm_latency: Seconds every request of the endpoint takes.
+    - latency_jitter: Random extra latency as a fraction of the base latency.
+    - embed_rate_limit / llm_rate_limit: Requests per second accepted before answering 429, None for no limit.
+    - error_rate: Fraction of requests answered with `error_status`.
+    - max_input_chars: Embedding requests with more characters in total are answered with 413.
+    - dim: The dimension of the embeddings.
+    - seed: Seed of the latency jitter and error injection.
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        embed_latency: float = 0.05,
+        llm_latency: float = 0.5,
+        latency_jitter: float = 0.0,
+        embed_rate_limit: float | None = None,
+        llm_rate_limit: float | None = None,
+        error_rate: float = 0.0,
+        error_status: int = 500,
+        max_input_chars: int | None = None,
+        dim: int = 768,
+        seed: int = 0,
+    ):
+        self.host = host
+        self.port = port
+        self.embed_latency = embed_latency
+        self.llm_latency = llm_latency
+        self.latency_jitter = latency_jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.max_input_chars = max_input_chars
+        self.dim = dim
+
+        self.embed_stats = EndpointStats()
+        self.llm_stats = EndpointStats()
+        self._embed_limit = _RateLimit(embed_rate_limit)
+        self._llm_limit = _RateLimit(llm_rate_limit)
+        self._rng = random.Random(seed)
+        self._runner: web.AppRunner | None = None
+
+    @property
+    def url(self) -> str:
+        """The base URL to use in place of `https://api.together.xyz/v1`."""
+        return f"http://{self.host}:{self.port}/v1"
+
+    async def start(self) -> "FakeTogetherServer":
+        app = web.Application(client_max_size=1 << 28)
+        app.router.add_post("/v1/embeddings", self._embeddings)
+        app.router.add_post("/v1/chat/completions", self._chat_completions)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        # Resolve the port when a free one was picked
+        self.port = site._server.sockets[0].getsockname()[1]  # type: ignore
+        logger.info("Fake Together API listening on %s", self.url)
+        return self
+
+    def reset_stats(self):
+        """Clears the endpoint counters, e.g. between two benchmark runs against the same server."""
+        self.embed_stats = EndpointStats()
+        self.llm_stats = EndpointStats()
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def __aenter__(self) -> "FakeTogetherServer":
+        return await self.start()
+
+    async def __aexit__(self, *exc_info):
+        await self.stop()
+
+    async def _delay(self, latency: float):
+        jitter = latency * self.latency_jitter * self._rng.random()
+        await asyncio.sleep(latency + jitter)
+
+    def _reject(
+        self, stats: EndpointStats, limit: _RateLimit
+    ) -> Optional[web.Response]:
+        if not limit.allow():
+            stats.rate_limited += 1
+            return web.json_response(
+                {"error": "rate limit exceeded"},
+                status=429,
+                headers={"X-RateLimit-Reset": "1"},
+            )
+        if self._rng.random() < self.error_rate:
+            stats.errors += 1
+            return web.json_response(
+                {"error": "injected error"}, status=self.error_status
+            )
+        return None
+
+    async def _embeddings(self, request: web.Request) -> web.Response:
+        start = time.perf_counter()
+        stats = self.embed_stats
+        stats.requests += 1
+        body = await request.json()
+        inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+
+        if (rejection := self._reject(stats, self._embed_limit)) is not None:
+            return rejection
+        if (
+            self.max_input_chars is not None
+            and sum(map(len, inputs)) > self.max_input_chars
+        ):
+            stats.too_large += 1
+            return web.json_response({"error": "input too large"}, status=413)
+
+        await self._delay(self.embed_latency)
+        data = [
+            {
+                "object": "embedding",
+                "index": i,
+                "embedding": fake_embedding(t, self.dim),
+            }
+            for i, t in enumerate(inputs)
+        ]
+        stats.inputs += len(inputs)
+        stats.latencies.append(time.perf_counter() - start)
+        return web.json_response(
+            {"object": "list", "model": body.get("model"), "data": data}
+        )
+
+    async def _chat_completions(self, request: web.Request) -> web.Response:
+        start = time.perf_counter()
+        stats = self.llm_stats
+        stats.requests += 1
+        body = await request.json()
+        prompt = "\n".join(str(m.get("content", "")) for m in body["messages"])
+
+        if (rejection := self._reject(stats, self._llm_limit)) is not None:
+            return rejection
+
+        await self._delay(self.llm_latency)
+        content = fake_structured_output(prompt) or "Benchmark summary."
+        stats.inputs += 1
+        stats.prompt_tokens += len(prompt) // 4
+        stats.latencies.append(time.perf_counter() - start)
+        return web.json_response(
+            {
+                "id": f"chatcmpl-{stats.requests}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body.get("model"),
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": content},
+                        "finish_reason": "stop",
+                    }
+                ],
+                "usage": {
+                    "prompt_tokens": len(prompt) // 4,
+                    "completion_tokens": len(content) // 4,
+                    "total_tokens": (len(prompt) + len(content)) // 4,
+                },
+            }
+        )
+
+
+__all__ = ["FakeTogetherServer", "EndpointStats", "fake_embedding"]
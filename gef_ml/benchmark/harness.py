@@ -0,0 +1,303 @@
+"""
+This file contains the benchmark runs of the embedding service, the ingestion and the batch inference against a FakeTogetherServer and an in-memory Qdrant.
+
+Each run returns a BenchmarkReport with the throughput of the run, the latency percentiles of the requests the fake server answered and the peak RSS. The peak RSS is the high-water mark of the process (and of its finished child processes) since it started, so compare it between separate invocations rather than between runs of one invocation.
+"""
+
+import csv
+import logging
+import os
+import random
+import resource
+import tempfile
+import time
+from dataclasses import asdict, dataclass, field
+from typing import List
+
+import numpy as np
+from llama_index.core.schema import Document
+from qdrant_client import QdrantClient
+
+from gef_ml.inference import (
+    INVOLVEMENT_TASK,
+    BatchInferenceEngine,
+    InferenceContext,
+    InferenceTask,
+)
+from gef_ml.inference.context import CONTEXT_WINDOW
+from gef_ml.ingestion import StreamingIngestion
+from gef_ml.ingestion.embedding_service import EmbeddingService
+from gef_ml.utils import get_qdrant_vectorstore
+from gef_ml.utils.metrics import metrics
+
+from .fake_api import EndpointStats, FakeTogetherServer
+
+logger = logging.getLogger(__name__)
+
+_WORDS = (
+    "private sector finance capacity policy climate biodiversity project "
+    "government enterprise investment partnership knowledge community energy "
+    "land water forest waste innovation market technology training support"
+).split()
+
+
+@dataclass
+class BenchmarkReport:
+    name: str
+    seconds: float
+    documents: int = 0
+    chunks: int = 0
+    embeddings: int = 0
+    projects: int = 0
+    failed_projects: int = 0
+    embed_requests: int = 0
+    embed_p50_ms: float = 0.0
+    embed_p95_ms: float = 0.0
+    llm_requests: int = 0
+    llm_prompt_tokens: int = 0
+    llm_p50_ms: float = 0.0
+    llm_p95_ms: float = 0.0
+    rate_limited: int = 0
+    errors: int = 0
+    peak_rss_mb: float = 0.0
+    peak_children_rss_mb: float = 0.0
+    # Client-side seconds per pipeline stage, from gef_ml.utils.metrics
+    stage_seconds: dict = field(default_factory=dict)
+
+    def rate(self, count: int) -> float:
+        return count / self.seconds if self.seconds > 0 else 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            **asdict(self),
+            "documents_per_second": self.rate(self.documents),
+            "chunks_per_second": self.rate(self.chunks),
+            "embeddings_per_second": self.rate(self.embeddings),
+            "projects_per_second": self.rate(self.projects),
+        }
+
+    def format(self) -> str:
+        lines = [f"{self.name}: {self.seconds:.2f}s"]
+        for label, count in [
+            ("documents", self.documents),
+            ("chunks", self.chunks),
+            ("embeddings", self.embeddings),
+            ("projects", self.projects),
+        ]:
+            if count:
+                lines.append(f"  {label}: {count} ({self.rate(count):.1f}/s)")
+        if self.failed_projects:
+            lines.append(f"  failed projects: {self.failed_projects}")
+        if self.embed_requests:
+            lines.append(
+                f"  embedding requests: {self.embed_requests}, p50 {self.embed_p50_ms:.1f} ms, p95 {self.embed_p95_ms:.1f} ms"
+            )
+        if self.llm_requests:
+            lines.append(
+                f"  LLM requests: {self.llm_requests} ({self.llm_prompt_tokens} prompt tokens), p50 {self.llm_p50_ms:.1f} ms, p95 {self.llm_p95_ms:.1f} ms"
+            )
+        lines.append(f"  rate limited: {self.rate_limited}, errors: {self.errors}")
+        lines.append(
+            f"  peak RSS: {self.peak_rss_mb:.1f} MB (children {self.peak_children_rss_mb:.1f} MB)"
+        )
+        for stage, seconds in sorted(self.stage_seconds.items()):
+            lines.append(f"  stage {stage}: {seconds:.2f}s")
+        return "\n".join(lines)
+
+
+def peak_rss_mb() -> tuple[float, float]:
+    """Returns the peak RSS of this process and of its waited-for children in MB (ru_maxrss is in KB on Linux)."""
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    return own, children
+
+
+def _percentiles_ms(latencies: List[float]) -> tuple[float, float]:
+    if not latencies:
+        return 0.0, 0.0
+    p50, p95 = np.percentile(latencies, [50, 95]) * 1000
+    return float(p50), float(p95)
+
+
+def _report(
+    name: str, seconds: float, server: FakeTogetherServer, **counts
+) -> BenchmarkReport:
+    embed: EndpointStats = server.embed_stats
+    llm: EndpointStats = server.llm_stats
+    embed_p50, embed_p95 = _percentiles_ms(embed.latencies)
+    llm_p50, llm_p95 = _percentiles_ms(llm.latencies)
+    own_rss, children_rss = peak_rss_mb()
+    return BenchmarkReport(
+        name=name,
+        seconds=seconds,
+        embed_requests=embed.requests,
+        embed_p50_ms=embed_p50,
+        embed_p95_ms=embed_p95,
+        llm_requests=llm.requests,
+        llm_prompt_tokens=llm.prompt_tokens,
+        llm_p50_ms=llm_p50,
+        llm_p95_ms=llm_p95,
+        rate_limited=embed.rate_limited + llm.rate_limited,
+        errors=embed.errors + llm.errors + embed.too_large,
+        peak_rss_mb=own_rss,
+        peak_children_rss_mb=children_rss,
+        stage_seconds=metrics.stage_seconds(),
+        **counts,
+    )
+
+
+def generate_corpus(
+    directory: str,
+    num_projects: int = 20,
+    files_per_project: int = 5,
+    paragraphs_per_file: int = 40,
+    seed: int = 0,
+) -> List[str]:
+    """Writes a synthetic corpus laid out like the downloaded GEF documents, returning the project IDs."""
+    rng = random.Random(seed)
+    project_ids = [str(1000 + i) for i in range(num_projects)]
+    for project_id in project_ids:
+        project_dir = os.path.join(directory, project_id)
+        os.makedirs(project_dir, exist_ok=True)
+        for doc in range(files_per_project):
+            paragraphs = []
+            for _ in range(paragraphs_per_file):
+                sentences = [
+                    " ".join(rng.choices(_WORDS, k=rng.randint(8, 20))).capitalize()
+                    + "."
+                    for _ in range(rng.randint(3, 8))
+                ]
+                paragraphs.append(" ".join(sentences))
+            path = os.path.join(project_dir, f"p{project_id}_doc{doc}__benchmark.txt")
+            with open(path, "w") as f:
+                f.write("\n\n".join(paragraphs))
+    return project_ids
+
+
+async def run_embedding_benchmark(
+    server: FakeTogetherServer,
+    texts: List[str],
+    max_requests_per_second: int = 75,
+    max_chunk_size: int | None = None,
+) -> BenchmarkReport:
+    """Embeds the texts with a fresh EmbeddingService."""
+    server.reset_stats()
+    metrics.reset()
+    nodes = [Document(text=t) for t in texts]
+    async with EmbeddingService(
+        api_key="benchmark", embed_endpoint_url=f"{server.url}/embeddings"
+    ) as service:
+        start = time.perf_counter()
+        embedded = await service.generate_embeddings(
+            nodes,
+            max_requests_per_second=max_requests_per_second,
+            max_chunk_size=max_chunk_size,
+        )
+        seconds = time.perf_counter() - start
+    return _report(
+        "embedding",
+        seconds,
+        server,
+        embeddings=sum(n.embedding is not None for n in embedded),
+    )
+
+
+async def run_ingestion_benchmark(
+    server: FakeTogetherServer,
+    corpus_dir: str,
+    qdrant_client: QdrantClient,
+    collection_name: str = "benchmark",
+    chunk_size: int = 512,
+    chunk_overlap: int = 64,
+    pipelined: bool = True,
+    parse_workers: int = 4,
+) -> BenchmarkReport:
+    """Ingests the corpus into a collection of the given (in-memory) Qdrant client."""
+    server.reset_stats()
+    metrics.reset()
+    documents = sum(len(files) for _, _, files in os.walk(corpus_dir))
+    ingestion = StreamingIngestion(
+        corpus_dir,
+        vector_store=get_qdrant_vectorstore(collection_name, qdrant_client),
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        embedding_service=EmbeddingService(
+            api_key="benchmark", embed_endpoint_url=f"{server.url}/embeddings"
+        ),
+    )
+
+    start = time.perf_counter()
+    if pipelined:
+        await ingestion.ingest_pipelined(parse_workers=parse_workers)
+    else:
+        await ingestion.ingest(parse_workers=parse_workers)
+    seconds = time.perf_counter() - start
+
+    chunks = qdrant_client.count(collection_name).count
+    return _report(
+        "ingestion" + (" (pipelined)" if pipelined else ""),
+        seconds,
+        server,
+        documents=documents,
+        chunks=chunks,
+        embeddings=server.embed_stats.inputs,
+    )
+
+
+async def run_inference_benchmark(
+    server: FakeTogetherServer,
+    qdrant_client: QdrantClient,
+    collection_name: str,
+    project_ids: List[str],
+    task: InferenceTask = INVOLVEMENT_TASK,
+    max_concurrency: int = 16,
+    qdrant_rate: float = 20,
+    embedding_rate: float = 10,
+    llm_rate: float = 2,
+    context_window: int = CONTEXT_WINDOW,
+) -> BenchmarkReport:
+    """Runs a batch inference task over the projects of an ingested collection. A smaller `context_window` makes the synthesis summarize the chunks of a project in several leaf calls."""
+    server.reset_stats()
+    metrics.reset()
+    context = InferenceContext(
+        qdrant_client=qdrant_client,
+        context_window=context_window,
+        api_base=server.url,
+        api_key="benchmark",
+    )
+    engine = BatchInferenceEngine(
+        collection_name,
+        max_concurrency=max_concurrency,
+        qdrant_rate=qdrant_rate,
+        embedding_rate=embedding_rate,
+        llm_rate=llm_rate,
+        retry_delay=0.5,
+        context=context,
+    )
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        output_path = os.path.join(tmp_dir, f"{task.name}.csv")
+        start = time.perf_counter()
+        await engine.run(task, project_ids, output_path)
+        seconds = time.perf_counter() - start
+        with open(output_path, newline="") as f:
+            rows = list(csv.reader(f))[1:]
+
+    failed = sum(row[1] == "No data" for row in rows)
+    return _report(
+        f"inference ({task.name})",
+        seconds,
+        server,
+        projects=len(rows) - failed,
+        failed_projects=failed,
+    )
+
+
+__all__ = [
+    "BenchmarkReport",
+    "generate_corpus",
+    "peak_rss_mb",
+    "run_embedding_benchmark",
+    "run_ingestion_benchmark",
+    "run_inference_benchmark",
+]
@@ -0,0 +1,18 @@
+"""Reference implementations that optimized code is benchmarked and tested against."""
+
+import re
+import unicodedata
+
+
+def legacy_clean(text: str) -> str:
+    """The cleaning steps of the TextCleaner before it was rewritten as a single pass."""
+    text = re.sub(r"(\w)\u00a0(\w)", r"\1 \2", text)
+    text = re.sub(r"(\w)\u00a0", r"\1 ", text)
+    text = re.sub(r"\u00a0(\w)", r" \1", text)
+    text = text.replace("\u00a0", " ")
+    text = re.sub(r"[\x00-\x1F\x7F-\x9F]", " ", text)
+    text = unicodedata.normalize("NFKC", text)
+    return text.strip()
+
+
+__all__ = ["legacy_clean"]
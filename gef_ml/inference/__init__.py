@@ -1,6 +1,47 @@
-from .private_sector import (
-    determine_private_sector_involvement,
-    generate_private_sector_summary,
+from typing import TYPE_CHECKING
+
+from gef_ml.utils.lazy import lazy_attributes
+
+if TYPE_CHECKING:
+    from .batch import (
+        INVOLVEMENT_TASK,
+        SUMMARY_TASK,
+        BatchInferenceEngine,
+        InferenceTask,
+    )
+    from .cascade import CascadeClassifier
+    from .context import InferenceContext
+    from .private_sector import (
+        determine_private_sector_involvement,
+        generate_private_sector_summary,
+    )
+    from .response_cache import LLMResponseCache
+    from .results_store import ResultsStore
+
+__getattr__, __dir__ = lazy_attributes(
+    __name__,
+    {
+        "INVOLVEMENT_TASK": ".batch",
+        "SUMMARY_TASK": ".batch",
+        "BatchInferenceEngine": ".batch",
+        "InferenceTask": ".batch",
+        "CascadeClassifier": ".cascade",
+        "InferenceContext": ".context",
+        "determine_private_sector_involvement": ".private_sector",
+        "generate_private_sector_summary": ".private_sector",
+        "LLMResponseCache": ".response_cache",
+        "ResultsStore": ".results_store",
+    },
 )
 
-__all__ = ["determine_private_sector_involvement"]
+__all__ = [
+    "determine_private_sector_involvement",
+    "BatchInferenceEngine",
+    "InferenceTask",
+    "INVOLVEMENT_TASK",
+    "SUMMARY_TASK",
+    "CascadeClassifier",
+    "InferenceContext",
+    "LLMResponseCache",
+    "ResultsStore",
+]
@@ -0,0 +1,396 @@
+"""
+This file contains the batch engine that runs the private sector inference for many projects concurrently.
+
+Each project goes through three steps that are each rate limited separately: embedding the query, searching Qdrant for the project's nodes and synthesizing the answer with the LLM. With a cascade classifier, tasks that allow it first read the project's chunk embeddings from Qdrant, and projects the classifier is confident about are answered without the other steps, see `gef_ml.inference.cascade`. The embedding and search are blocking calls, so they run on a thread pool while the event loop schedules up to `max_concurrency` projects at a time. The synthesis of tasks with an async variant runs on the event loop, where the leaf summaries of a project run concurrently and every LLM call waits on the LLM rate limiter. Results are written by a single CSV writer in completion order, and failed projects are put back on the work queue until they run out of retries.
+"""
+
+import asyncio
+import contextlib
+import contextvars
+import csv
+import logging
+import time
+from concurrent.futures import Executor, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, List, Optional
+
+from aiolimiter import AsyncLimiter
+from llama_index.core.schema import NodeWithScore
+from tqdm import tqdm
+
+from gef_ml.utils.metrics import metrics, project_scope
+
+from .cascade import CascadeClassifier, project_embedding
+from .context import InferenceContext, get_default_context
+from .private_sector import (
+    asynthesize_involvement,
+    asynthesize_summary,
+    get_query_embedding,
+    query_project_nodes,
+    synthesize_involvement,
+    synthesize_summary,
+)
+from .prompts import (
+    QUERY_PRIVATE_SECTOR_INVOLVEMENT,
+    QUERY_PRIVATE_SECTOR_SUMMARY,
+    PrivSectorClassResponseObj,
+)
+from .results_store import ResultsStore, prompt_version
+from .synthesis import SUMMARY_TEMPLATE, template_texts
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class InferenceTask:
+    """Describes one kind of per-project inference and how its results are written to CSV."""
+
+    name: str
+    query: str
+    top_k: int
+    mmr_threshold: float
+    synthesize: Callable[[List[NodeWithScore], InferenceContext], Any]
+    header: List[str]
+    to_row: Callable[[str, Any], List[Any]]
+    # Hash of the query, synthesis templates and response schema, results in a ResultsStore are only reused for the same version
+    prompt_version: str
+    quoting: int = csv.QUOTE_MINIMAL
+    # Async variant of `synthesize`, also taking the LLM rate limiter to wait on before every LLM call
+    asynthesize: Optional[
+        Callable[[List[NodeWithScore], InferenceContext, AsyncLimiter], Awaitable[Any]]
+    ] = None
+    # Whether the engine's cascade classifier may answer the task, whose responses must then be involvement levels
+    cascadable: bool = False
+
+
+INVOLVEMENT_TASK = InferenceTask(
+    name="involvement",
+    query=QUERY_PRIVATE_SECTOR_INVOLVEMENT,
+    top_k=20,
+    mmr_threshold=0.7,
+    synthesize=synthesize_involvement,
+    asynthesize=asynthesize_involvement,
+    cascadable=True,
+    prompt_version=prompt_version(
+        QUERY_PRIVATE_SECTOR_INVOLVEMENT,
+        *template_texts(SUMMARY_TEMPLATE),
+        output_cls=PrivSectorClassResponseObj,
+    ),
+    header=[
+        "project_id",
+        "involvement_level",
+        "secondary_involvement_level",
+        "reason",
+        "extra_info",
+    ],
+    to_row=lambda project_id, response: [
+        project_id,
+        response.involvement_level,
+        response.secondary_involvement_level,
+        response.reason,
+        response.extra_info,
+    ],
+)
+
+SUMMARY_TASK = InferenceTask(
+    name="summary",
+    # Retrieval uses the involvement query for summaries as well
+    query=QUERY_PRIVATE_SECTOR_INVOLVEMENT,
+    top_k=25,
+    mmr_threshold=0.6,
+    synthesize=synthesize_summary,
+    asynthesize=asynthesize_summary,
+    prompt_version=prompt_version(
+        QUERY_PRIVATE_SECTOR_SUMMARY, *template_texts(SUMMARY_TEMPLATE)
+    ),
+    header=["project_id", "summary"],
+    to_row=lambda project_id, response: [project_id, response],
+    quoting=csv.QUOTE_ALL,
+)
+
+
+class BatchInferenceEngine:
+    """
+    Runs an InferenceTask over many projects concurrently.
+
+    Args:
+    - qdrant_collection: The collection to retrieve the project nodes from.
+    - max_concurrency: The maximum number of projects in progress at once.
+    - qdrant_rate / embedding_rate / llm_rate: Maximum requests per second to each service.
+    - max_retries: How many times a failed project is put back on the queue.
+    - retry_delay: Seconds to wait before a failed project is retried, doubled on every attempt.
+    - context: The clients shared by every project, defaults to the process-wide context.
+    - cascade: Classifier that answers the projects of cascadable tasks it is confident about without the LLM, None to send every project to the LLM.
+    - results_store: Store the results are appended to instead of only a CSV file. Projects that already have a result for the task, collection and prompt version are skipped.
+    """
+
+    def __init__(
+        self,
+        qdrant_collection: str,
+        max_concurrency: int = 16,
+        qdrant_rate: float = 20,
+        embedding_rate: float = 10,
+        llm_rate: float = 2,
+        max_retries: int = 3,
+        retry_delay: float = 5,
+        context: InferenceContext | None = None,
+        cascade: CascadeClassifier | None = None,
+        results_store: ResultsStore | None = None,
+    ):
+        self.context = context or get_default_context()
+        self.qdrant_collection = qdrant_collection
+        self.max_concurrency = max_concurrency
+        self.qdrant_limiter = AsyncLimiter(max_rate=qdrant_rate, time_period=1)
+        self.embedding_limiter = AsyncLimiter(max_rate=embedding_rate, time_period=1)
+        self.llm_limiter = AsyncLimiter(max_rate=llm_rate, time_period=1)
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.cascade = cascade
+        # Projects the cascade classifier answered in the current run
+        self._cascade_decided: set[str] = set()
+        self.results_store = results_store
+
+    async def _run_blocking(
+        self,
+        executor: Executor,
+        name: str,
+        limiter: AsyncLimiter,
+        fn: Callable,
+        *args,
+    ) -> Any:
+        async with metrics.limiter_wait(limiter, name):
+            loop = asyncio.get_running_loop()
+            # Run in a copy of the context so the metrics are attributed to the current project
+            context = contextvars.copy_context()
+            return await loop.run_in_executor(executor, context.run, fn, *args)
+
+    async def _process(
+        self, task: InferenceTask, project_id: str, executor: Executor
+    ) -> Optional[Any]:
+        with project_scope(project_id):
+            return await self._process_project(task, project_id, executor)
+
+    async def _process_project(
+        self, task: InferenceTask, project_id: str, executor: Executor
+    ) -> Optional[Any]:
+        if self.cascade is not None and task.cascadable:
+            embedding = await self._run_blocking(
+                executor,
+                "qdrant",
+                self.qdrant_limiter,
+                project_embedding,
+                project_id,
+                self.qdrant_collection,
+                self.context,
+            )
+            if embedding is None:
+                return None
+            response = self.cascade.decide(embedding)
+            if response is not None:
+                metrics.increment("cascade_decided", target=task.name)
+                self._cascade_decided.add(project_id)
+                return response
+            metrics.increment("cascade_deferred", target=task.name)
+
+        query_embedding = await self._run_blocking(
+            executor,
+            "embedding",
+            self.embedding_limiter,
+            get_query_embedding,
+            task.query,
+            self.context,
+        )
+        nodes = await self._run_blocking(
+            executor,
+            "qdrant",
+            self.qdrant_limiter,
+            query_project_nodes,
+            project_id,
+            self.qdrant_collection,
+            query_embedding,
+            task.top_k,
+            task.mmr_threshold,
+            self.context,
+        )
+        if not nodes:
+            return None
+        if task.asynthesize is not None:
+            return await task.asynthesize(nodes, self.context, self.llm_limiter)
+        return await self._run_blocking(
+            executor, "llm", self.llm_limiter, task.synthesize, nodes, self.context
+        )
+
+    def _cascade_version(self, task: InferenceTask) -> Optional[str]:
+        """The version results decided by the cascade classifier are stored under, so they are never mistaken for LLM answers. None when the task isn't answered by a cascade."""
+        if self.cascade is None or not task.cascadable:
+            return None
+        return f"{task.prompt_version}+cascade-{self.cascade.version}"
+
+    async def run(
+        self,
+        task: InferenceTask,
+        project_ids: List[str],
+        output_path: str | None = None,
+        run_id: str | None = None,
+    ):
+        """
+        Runs the task for every project and writes one CSV row per project to `output_path`.
+
+        With a results store, the results are appended to the store under `run_id` (the start time by default), the projects with a result from an earlier run are skipped, and `output_path` gets the latest results of every project in the store once the run is done. Answers of the cascade classifier are stored under their own version, which only counts as a result while the same classifier is in use.
+        """
+        run_id = run_id or time.strftime("%Y%m%dT%H%M%S")
+        cascade_version = self._cascade_version(task)
+        versions = [task.prompt_version]
+        if cascade_version is not None:
+            versions.append(cascade_version)
+        if self.results_store is not None:
+            completed = set().union(
+                *(
+                    self.results_store.completed(
+                        task.name, self.qdrant_collection, version
+                    )
+                    for version in versions
+                )
+            )
+            if completed:
+                logger.info(
+                    f"Skipping {sum(p in completed for p in project_ids)} projects with results for prompt version {task.prompt_version}"
+                )
+            project_ids = [p for p in project_ids if p not in completed]
+
+        logger.info(
+            f"Running {task.name} for {len(project_ids)} projects with concurrency {self.max_concurrency}"
+        )
+        work: asyncio.Queue = asyncio.Queue()
+        results: asyncio.Queue = asyncio.Queue()
+        for project_id in project_ids:
+            work.put_nowait((project_id, 0))
+
+        remaining = len(project_ids)
+        self._cascade_decided = set()
+        progress = tqdm(total=remaining, desc=f"Processing projects ({task.name})")
+
+        # Keep references to the pending retries so they aren't garbage collected
+        retries: set[asyncio.Task] = set()
+
+        async def requeue_later(project_id: str, attempt: int):
+            await asyncio.sleep(self.retry_delay * 2 ** (attempt - 1))
+            await work.put((project_id, attempt))
+
+        async def worker(executor: Executor):
+            nonlocal remaining
+            while True:
+                item = await work.get()
+                if item is None:
+                    return
+                project_id, attempt = item
+                try:
+                    response = await self._process(task, project_id, executor)
+                except Exception:
+                    logger.exception(f"Error processing project ID {project_id}")
+                    if attempt < self.max_retries:
+                        metrics.increment(
+                            "retries", project_id=project_id, target=task.name
+                        )
+                        logger.warning(
+                            f"Retrying project ID {project_id} (attempt {attempt + 1} of {self.max_retries})"
+                        )
+                        retry = asyncio.create_task(
+                            requeue_later(project_id, attempt + 1)
+                        )
+                        retries.add(retry)
+                        retry.add_done_callback(retries.discard)
+                        continue
+                    logger.error(
+                        f"Failed to process project ID {project_id} within {self.max_retries} retries"
+                    )
+                    response = None
+
+                await results.put((project_id, response))
+                remaining -= 1
+                if remaining == 0:
+                    for _ in range(self.max_concurrency):
+                        work.put_nowait(None)
+
+        async def writer():
+            with contextlib.ExitStack() as stack:
+                f = None
+                if self.results_store is None and output_path is not None:
+                    f = stack.enter_context(open(output_path, "w", newline=""))
+                    logger.info(f"Writing results to {output_path}")
+                    csv_writer = csv.writer(f, quoting=task.quoting)
+                    csv_writer.writerow(task.header)
+                for _ in range(len(project_ids)):
+                    project_id, response = await results.get()
+                    if response:
+                        row = task.to_row(project_id, response)
+                        logger.info(f"Successfully processed project ID {project_id}")
+                        metrics.finish_project(project_id, "done", run=task.name)
+                    else:
+                        row = [project_id] + ["No data"] * (len(task.header) - 1)
+                        metrics.finish_project(project_id, "no_data", run=task.name)
+                        logger.warning(f"No data received for project ID {project_id}")
+                    if self.results_store is not None:
+                        self.results_store.append(
+                            task.name,
+                            self.qdrant_collection,
+                            (
+                                cascade_version
+                                if project_id in self._cascade_decided
+                                else task.prompt_version
+                            ),
+                            project_id,
+                            run_id,
+                            dict(zip(task.header, row)) if response else None,
+                        )
+                    if f is not None:
+                        csv_writer.writerow(row)
+                        f.flush()
+                    progress.update(1)
+
+        def export():
+            if self.results_store is not None and output_path is not None:
+                self.results_store.export_csv(
+                    output_path,
+                    task.name,
+                    task.header,
+                    self.qdrant_collection,
+                    versions,
+                    quoting=task.quoting,
+                )
+
+        if not project_ids:
+            progress.close()
+            export()
+            return
+
+        executor = ThreadPoolExecutor(max_workers=self.max_concurrency)
+        tasks = [asyncio.create_task(writer())] + [
+            asyncio.create_task(worker(executor)) for _ in range(self.max_concurrency)
+        ]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            # The workers would otherwise wait on the work queue forever once the writer is gone
+            for pending in [*tasks, *retries]:
+                pending.cancel()
+            await asyncio.gather(*tasks, *retries, return_exceptions=True)
+            raise
+        finally:
+            progress.close()
+            if self.cascade is not None and task.cascadable:
+                logger.info(
+                    f"The cascade classifier decided {len(self._cascade_decided)} of {len(project_ids)} projects without the LLM"
+                )
+            metrics.flush()
+            # Off the event loop, waiting for a blocking call still running in a thread would stall every other task
+            await asyncio.to_thread(executor.shutdown, wait=True, cancel_futures=True)
+        export()
+
+
+__all__ = [
+    "BatchInferenceEngine",
+    "InferenceTask",
+    "INVOLVEMENT_TASK",
+    "SUMMARY_TASK",
+]
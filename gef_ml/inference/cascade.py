@@ -0,0 +1,296 @@
+"""
+This file contains the cascade classifier, which decides the private sector involvement of the projects it is confident about without calling the LLM.
+
+A project is represented by the normalized mean of its chunk embeddings, which are already stored in the collection, so the cascade costs one Qdrant scroll per project and no embedding or LLM calls. A softmax regression over these vectors is trained with NumPy on two sources of labels:
+- past involvement result CSVs, where each project has the level chosen by the LLM ("No data" rows are skipped, later files take precedence),
+- the "Private sector tagged" column of the project list, which only says that a project involves the private sector, so its target is spread evenly over the levels other than "No private sector involvement".
+
+Projects whose most probable level reaches `threshold` get that level directly, the rest go through the LLM as before. `evaluate` cross-validates the classifier and reports, for each threshold, how often the direct decisions agree with the labels and the fraction of LLM calls they avoid.
+"""
+
+import csv
+import hashlib
+import logging
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Sequence, get_args
+
+import numpy as np
+from qdrant_client.http import models as qdrant_models
+
+from gef_ml.utils.local_vectors import LocalVectorStore
+
+from .context import InferenceContext, get_default_context
+from .prompts import PrivSectorClassResponseObj
+
+logger = logging.getLogger(__name__)
+
+LEVELS: List[str] = list(
+    get_args(PrivSectorClassResponseObj.model_fields["involvement_level"].annotation)
+)
+NO_INVOLVEMENT = "No private sector involvement"
+NO_DATA = "No data"
+
+
+def load_result_labels(paths: Iterable[str]) -> Dict[str, str]:
+    """Reads the involvement level of every project from result CSVs written by the batch engine. Projects in later files override earlier ones."""
+    labels: Dict[str, str] = {}
+    for path in paths:
+        with open(path, newline="") as f:
+            for row in csv.DictReader(f):
+                level = (row.get("involvement_level") or "").strip()
+                if level in LEVELS:
+                    labels[str(row["project_id"]).strip()] = level
+                elif level and level != NO_DATA:
+                    logger.warning(
+                        f"Skipping unknown involvement level {level!r} of project {row['project_id']} in {path}"
+                    )
+    return labels
+
+
+def load_tagged_projects(excel_path: str, sheet_name: str = "projectlist") -> set:
+    """Returns the IDs of the projects tagged as involving the private sector in the project list."""
+    from gef_ml.utils.project_list import load_project_list
+
+    df = load_project_list(excel_path, sheet_name)
+    tagged = df["Private sector tagged"].astype(str).str.strip().str.lower() == "yes"
+    return set(df.loc[tagged, "GEF ID"].astype(str))
+
+
+def build_targets(
+    labels: Dict[str, str], tagged: Iterable[str] = (), levels: Sequence[str] = LEVELS
+) -> Dict[str, np.ndarray]:
+    """
+    Returns the target distribution over `levels` of every labelled project. A result label is one-hot, a tag without a result label is uniform over the levels with involvement.
+    """
+    targets: Dict[str, np.ndarray] = {}
+    involved = np.asarray([level != NO_INVOLVEMENT for level in levels], dtype=float)
+    for project_id in tagged:
+        targets[project_id] = involved / involved.sum()
+    for project_id, level in labels.items():
+        target = np.zeros(len(levels))
+        target[levels.index(level)] = 1
+        targets[project_id] = target
+    return targets
+
+
+def project_embedding(
+    project_id: str, collection_name: str, context: InferenceContext | None = None
+) -> Optional[np.ndarray]:
+    """Returns the normalized mean of the chunk embeddings of a project, or None if the project has no chunks in the collection."""
+    context = context or get_default_context()
+    vector_store = context.get_vector_store(collection_name)
+
+    if isinstance(vector_store, LocalVectorStore):
+        start, count = vector_store.projects.get(project_id, (0, 0))
+        vectors = np.asarray(vector_store.vectors[start : start + count])
+    else:
+        qdrant_filter = qdrant_models.Filter(
+            must=[
+                qdrant_models.FieldCondition(
+                    key="project_id", match=qdrant_models.MatchValue(value=project_id)
+                )
+            ]
+        )
+        rows = []
+        offset = None
+        while True:
+            records, offset = context.qdrant_client.scroll(
+                collection_name=collection_name,
+                scroll_filter=qdrant_filter,
+                limit=1024,
+                offset=offset,
+                with_payload=False,
+                with_vectors=True,
+            )
+            rows += [r.vector for r in records]
+            if offset is None or not records:
+                break
+        vectors = np.asarray(rows, dtype=np.float32)
+
+    if len(vectors) == 0:
+        return None
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    mean = (vectors / np.where(norms == 0, 1, norms)).mean(axis=0)
+    return mean / (np.linalg.norm(mean) or 1)
+
+
+class CascadeClassifier:
+    """
+    Softmax regression over project embeddings that decides the involvement level of a project when it is confident enough.
+
+    Args:
+    - threshold: The probability of the most likely level from which a project is decided without the LLM.
+    - l2: The weight of the L2 penalty on the coefficients.
+    - epochs: The number of full-batch gradient descent steps.
+    - learning_rate: The step size of gradient descent.
+    - levels: The involvement levels the classifier chooses between.
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.9,
+        l2: float = 1e-3,
+        epochs: int = 500,
+        learning_rate: float = 1.0,
+        levels: Sequence[str] = LEVELS,
+    ):
+        self.threshold = threshold
+        self.l2 = l2
+        self.epochs = epochs
+        self.learning_rate = learning_rate
+        self.levels = list(levels)
+        self.mean: Optional[np.ndarray] = None
+        self.scale = 1.0
+        self.weights: Optional[np.ndarray] = None
+        self.bias: Optional[np.ndarray] = None
+
+    def fit(self, X: np.ndarray, Y: np.ndarray) -> "CascadeClassifier":
+        """Fits the classifier to embeddings `X` (n, d) and target distributions `Y` (n, levels)."""
+        X = np.asarray(X, dtype=np.float64)
+        Y = np.asarray(Y, dtype=np.float64)
+        self.mean = X.mean(axis=0)
+        X = X - self.mean
+        # Project embeddings are close together, so the centered rows are scaled to unit norm on average
+        self.scale = float(np.sqrt((X**2).sum(axis=1).mean())) or 1.0
+        X = X / self.scale
+        self.weights = np.zeros((X.shape[1], len(self.levels)))
+        # Start from the label frequencies, so an uninformative embedding predicts the prior
+        prior = Y.mean(axis=0) + 1e-6
+        self.bias = np.log(prior / prior.sum())
+        for _ in range(self.epochs):
+            error = self._softmax(X @ self.weights + self.bias) - Y
+            self.weights -= self.learning_rate * (
+                X.T @ error / len(X) + self.l2 * self.weights
+            )
+            self.bias -= self.learning_rate * error.mean(axis=0)
+        return self
+
+    @staticmethod
+    def _softmax(logits: np.ndarray) -> np.ndarray:
+        exp = np.exp(logits - logits.max(axis=1, keepdims=True))
+        return exp / exp.sum(axis=1, keepdims=True)
+
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        """Returns the probability of every level for each row of `X`."""
+        if self.weights is None:
+            raise ValueError("The cascade classifier has not been fitted")
+        X = (np.atleast_2d(np.asarray(X, dtype=np.float64)) - self.mean) / self.scale
+        return self._softmax(X @ self.weights + self.bias)
+
+    def decide(self, embedding: np.ndarray) -> Optional[PrivSectorClassResponseObj]:
+        """Returns the response for a project embedding if the classifier is confident about it, otherwise None to leave the project to the LLM."""
+        proba = self.predict_proba(embedding)[0]
+        best = int(proba.argmax())
+        if proba[best] < self.threshold:
+            return None
+        return PrivSectorClassResponseObj(
+            involvement_level=self.levels[best],  # type: ignore
+            secondary_involvement_level=None,
+            reason=f"Decided by the cascade classifier with probability {proba[best]:.2f}, without the LLM.",
+            extra_info=None,
+        )
+
+    @property
+    def version(self) -> str:
+        """A short hash of the fitted parameters and the threshold, which changes whenever the classifier would decide differently."""
+        if self.weights is None:
+            raise ValueError("The cascade classifier has not been fitted")
+        sha256 = hashlib.sha256()
+        for array in (self.mean, self.weights, self.bias):
+            sha256.update(np.ascontiguousarray(array, dtype=np.float64).tobytes())
+        sha256.update(repr((self.scale, self.levels, self.threshold)).encode("utf-8"))
+        return sha256.hexdigest()[:12]
+
+    def save(self, path: str):
+        if self.weights is None:
+            raise ValueError("The cascade classifier has not been fitted")
+        np.savez(
+            path,
+            mean=self.mean,
+            scale=self.scale,
+            weights=self.weights,
+            bias=self.bias,
+            levels=np.asarray(self.levels),
+            threshold=self.threshold,
+        )
+
+    @classmethod
+    def load(cls, path: str, threshold: float | None = None) -> "CascadeClassifier":
+        """Loads a classifier saved with `save`, optionally with another threshold."""
+        with np.load(path) as data:
+            classifier = cls(
+                threshold=float(data["threshold"]) if threshold is None else threshold,
+                levels=[str(level) for level in data["levels"]],
+            )
+            classifier.mean = data["mean"]
+            classifier.scale = float(data["scale"])
+            classifier.weights = data["weights"]
+            classifier.bias = data["bias"]
+        return classifier
+
+
+@dataclass(frozen=True)
+class CascadeReport:
+    """Cross-validated result of the cascade at one threshold."""
+
+    threshold: float
+    projects: int
+    decided: int
+    agreement: float
+
+    @property
+    def llm_calls_avoided(self) -> float:
+        return self.decided / self.projects if self.projects else 0.0
+
+
+def evaluate(
+    X: np.ndarray,
+    Y: np.ndarray,
+    thresholds: Sequence[float],
+    folds: int = 5,
+    seed: int = 0,
+    **classifier_kwargs,
+) -> List[CascadeReport]:
+    """
+    Cross-validates the classifier over `folds` folds and reports each threshold.
+
+    A direct decision agrees with a project's label when the label's target gives the decided level any weight, so it must be the LLM's level for result labels, and any level with involvement for tagged projects.
+    """
+    X = np.asarray(X, dtype=np.float64)
+    Y = np.asarray(Y, dtype=np.float64)
+    order = np.random.default_rng(seed).permutation(len(X))
+    proba = np.zeros_like(Y)
+    for fold in np.array_split(order, folds):
+        train = np.setdiff1d(order, fold)
+        classifier = CascadeClassifier(**classifier_kwargs).fit(X[train], Y[train])
+        proba[fold] = classifier.predict_proba(X[fold])
+
+    best = proba.argmax(axis=1)
+    confidence = proba.max(axis=1)
+    correct = Y[np.arange(len(Y)), best] > 0
+    reports = []
+    for threshold in thresholds:
+        decided = confidence >= threshold
+        reports.append(
+            CascadeReport(
+                threshold=threshold,
+                projects=len(X),
+                decided=int(decided.sum()),
+                agreement=(
+                    float(correct[decided].mean()) if decided.any() else float("nan")
+                ),
+            )
+        )
+    return reports
+
+
+__all__ = [
+    "CascadeClassifier",
+    "CascadeReport",
+    "LEVELS",
+    "build_targets",
+    "evaluate",
+    "load_result_labels",
+    "load_tagged_projects",
+    "project_embedding",
+]
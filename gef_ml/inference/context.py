@@ -0,0 +1,169 @@
+"""
+This file contains the InferenceContext, which holds the long-lived clients used by the inference functions.
+
+Building a TogetherEmbedding, a QdrantClient, a TogetherLLM and a TreeSummarize for every project adds several client setups and an embedding round-trip for the constant query prompts to each project. The context builds each of them once and memoizes the query embeddings, so the per-project work is only the filtered search and the LLM call.
+"""
+
+import logging
+import os
+import threading
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple, Type
+
+from llama_index.core import PromptHelper
+from llama_index.core.types import PydanticProgramMode
+from llama_index.vector_stores.qdrant import QdrantVectorStore
+from pydantic import BaseModel
+from qdrant_client import QdrantClient
+
+from gef_ml.utils import get_qdrant_client, get_vectorstore
+
+from .response_cache import LLMResponseCache
+from .synthesis import PackedTreeSummarize
+
+if TYPE_CHECKING:
+    from llama_index.embeddings.together import TogetherEmbedding
+    from llama_index.llms.together import TogetherLLM
+
+    from gef_ml.utils.local_vectors import LocalVectorStore
+
+logger = logging.getLogger(__name__)
+
+EMBED_MODEL_NAME = "togethercomputer/m2-bert-80M-2k-retrieval"
+LLM_MODEL_NAME = "mistralai/Mixtral-8x7B-Instruct-v0.1"
+CONTEXT_WINDOW = 32768
+
+
+class InferenceContext:
+    """
+    Long-lived clients and memoized query embeddings shared by the inference calls of a run.
+
+    The clients are built on first use, so a context can be created without credentials or a reachable Qdrant. The Together API key defaults to the `TOGETHER_API_KEY` environment variable.
+    """
+
+    def __init__(
+        self,
+        embed_model_name: str = EMBED_MODEL_NAME,
+        llm_model_name: str = LLM_MODEL_NAME,
+        qdrant_client: QdrantClient | None = None,
+        context_window: int = CONTEXT_WINDOW,
+        response_cache: LLMResponseCache | None = None,
+        vector_backend: str | None = None,
+        api_base: str | None = None,
+        api_key: str | None = None,
+    ):
+        self.embed_model_name = embed_model_name
+        self.llm_model_name = llm_model_name
+        self.context_window = context_window
+        self.response_cache = response_cache
+        self.vector_backend = vector_backend
+        # Only overridden to point the clients at a stand-in API, see `gef_ml.benchmark`
+        self.api_base = api_base
+        self.api_key = api_key
+
+        self._embed_model: "TogetherEmbedding | None" = None
+        self._llm: "TogetherLLM | None" = None
+        self._qdrant_client = qdrant_client
+
+        # Reentrant since the memoized getters build the clients while holding it
+        self._lock = threading.RLock()
+        self._vector_stores: Dict[str, "QdrantVectorStore | LocalVectorStore"] = {}
+        self._query_embeddings: Dict[str, List[float]] = {}
+        self._summarizers: Dict[Tuple[int, Optional[type]], PackedTreeSummarize] = {}
+
+    def _api_kwargs(self) -> dict:
+        api_key = self.api_key or os.getenv("TOGETHER_API_KEY")
+        if api_key is None:
+            raise ValueError("TOGETHER_API_KEY environment variable is not set")
+        kwargs = {"api_key": api_key}
+        if self.api_base:
+            kwargs["api_base"] = self.api_base
+        return kwargs
+
+    @property
+    def embed_model(self) -> "TogetherEmbedding":
+        with self._lock:
+            if self._embed_model is None:
+                from llama_index.embeddings.together import TogetherEmbedding
+
+                self._embed_model = TogetherEmbedding(
+                    model_name=self.embed_model_name, **self._api_kwargs()
+                )
+            return self._embed_model
+
+    @property
+    def llm(self) -> "TogetherLLM":
+        with self._lock:
+            if self._llm is None:
+                from llama_index.llms.together import TogetherLLM
+
+                # TogetherLLM subclasses OpenAI, so the default program mode would pick the OpenAI function calling program, which rejects non-OpenAI models. Structured outputs are parsed from the completion text instead.
+                self._llm = TogetherLLM(
+                    model=self.llm_model_name,
+                    pydantic_program_mode=PydanticProgramMode.LLM,
+                    **self._api_kwargs(),
+                )
+            return self._llm
+
+    @property
+    def qdrant_client(self) -> QdrantClient:
+        with self._lock:
+            if self._qdrant_client is None:
+                self._qdrant_client = get_qdrant_client()
+            return self._qdrant_client
+
+    def get_vector_store(
+        self, collection_name: str
+    ) -> "QdrantVectorStore | LocalVectorStore":
+        """Returns the vector store of a collection from the configured backend, see `gef_ml.utils.get_vectorstore`."""
+        with self._lock:
+            if collection_name not in self._vector_stores:
+                self._vector_stores[collection_name] = get_vectorstore(
+                    collection_name=collection_name,
+                    qdrant_client=self.qdrant_client,
+                    backend=self.vector_backend,
+                )
+            return self._vector_stores[collection_name]
+
+    def get_query_embedding(self, query: str) -> List[float]:
+        """Embeds a query once and returns the memoized embedding on later calls."""
+        with self._lock:
+            embedding = self._query_embeddings.get(query)
+        if embedding is None:
+            logger.info("Embedding query prompt (%d characters)", len(query))
+            embedding = self.embed_model.get_query_embedding(query)
+            with self._lock:
+                self._query_embeddings[query] = embedding
+        return embedding
+
+    def get_summarizer(
+        self, num_output: int, output_cls: Optional[Type[BaseModel]] = None
+    ) -> PackedTreeSummarize:
+        key = (num_output, output_cls)
+        with self._lock:
+            if key not in self._summarizers:
+                prompt_helper = PromptHelper(
+                    context_window=self.context_window, num_output=num_output
+                )
+                self._summarizers[key] = PackedTreeSummarize(
+                    verbose=True,
+                    llm=self.llm,
+                    prompt_helper=prompt_helper,
+                    output_cls=output_cls,  # type: ignore
+                )
+            return self._summarizers[key]
+
+
+_default_context: InferenceContext | None = None
+_default_context_lock = threading.Lock()
+
+
+def get_default_context() -> InferenceContext:
+    """Returns the process-wide InferenceContext, creating it on first use."""
+    global _default_context
+    with _default_context_lock:
+        if _default_context is None:
+            _default_context = InferenceContext()
+        return _default_context
+
+
+__all__ = ["InferenceContext", "get_default_context"]
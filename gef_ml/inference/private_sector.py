@@ -13,22 +13,22 @@ Also have the in depth descriptions from Eki
 """
 
 import logging
-import os
-from typing import List, Literal, Optional
+from typing import Any, List, Literal, Optional
 
-from llama_index.core import PromptHelper, VectorStoreIndex
-from llama_index.core.base.response.schema import PydanticResponse
-from llama_index.core.response_synthesizers import TreeSummarize
-from llama_index.core.schema import NodeWithScore
+from aiolimiter import AsyncLimiter
+from llama_index.core import VectorStoreIndex
+from llama_index.core.schema import MetadataMode, NodeWithScore
 from llama_index.core.vector_stores import VectorStoreQuery
 from llama_index.core.vector_stores.types import VectorStoreQueryMode
-from llama_index.embeddings.together import TogetherEmbedding
-from llama_index.llms.together import TogetherLLM
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, ValidationError
 from qdrant_client.http import models as qdrant_models
 
 from gef_ml.utils import get_qdrant_vectorstore
+from gef_ml.utils.metrics import metrics
 
+from .context import InferenceContext, get_default_context
+from .response_cache import LLMResponseCache, prompt_text
+from .synthesis import PackedTreeSummarize
 from .prompts import (
     QUERY_PRIVATE_SECTOR_INVOLVEMENT,
     QUERY_PRIVATE_SECTOR_SUMMARY,
@@ -39,23 +39,27 @@ from .prompts import (
 
 logger = logging.getLogger(__name__)
 
-MAX_RETRIES = 3
 
+def get_query_embedding(
+    query: str, context: InferenceContext | None = None
+) -> List[float]:
+    """Embed a query with the same model that was used to embed the project chunks. The embedding is memoized by the context."""
+    context = context or get_default_context()
+    with metrics.timer("query_embedding"):
+        return context.get_query_embedding(query)
 
-if os.environ.get("TOGETHER_API_KEY") is None:
-    raise ValueError("TOGETHER_API_KEY environment variable is not set")
 
-
-def retrieve_points(
-    project_id: str, collection_name: str, top_k: int = 20, mmr_threshold: float = 0.7
+def query_project_nodes(
+    project_id: str,
+    collection_name: str,
+    query_embedding: List[float],
+    top_k: int = 20,
+    mmr_threshold: float = 0.7,
+    context: InferenceContext | None = None,
 ) -> List[NodeWithScore]:
-    """Retrieve nodes from the vector store based on a project ID."""
-    embed_model = TogetherEmbedding(
-        model_name="togethercomputer/m2-bert-80M-2k-retrieval"
-    )
-
-    vector_store = get_qdrant_vectorstore(collection_name=collection_name)
-    query_embedding = embed_model.get_query_embedding(QUERY_PRIVATE_SECTOR_INVOLVEMENT)
+    """Search the vector store for the nodes of a project closest to a query embedding."""
+    context = context or get_default_context()
+    vector_store = context.get_vector_store(collection_name)
 
     qdrant_filters = qdrant_models.Filter(
         must=[
@@ -71,11 +75,13 @@ def retrieve_points(
         mode=VectorStoreQueryMode.MMR,
         mmr_threshold=mmr_threshold,  # TODO: Determine the best threshold, closer to one is more similar, closer to zero is more diverse
     )
+    # The Qdrant integration doesn't implement the MMR mode and returns the plain top-k, which LocalVectorStore matches
 
     logger.info(
         f"Querying for project_id {project_id} in collection {vector_store.collection_name}"
     )
-    query_results = vector_store.query(qdrant_query, qdrant_filters=qdrant_filters)
+    with metrics.timer("retrieval", project_id):
+        query_results = vector_store.query(qdrant_query, qdrant_filters=qdrant_filters)
 
     if not query_results.nodes:
         logger.warning(f"No nodes found for project_id {project_id}")
@@ -89,7 +95,23 @@ def retrieve_points(
     return nodes_with_scores
 
 
+def retrieve_points(
+    project_id: str,
+    collection_name: str,
+    top_k: int = 20,
+    mmr_threshold: float = 0.7,
+    context: InferenceContext | None = None,
+) -> List[NodeWithScore]:
+    """Retrieve nodes from the vector store based on a project ID."""
+    query_embedding = get_query_embedding(QUERY_PRIVATE_SECTOR_INVOLVEMENT, context)
+    return query_project_nodes(
+        project_id, collection_name, query_embedding, top_k, mmr_threshold, context
+    )
+
+
 def get_pydantic_query_engine(output_cls: BaseModel):
+    from llama_index.llms.together import TogetherLLM
+
     vector_store = get_qdrant_vectorstore(collection_name="gef_6_1024_96")
     llm = TogetherLLM(model="mistralai/Mixtral-8x7B-Instruct-v0.1")
 
@@ -101,45 +123,83 @@ def get_pydantic_query_engine(output_cls: BaseModel):
     query_engine.synthesize
 
 
-def determine_private_sector_involvement(
-    project_id: str, qdrant_collection: str, retry_num: int = 0
-) -> Optional[PrivSectorClassResponseObj]:
-    """Determine the level of private sector involvement for a given project ID."""
-    nodes = retrieve_points(project_id, qdrant_collection)
-    if not nodes:
-        return None
+def _response_cache_key(
+    context: InferenceContext,
+    summarize: PackedTreeSummarize,
+    query: str,
+    nodes: List[NodeWithScore],
+    output_cls: Optional[type] = None,
+) -> tuple[str, str]:
+    """Returns the LLM response cache key and prompt hash for a synthesize call."""
+    prompt_hash = LLMResponseCache.prompt_hash(
+        prompt_text(query, summarize.get_prompts(), output_cls)
+    )
+    key = LLMResponseCache.make_key(context.llm_model_name, prompt_hash, nodes)
+    return key, prompt_hash
 
-    llm_model = TogetherLLM(model="mistralai/Mixtral-8x7B-Instruct-v0.1")
-    prompt_helper = PromptHelper(context_window=32768, num_output=512)
-    summarize = TreeSummarize(verbose=True, llm=llm_model, prompt_helper=prompt_helper, output_cls=PrivSectorClassResponseObj)  # type: ignore
 
+def _text_chunks(nodes: List[NodeWithScore]) -> List[str]:
+    return [n.node.get_content(metadata_mode=MetadataMode.LLM) for n in nodes]
+
+
+def _parse_cached(output_cls: type[BaseModel], parsed: str) -> Optional[BaseModel]:
+    """Validates a cached response object, returning None when it no longer fits the response model."""
     try:
-        response = summarize.synthesize(
-            query=QUERY_PRIVATE_SECTOR_INVOLVEMENT, nodes=nodes
+        return output_cls.model_validate_json(parsed)
+    except ValidationError as e:
+        logger.warning("Ignoring cached LLM response that fails validation: %s", e)
+        return None
+
+
+def _lookup_involvement(
+    context: InferenceContext,
+    summarize: PackedTreeSummarize,
+    nodes: List[NodeWithScore],
+) -> tuple[Optional[tuple[str, str]], Optional[PrivSectorClassResponseObj]]:
+    """Returns the response cache key and prompt hash (None without a cache) and the cached response, if any."""
+    cache = context.response_cache
+    if cache is None:
+        return None, None
+    key, prompt_hash = _response_cache_key(
+        context,
+        summarize,
+        QUERY_PRIVATE_SECTOR_INVOLVEMENT,
+        nodes,
+        PrivSectorClassResponseObj,
+    )
+    cached = cache.get(key)
+    if cached is not None and cached.parsed is not None:
+        response = _parse_cached(PrivSectorClassResponseObj, cached.parsed)
+        if response is not None:
+            logger.info("Using cached LLM response")
+            metrics.increment("llm_cache_hits")
+            return (key, prompt_hash), response  # type: ignore
+    return (key, prompt_hash), None
+
+
+def _store_involvement(
+    context: InferenceContext, cache_key: Optional[tuple[str, str]], response: Any
+) -> Optional[PrivSectorClassResponseObj]:
+    structured_response = None
+
+    if isinstance(response, PrivSectorClassResponseObj):
+        structured_response = PrivSectorClassResponseObj(
+            involvement_level=response.involvement_level,
+            secondary_involvement_level=response.secondary_involvement_level,
+            reason=response.reason,
+            extra_info=response.extra_info,
         )
-    except Exception as e:
-        logger.exception(f"Error synthesizing response for project_id {project_id}")
-        if retry_num < MAX_RETRIES:
-            logger.warning(f"Retrying for project_id {project_id}")
-            return determine_private_sector_involvement(
-                project_id, qdrant_collection, retry_num=retry_num + 1
-            )
-        else:
-            logger.error(
-                f"Failed to determine private sector involvement for project_id {project_id} within {retry_num} retries"
-            )
-            return None
-
-    if isinstance(response, PydanticResponse):
-        if isinstance(response.response, PrivSectorClassResponseObj):
-            structured_response = PrivSectorClassResponseObj(
-                involvement_level=response.response.involvement_level,
-                secondary_involvement_level=response.response.secondary_involvement_level,
-                reason=response.response.reason,
-                extra_info=response.response.extra_info,
-            )
 
     if structured_response:
+        if context.response_cache is not None and cache_key is not None:
+            key, prompt_hash = cache_key
+            context.response_cache.put(
+                key,
+                context.llm_model_name,
+                prompt_hash,
+                raw=str(response),
+                parsed=structured_response.model_dump_json(),
+            )
         return structured_response
 
     else:
@@ -149,35 +209,102 @@ def determine_private_sector_involvement(
         return None
 
 
-def generate_private_sector_summary(
-    project_id: str, qdrant_collection: str
-) -> Optional[PrivSectorSummaryResponseObj] | str:
-    """Generate a summary of the private sector involvement for a given project ID."""
-    nodes = retrieve_points(project_id, qdrant_collection, top_k=25, mmr_threshold=0.6)
-    if not nodes:
-        return None
+def synthesize_involvement(
+    nodes: List[NodeWithScore], context: InferenceContext | None = None
+) -> Optional[PrivSectorClassResponseObj]:
+    """Classify the private sector involvement of a project from its retrieved nodes. Errors from the LLM are raised to the caller."""
+    context = context or get_default_context()
+    summarize = context.get_summarizer(
+        num_output=512, output_cls=PrivSectorClassResponseObj
+    )
+    cache_key, cached = _lookup_involvement(context, summarize, nodes)
+    if cached is not None:
+        return cached
+
+    # get_response rather than synthesize: synthesize wraps the result in a PydanticResponse, whose pydantic v1
+    # validation turns the pydantic v2 response object into an empty model
+    with metrics.timer("synthesis"):
+        response = summarize.get_response(
+            query_str=QUERY_PRIVATE_SECTOR_INVOLVEMENT, text_chunks=_text_chunks(nodes)
+        )
+    return _store_involvement(context, cache_key, response)
 
-    llm_model = TogetherLLM(model="mistralai/Mixtral-8x7B-Instruct-v0.1")
-    prompt_helper = PromptHelper(context_window=32768, num_output=768)
-    summarize = TreeSummarize(verbose=True, llm=llm_model, prompt_helper=prompt_helper)  # type: ignore   , output_cls=PrivSectorSummaryResponseObj
 
-    try:
-        response = summarize.synthesize(query=QUERY_PRIVATE_SECTOR_SUMMARY, nodes=nodes)
-    except Exception as e:
-        logger.exception(f"Error synthesizing response for project_id {project_id}")
-        return None
+async def asynthesize_involvement(
+    nodes: List[NodeWithScore],
+    context: InferenceContext | None = None,
+    llm_limiter: AsyncLimiter | None = None,
+) -> Optional[PrivSectorClassResponseObj]:
+    """`synthesize_involvement` on the event loop, with the leaf summaries run concurrently. Every LLM call waits on `llm_limiter`."""
+    context = context or get_default_context()
+    summarize = context.get_summarizer(
+        num_output=512, output_cls=PrivSectorClassResponseObj
+    )
+    cache_key, cached = _lookup_involvement(context, summarize, nodes)
+    if cached is not None:
+        return cached
+
+    with metrics.timer("synthesis"):
+        response = await summarize.aget_response(
+            query_str=QUERY_PRIVATE_SECTOR_INVOLVEMENT,
+            text_chunks=_text_chunks(nodes),
+            llm_limiter=llm_limiter,
+        )
+    return _store_involvement(context, cache_key, response)
+
+
+def _lookup_summary(
+    context: InferenceContext,
+    summarize: PackedTreeSummarize,
+    nodes: List[NodeWithScore],
+) -> tuple[Optional[tuple[str, str]], Optional[PrivSectorSummaryResponseObj] | str]:
+    """Returns the response cache key and prompt hash (None without a cache) and the cached response, if any."""
+    cache = context.response_cache
+    if cache is None:
+        return None, None
+    key, prompt_hash = _response_cache_key(
+        context, summarize, QUERY_PRIVATE_SECTOR_SUMMARY, nodes
+    )
+    cached = cache.get(key)
+    if cached is None:
+        return (key, prompt_hash), None
+    response = (
+        _parse_cached(PrivSectorSummaryResponseObj, cached.parsed)
+        if cached.parsed is not None
+        else cached.raw
+    )
+    if response is None:
+        return (key, prompt_hash), None
+    logger.info("Using cached LLM response")
+    metrics.increment("llm_cache_hits")
+    return (key, prompt_hash), response  # type: ignore
 
+
+def _store_summary(
+    context: InferenceContext, cache_key: Optional[tuple[str, str]], response: Any
+) -> Optional[PrivSectorSummaryResponseObj] | str:
     logger.info(f"Response: {response}")
-    print(response)
-    print(type(response))
 
     structured_response = None
 
-    if isinstance(response, PydanticResponse):
-        if isinstance(response.response, PrivSectorSummaryResponseObj):
-            structured_response = PrivSectorSummaryResponseObj(
-                summary=response.response.summary
-            )
+    if isinstance(response, PrivSectorSummaryResponseObj):
+        structured_response = PrivSectorSummaryResponseObj(summary=response.summary)
+
+    if (
+        context.response_cache is not None
+        and cache_key is not None
+        and (structured_response or response)
+    ):
+        key, prompt_hash = cache_key
+        context.response_cache.put(
+            key,
+            context.llm_model_name,
+            prompt_hash,
+            raw=str(response),
+            parsed=(
+                structured_response.model_dump_json() if structured_response else None
+            ),
+        )
 
     if structured_response:
         return structured_response
@@ -190,3 +317,78 @@ def generate_private_sector_summary(
         logger.info(f"Response: {response}")
         logger.info(f"Type: {type(response)}")
         return None
+
+
+def synthesize_summary(
+    nodes: List[NodeWithScore], context: InferenceContext | None = None
+) -> Optional[PrivSectorSummaryResponseObj] | str:
+    """Summarize the private sector involvement of a project from its retrieved nodes. Errors from the LLM are raised to the caller."""
+    context = context or get_default_context()
+    # , output_cls=PrivSectorSummaryResponseObj
+    summarize = context.get_summarizer(num_output=768)
+    cache_key, cached = _lookup_summary(context, summarize, nodes)
+    if cached is not None:
+        return cached
+
+    with metrics.timer("synthesis"):
+        response = summarize.get_response(
+            query_str=QUERY_PRIVATE_SECTOR_SUMMARY, text_chunks=_text_chunks(nodes)
+        )
+    return _store_summary(context, cache_key, response)
+
+
+async def asynthesize_summary(
+    nodes: List[NodeWithScore],
+    context: InferenceContext | None = None,
+    llm_limiter: AsyncLimiter | None = None,
+) -> Optional[PrivSectorSummaryResponseObj] | str:
+    """`synthesize_summary` on the event loop, with the leaf summaries run concurrently. Every LLM call waits on `llm_limiter`."""
+    context = context or get_default_context()
+    summarize = context.get_summarizer(num_output=768)
+    cache_key, cached = _lookup_summary(context, summarize, nodes)
+    if cached is not None:
+        return cached
+
+    with metrics.timer("synthesis"):
+        response = await summarize.aget_response(
+            query_str=QUERY_PRIVATE_SECTOR_SUMMARY,
+            text_chunks=_text_chunks(nodes),
+            llm_limiter=llm_limiter,
+        )
+    return _store_summary(context, cache_key, response)
+
+
+def determine_private_sector_involvement(
+    project_id: str, qdrant_collection: str, context: InferenceContext | None = None
+) -> Optional[PrivSectorClassResponseObj]:
+    """
+    Determine the level of private sector involvement for a given project ID.
+
+    Failures are logged and return None; retrying is left to the caller, see `gef_ml.inference.batch`.
+    """
+    nodes = retrieve_points(project_id, qdrant_collection, context=context)
+    if not nodes:
+        return None
+
+    try:
+        return synthesize_involvement(nodes, context)
+    except Exception as e:
+        logger.exception(f"Error synthesizing response for project_id {project_id}")
+        return None
+
+
+def generate_private_sector_summary(
+    project_id: str, qdrant_collection: str, context: InferenceContext | None = None
+) -> Optional[PrivSectorSummaryResponseObj] | str:
+    """Generate a summary of the private sector involvement for a given project ID."""
+    nodes = retrieve_points(
+        project_id, qdrant_collection, top_k=25, mmr_threshold=0.6, context=context
+    )
+    if not nodes:
+        return None
+
+    try:
+        return synthesize_summary(nodes, context)
+    except Exception as e:
+        logger.exception(f"Error synthesizing response for project_id {project_id}")
+        return None
@@ -0,0 +1,110 @@
+"""
+This file contains the LLMResponseCache, a persistent cache of TreeSummarize results.
+
+Entries are keyed by the LLM model, a hash of the full prompt text (query, synthesis templates and response schema) and the ordered IDs and content hashes of the retrieved nodes. Re-running a batch after a crash or after a change that doesn't affect a project's evidence then returns the stored result instead of calling the LLM again.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import List, NamedTuple, Optional
+
+from llama_index.core.schema import NodeWithScore
+
+logger = logging.getLogger(__name__)
+
+
+class CachedResponse(NamedTuple):
+    raw: str
+    parsed: Optional[str]
+
+
+def _sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    """SQLite backed store of raw completions and their parsed response objects."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                prompt_hash TEXT NOT NULL,
+                raw TEXT NOT NULL,
+                parsed TEXT,
+                created_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def prompt_hash(prompt_text: str) -> str:
+        return _sha256(prompt_text)
+
+    @staticmethod
+    def make_key(model: str, prompt_hash: str, nodes: List[NodeWithScore]) -> str:
+        """Builds the cache key from the model, the prompt hash and the ordered node IDs and content hashes."""
+        evidence = "\n".join(f"{n.node.node_id}:{n.node.hash}" for n in nodes)
+        return _sha256(f"{model}\0{prompt_hash}\0{evidence}")
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT raw, parsed FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return CachedResponse(*row)
+
+    def put(
+        self,
+        key: str,
+        model: str,
+        prompt_hash: str,
+        raw: str,
+        parsed: Optional[str] = None,
+    ):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, prompt_hash, raw, parsed, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, prompt_hash, raw, parsed, time.time()),
+            )
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def prompt_text(query: str, prompts: dict, output_cls: Optional[type] = None) -> str:
+    """
+    Concatenates the query, the templates of a synthesizer's prompts (from `get_prompts()`) and the name and JSON schema of the output class, i.e. everything that shapes the LLM input besides the nodes. Editing the response model then invalidates its cached responses.
+    """
+    templates = {name: prompt.get_template() for name, prompt in prompts.items()}
+    parts = [query, json.dumps(templates, sort_keys=True)]
+    if output_cls is not None:
+        parts.append(output_cls.__name__)
+        parts.append(json.dumps(output_cls.model_json_schema(), sort_keys=True))  # type: ignore
+    return "\0".join(parts)
+
+
+__all__ = ["LLMResponseCache", "CachedResponse", "prompt_text"]
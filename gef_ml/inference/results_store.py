@@ -0,0 +1,228 @@
+"""
+This file contains the ResultsStore, an append-only SQLite store of the per-project results of inference runs.
+
+Every result is keyed by the task, the project, the Qdrant collection, the prompt version and the run ID, so runs never overwrite each other. A new run skips the projects that already have a result for the same task, collection and prompt version, and the results of any runs can be loaded, joined or exported to the CSV layout of the batch engine without re-reading CSV files. The database is in WAL mode with a busy timeout, so several processes can append to it at once.
+"""
+
+import csv
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+DONE = "done"
+NO_DATA = "no_data"
+
+
+def prompt_version(*prompts: str, output_cls: Optional[type] = None) -> str:
+    """A short hash of the prompt texts of a task (its query and synthesis templates) and the JSON schema of its response model, which changes whenever any of them is edited."""
+    parts = list(prompts)
+    if output_cls is not None:
+        parts.append(json.dumps(output_cls.model_json_schema(), sort_keys=True))  # type: ignore
+    return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()[:12]
+
+
+class ResultsStore:
+    """
+    SQLite backed store of the results of inference runs, see the module docstring.
+
+    Args:
+    - path: The SQLite database file, created with its directory if missing.
+    - timeout: Seconds a write waits for another process holding the database lock.
+    """
+
+    def __init__(self, path: str, timeout: float = 30):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=timeout, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS results (
+                task TEXT NOT NULL,
+                collection TEXT NOT NULL,
+                prompt_version TEXT NOT NULL,
+                project_id TEXT NOT NULL,
+                run_id TEXT NOT NULL,
+                status TEXT NOT NULL,
+                result TEXT,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (task, collection, prompt_version, project_id, run_id)
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS results_run ON results (task, run_id)"
+        )
+        self._conn.commit()
+
+    def append(
+        self,
+        task: str,
+        collection: str,
+        prompt_version: str,
+        project_id: str,
+        run_id: str,
+        result: Optional[Dict[str, Any]],
+    ):
+        """Adds the result of a project, a dict of its CSV columns or None if the run got no data for it."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    task,
+                    collection,
+                    prompt_version,
+                    project_id,
+                    run_id,
+                    DONE if result is not None else NO_DATA,
+                    json.dumps(result, default=str) if result is not None else None,
+                    time.time(),
+                ),
+            )
+            self._conn.commit()
+
+    def completed(self, task: str, collection: str, prompt_version: str) -> set:
+        """Returns the IDs of the projects with a result for the task, collection and prompt version in any run."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT DISTINCT project_id FROM results WHERE task = ? AND collection = ? AND prompt_version = ? AND status = ?",
+                (task, collection, prompt_version, DONE),
+            ).fetchall()
+        return {row[0] for row in rows}
+
+    def to_frame(
+        self,
+        task: str,
+        collection: Optional[str] = None,
+        prompt_version: str | Sequence[str] | None = None,
+        run_ids: Optional[Iterable[str]] = None,
+        latest: bool = True,
+    ) -> pd.DataFrame:
+        """
+        Returns the results of a task as a DataFrame with the key columns and one column per result field.
+
+        Args:
+        - collection / prompt_version / run_ids: Only return the results matching these, None for all. Several prompt versions can be given, e.g. those of the LLM and the cascade classifier.
+        - latest: Only return the most recent result of every project and key, preferring results with data. The prompt versions given are treated as one key.
+        """
+        query = "SELECT task, collection, prompt_version, project_id, run_id, status, result, created_at FROM results WHERE task = ?"
+        params: List[Any] = [task]
+        if collection is not None:
+            query += " AND collection = ?"
+            params.append(collection)
+        key = ["collection", "prompt_version", "project_id"]
+        if prompt_version is not None:
+            versions = (
+                [prompt_version]
+                if isinstance(prompt_version, str)
+                else list(prompt_version)
+            )
+            query += f" AND prompt_version IN ({', '.join('?' * len(versions))})"
+            params += versions
+            key = ["collection", "project_id"]
+        if run_ids is not None:
+            run_ids = list(run_ids)
+            query += f" AND run_id IN ({', '.join('?' * len(run_ids))})"
+            params += run_ids
+        query += " ORDER BY created_at"
+        with self._lock:
+            df = pd.read_sql_query(query, self._conn, params=params)
+
+        if latest and not df.empty:
+            done = df["status"] == DONE
+            df = (
+                df.assign(_done=done)
+                .sort_values(["_done", "created_at"], kind="stable")
+                .drop_duplicates(key, keep="last")
+                .drop(columns=["_done"])
+                .sort_values("created_at", kind="stable")
+            )
+        fields = pd.json_normalize(
+            [json.loads(r) if r is not None else {} for r in df["result"]]
+        )
+        fields = fields.drop(columns=["project_id"], errors="ignore")
+        fields.index = df.index
+        return pd.concat([df.drop(columns=["result"]), fields], axis=1)
+
+    def compare_runs(
+        self, task: str, run_a: str, run_b: str, field: str
+    ) -> pd.DataFrame:
+        """Returns a result field of the projects two runs have in common, side by side, with whether they agree."""
+        with self._lock:
+            df = pd.read_sql_query(
+                """
+                SELECT a.project_id, json_extract(a.result, '$.' || ?) AS a, json_extract(b.result, '$.' || ?) AS b
+                FROM results a JOIN results b ON a.task = b.task AND a.project_id = b.project_id
+                WHERE a.task = ? AND a.run_id = ? AND b.run_id = ? AND a.status = ? AND b.status = ?
+                """,
+                self._conn,
+                params=[field, field, task, run_a, run_b, DONE, DONE],
+            )
+        df.columns = ["project_id", run_a, run_b]
+        df["agree"] = df[run_a] == df[run_b]
+        return df
+
+    def export_csv(
+        self,
+        path: str,
+        task: str,
+        header: List[str],
+        collection: str,
+        prompt_version: str | Sequence[str],
+        quoting: int = csv.QUOTE_MINIMAL,
+    ):
+        """Writes the latest result of every project for the key in the CSV layout of the batch engine, with "No data" rows for projects without one. With several prompt versions, a project's latest result under any of them is written."""
+        df = self.to_frame(task, collection, prompt_version)
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f, quoting=quoting)
+            writer.writerow(header)
+            for _, row in df.iterrows():
+                if row["status"] == DONE:
+                    values = [row.get(column) for column in header[1:]]
+                    writer.writerow(
+                        [row["project_id"]]
+                        + [None if pd.isna(v) else v for v in values]
+                    )
+                else:
+                    writer.writerow(
+                        [row["project_id"]] + ["No data"] * (len(header) - 1)
+                    )
+        logger.info(f"Exported {len(df)} {task} results to {path}")
+
+    def import_csv(
+        self,
+        path: str,
+        task: str,
+        collection: str,
+        prompt_version: str,
+        run_id: str,
+    ) -> int:
+        """Adds the rows of a results CSV written by an earlier run, returning their number. Rows of "No data" are added without a result."""
+        with open(path, newline="") as f:
+            rows = list(csv.DictReader(f))
+        for row in rows:
+            values = [v for k, v in row.items() if k != "project_id"]
+            result = None if values and all(v == "No data" for v in values) else row
+            self.append(
+                task, collection, prompt_version, row["project_id"], run_id, result
+            )
+        return len(rows)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+__all__ = ["ResultsStore", "prompt_version"]
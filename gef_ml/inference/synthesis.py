@@ -0,0 +1,252 @@
+"""
+This file contains PackedTreeSummarize, the TreeSummarize used to synthesize the private sector answers from the retrieved chunks of a project.
+
+TreeSummarize joins the chunks and re-splits them into windows with a 10% token overlap, cutting chunks at arbitrary token positions, and runs the leaf summaries of a tree one after another. PackedTreeSummarize instead:
+- drops near-duplicate chunks (the same passage retrieved from copies of a document), comparing the word shingles of the chunks,
+- packs whole chunks into as few windows as the prompt budget allows, without overlap,
+- runs the leaf summaries concurrently in `aget_response`, each one waiting on an optional rate limiter, and only asks for the structured output in the final call.
+"""
+
+import asyncio
+import json
+import logging
+from typing import Any, Callable, List, Optional, Sequence
+
+from aiolimiter import AsyncLimiter
+from llama_index.core.node_parser import TokenTextSplitter
+from llama_index.core.prompts import BasePromptTemplate
+from llama_index.core.prompts.default_prompt_selectors import (
+    DEFAULT_TREE_SUMMARIZE_PROMPT_SEL,
+)
+from llama_index.core.response_synthesizers import TreeSummarize
+from llama_index.core.types import RESPONSE_TEXT_TYPE
+from llama_index.core.utils import get_tokenizer
+
+from gef_ml.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+SEPARATOR = "\n\n"
+
+# The summary prompt of every PackedTreeSummarize, named so the prompt versions of the tasks can hash it
+SUMMARY_TEMPLATE: BasePromptTemplate = DEFAULT_TREE_SUMMARIZE_PROMPT_SEL
+
+
+def template_texts(template: BasePromptTemplate) -> List[str]:
+    """Returns the text of a prompt template and, for a selector, of every template it may select for the LLM."""
+    texts = [template.get_template()]
+    for _, conditional in getattr(template, "conditionals", None) or []:
+        texts.append(conditional.get_template())
+    return texts
+
+
+def _shingles(text: str, size: int) -> set[tuple[str, ...]]:
+    words = text.lower().split()
+    if len(words) <= size:
+        return {tuple(words)}
+    return {tuple(words[i : i + size]) for i in range(len(words) - size + 1)}
+
+
+def drop_near_duplicates(
+    text_chunks: Sequence[str], threshold: float = 0.9, shingle_size: int = 5
+) -> List[str]:
+    """
+    Returns the chunks without those whose word shingles overlap an earlier chunk's by at least `threshold` (Jaccard similarity). Earlier chunks are kept, so pass them in order of relevance.
+    """
+    kept: List[str] = []
+    kept_shingles: List[set] = []
+    for chunk in text_chunks:
+        shingles = _shingles(chunk, shingle_size)
+        if any(
+            len(shingles & other) >= threshold * len(shingles | other)
+            for other in kept_shingles
+        ):
+            continue
+        kept.append(chunk)
+        kept_shingles.append(shingles)
+    return kept
+
+
+def pack_chunks(
+    text_chunks: Sequence[str],
+    budget: int,
+    count_tokens: Callable[[str], int],
+    split: Callable[[str], List[str]],
+) -> List[str]:
+    """
+    Packs the chunks into as few windows of at most `budget` tokens as first-fit decreasing finds, keeping the order of the chunks within a window. Chunks longer than the budget are cut with `split` first.
+
+    Token counts aren't exactly additive when chunks are joined, so every window is measured again and its last chunks are moved to a new window while it is over the budget.
+    """
+    pieces: List[tuple[int, str, int]] = []
+    for chunk in (c.strip() for c in text_chunks):
+        if not chunk:
+            continue
+        tokens = count_tokens(chunk)
+        if tokens <= budget:
+            pieces.append((len(pieces), chunk, tokens))
+        else:
+            for piece in split(chunk):
+                pieces.append((len(pieces), piece, count_tokens(piece)))
+
+    separator_tokens = count_tokens(SEPARATOR)
+    windows: List[List[tuple[int, str, int]]] = []
+    free: List[int] = []
+    for piece in sorted(pieces, key=lambda p: -p[2]):
+        for i, space in enumerate(free):
+            if piece[2] + separator_tokens <= space:
+                windows[i].append(piece)
+                free[i] -= piece[2] + separator_tokens
+                break
+        else:
+            windows.append([piece])
+            free.append(budget - piece[2])
+
+    packed: List[str] = []
+    pending = [sorted(window) for window in windows]
+    while pending:
+        window = pending.pop(0)
+        text = SEPARATOR.join(p[1] for p in window)
+        if len(window) > 1 and count_tokens(text) > budget:
+            pending.insert(0, window[:-1])
+            pending.insert(1, window[-1:])
+            continue
+        packed.append(text)
+    return packed
+
+
+class PackedTreeSummarize(TreeSummarize):
+    """
+    TreeSummarize that deduplicates and packs the text chunks before summarizing them, see the module docstring. Takes the arguments of TreeSummarize, plus:
+
+    Args:
+    - dedupe_threshold: The Jaccard similarity from which a chunk counts as a duplicate of an earlier one, None to keep every chunk.
+    """
+
+    def __init__(self, *args, dedupe_threshold: Optional[float] = 0.9, **kwargs):
+        kwargs.setdefault("summary_template", SUMMARY_TEMPLATE)
+        super().__init__(*args, **kwargs)
+        self._dedupe_threshold = dedupe_threshold
+        self._count_tokens = lambda text: len(get_tokenizer()(text))
+
+    def _budget(self, summary_template: BasePromptTemplate) -> int:
+        """The tokens of context that fit in one call, leaving room for the format instructions of the structured output."""
+        budget = self._prompt_helper.get_text_splitter_given_prompt(
+            summary_template, llm=self._llm
+        ).chunk_size
+        if self._output_cls is not None:
+            schema = self._output_cls.model_json_schema()  # type: ignore
+            budget -= self._count_tokens(json.dumps(schema))
+        return budget
+
+    def _pack(
+        self, summary_template: BasePromptTemplate, text_chunks: Sequence[str]
+    ) -> List[str]:
+        if self._dedupe_threshold is not None:
+            unique = drop_near_duplicates(text_chunks, self._dedupe_threshold)
+            if len(unique) < len(text_chunks):
+                metrics.increment("duplicate_chunks", len(text_chunks) - len(unique))
+            text_chunks = unique
+        budget = self._budget(summary_template)
+        splitter = TokenTextSplitter(
+            chunk_size=budget, chunk_overlap=0, tokenizer=get_tokenizer()
+        )
+        windows = pack_chunks(
+            text_chunks, budget, self._count_tokens, splitter.split_text
+        )
+        if self._verbose:
+            logger.info("%d text chunks after packing", len(windows))
+        metrics.increment("llm_calls", len(windows))
+        metrics.increment(
+            "llm_context_tokens", sum(self._count_tokens(w) for w in windows)
+        )
+        return windows
+
+    def get_response(
+        self,
+        query_str: str,
+        text_chunks: Sequence[str],
+        **response_kwargs: Any,
+    ) -> RESPONSE_TEXT_TYPE:
+        if self._streaming:
+            return super().get_response(query_str, text_chunks, **response_kwargs)
+        summary_template = self._summary_template.partial_format(query_str=query_str)
+        windows = self._pack(summary_template, text_chunks)
+        while len(windows) > 1:
+            summaries = [
+                self._llm.predict(summary_template, context_str=w, **response_kwargs)
+                for w in windows
+            ]
+            windows = self._pack(summary_template, summaries)
+
+        context_str = windows[0] if windows else ""
+        if self._output_cls is None:
+            return self._llm.predict(
+                summary_template, context_str=context_str, **response_kwargs
+            )
+        return self._llm.structured_predict(
+            self._output_cls,  # type: ignore
+            summary_template,
+            context_str=context_str,
+            **response_kwargs,
+        )
+
+    async def aget_response(
+        self,
+        query_str: str,
+        text_chunks: Sequence[str],
+        llm_limiter: AsyncLimiter | None = None,
+        **response_kwargs: Any,
+    ) -> RESPONSE_TEXT_TYPE:
+        """`get_response` with the leaf summaries of each level of the tree run concurrently. Every LLM call first waits on `llm_limiter`."""
+        if self._streaming:
+            return await super().aget_response(
+                query_str, text_chunks, **response_kwargs
+            )
+        summary_template = self._summary_template.partial_format(query_str=query_str)
+
+        async def call(predict, *args, **kwargs):
+            if llm_limiter is None:
+                return await predict(*args, **kwargs)
+            async with metrics.limiter_wait(llm_limiter, "llm"):
+                return await predict(*args, **kwargs)
+
+        windows = self._pack(summary_template, text_chunks)
+        while len(windows) > 1:
+            summaries = await asyncio.gather(
+                *[
+                    call(
+                        self._llm.apredict,
+                        summary_template,
+                        context_str=w,
+                        **response_kwargs,
+                    )
+                    for w in windows
+                ]
+            )
+            windows = self._pack(summary_template, summaries)
+
+        context_str = windows[0] if windows else ""
+        if self._output_cls is None:
+            return await call(
+                self._llm.apredict,
+                summary_template,
+                context_str=context_str,
+                **response_kwargs,
+            )
+        return await call(
+            self._llm.astructured_predict,
+            self._output_cls,
+            summary_template,
+            context_str=context_str,
+            **response_kwargs,
+        )
+
+
+__all__ = [
+    "PackedTreeSummarize",
+    "SUMMARY_TEMPLATE",
+    "drop_near_duplicates",
+    "pack_chunks",
+    "template_texts",
+]
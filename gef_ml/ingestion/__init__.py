@@ -1,3 +1,14 @@
-from .streaming_ingestion import StreamingIngestion
+from typing import TYPE_CHECKING
 
-__all__ = ["StreamingIngestion"]
+from gef_ml.utils.lazy import lazy_attributes
+
+if TYPE_CHECKING:
+    from .pipeline import ChunkingConfig
+    from .streaming_ingestion import StreamingIngestion
+
+__getattr__, __dir__ = lazy_attributes(
+    __name__,
+    {"StreamingIngestion": ".streaming_ingestion", "ChunkingConfig": ".pipeline"},
+)
+
+__all__ = ["StreamingIngestion", "ChunkingConfig"]
@@ -0,0 +1,98 @@
+"""This module contains the AdaptiveBatcher class, which packs nodes into embedding requests up to a token budget instead of a fixed number of nodes per request. The budget grows while requests come back quickly and shrinks when the API is slow or rejects a request as too large (413) or rate limited (429)."""
+
+import logging
+from typing import Iterator, Sequence
+
+from llama_index.core.schema import BaseNode, MetadataMode
+
+logger = logging.getLogger(__name__)
+
+# Context window of the Together embedding models, in tokens
+MODEL_CONTEXT_TOKENS = {
+    "togethercomputer/m2-bert-80M-2k-retrieval": 2048,
+    "togethercomputer/m2-bert-80M-8k-retrieval": 8192,
+    "togethercomputer/m2-bert-80M-32k-retrieval": 32768,
+}
+DEFAULT_CONTEXT_TOKENS = 2048
+
+# Rough characters-per-token ratio for English text, good enough for sizing requests
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+class AdaptiveBatcher:
+    """
+    Packs nodes into request batches up to a token budget that adapts to the observed API behaviour.
+
+    The budget starts at `initial_multiple` times the model's context window and stays between one and `max_multiple` context windows. Requests faster than `target_latency` seconds grow the budget, requests slower than twice the target and 413/429 responses shrink it.
+    """
+
+    def __init__(
+        self,
+        model: str,
+        initial_multiple: float = 4,
+        max_multiple: float = 16,
+        max_batch_size: int = 128,
+        target_latency: float = 2.0,
+    ):
+        context_tokens = MODEL_CONTEXT_TOKENS.get(model, DEFAULT_CONTEXT_TOKENS)
+        self.model = model
+        self.min_budget = context_tokens
+        self.max_budget = int(context_tokens * max_multiple)
+        self.budget = int(context_tokens * initial_multiple)
+        self.max_batch_size = max_batch_size
+        self.target_latency = target_latency
+
+    def _set_budget(self, budget: float):
+        self.budget = int(min(self.max_budget, max(self.min_budget, budget)))
+
+    def record_success(self, latency: float):
+        if latency < self.target_latency:
+            self._set_budget(self.budget * 1.25)
+        elif latency > 2 * self.target_latency:
+            self._set_budget(self.budget * 0.8)
+
+    def record_rejection(self, status: int, batch_tokens: int):
+        previous = self.budget
+        if status == 413:
+            # Never grow back to the size the API has just rejected. Concurrent rejections of similar batches all land on the same budget instead of compounding.
+            self.max_budget = max(
+                self.min_budget, min(self.max_budget, int(batch_tokens * 0.9))
+            )
+            self._set_budget(min(self.budget, batch_tokens // 2))
+        elif status == 429:
+            self._set_budget(self.budget * 0.75)
+        logger.debug(
+            "Embedding request rejected with status %d, token budget %d -> %d",
+            status,
+            previous,
+            self.budget,
+        )
+
+    def batches(
+        self, nodes: Sequence[BaseNode], max_batch_size: int | None = None
+    ) -> Iterator[list[BaseNode]]:
+        """
+        Yields batches of nodes. The budget is read again for every batch, so adjustments made while earlier batches are in flight apply to the remaining ones.
+        """
+        max_batch_size = min(max_batch_size or self.max_batch_size, self.max_batch_size)
+        batch: list[BaseNode] = []
+        batch_tokens = 0
+        for node in nodes:
+            tokens = estimate_tokens(node.get_content(metadata_mode=MetadataMode.EMBED))
+            if batch and (
+                batch_tokens + tokens > self.budget or len(batch) >= max_batch_size
+            ):
+                yield batch
+                batch = []
+                batch_tokens = 0
+            batch.append(node)
+            batch_tokens += tokens
+        if batch:
+            yield batch
+
+
+__all__ = ["AdaptiveBatcher", "estimate_tokens"]
@@ -0,0 +1,160 @@
+"""This module contains the EmbeddingCache class, an on-disk cache of embeddings keyed by the model name and a hash of the embedded content. Re-ingesting the same chunks, e.g. after a crash or with the same chunking settings, reads the vectors from the cache instead of paying for another request to the Together API."""
+
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from array import array
+
+logger = logging.getLogger(__name__)
+
+
+def content_hash(text: str) -> str:
+    """Returns the hex SHA-256 digest of the given text."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    SQLite backed embedding cache with LRU eviction.
+
+    Vectors are stored as packed float32 blobs. The access times of hit entries are refreshed in batches of `access_flush_size`, with the next write or on close, so lookups never take the write lock. Once the cache grows past `max_entries` the least recently used entries are evicted.
+    """
+
+    def __init__(
+        self, path: str, max_entries: int = 2_000_000, access_flush_size: int = 10_000
+    ):
+        self.path = path
+        self.max_entries = max_entries
+        self.access_flush_size = access_flush_size
+        self.hits = 0
+        self.misses = 0
+        # (model, content hash) of the hits whose access time isn't written yet, with the time of their last hit
+        self._accessed: dict[tuple[str, str], float] = {}
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        # The timeout covers other processes holding the write lock
+        self._conn = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                content_hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                last_access REAL NOT NULL,
+                PRIMARY KEY (model, content_hash)
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_embeddings_last_access ON embeddings (last_access)"
+        )
+        self._conn.commit()
+        (self._count,) = self._conn.execute(
+            "SELECT COUNT(*) FROM embeddings"
+        ).fetchone()
+        logger.info("Opened embedding cache %s with %d entries", path, self._count)
+
+    def __len__(self) -> int:
+        return self._count
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def get_many(self, model: str, hashes: list[str]) -> dict[str, list[float]]:
+        """
+        Looks up the embeddings for the given content hashes, returning only the ones that are cached.
+        """
+        found: dict[str, list[float]] = {}
+        unique_hashes = list(dict.fromkeys(hashes))
+
+        with self._lock:
+            # Stay below SQLite's limit on the number of bound parameters
+            for i in range(0, len(unique_hashes), 500):
+                batch = unique_hashes[i : i + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT content_hash, vector FROM embeddings WHERE model = ? AND content_hash IN ({placeholders})",
+                    [model, *batch],
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = array("f", blob).tolist()
+
+            now = time.time()
+            for key in found:
+                self._accessed[(model, key)] = now
+            if len(self._accessed) >= self.access_flush_size:
+                self._write_accessed()
+                self._conn.commit()
+
+        hits = sum(1 for h in hashes if h in found)
+        self.hits += hits
+        self.misses += len(hashes) - hits
+        return found
+
+    def _write_accessed(self):
+        """Writes the pending access times, the caller holds the lock and commits."""
+        if self._accessed:
+            self._conn.executemany(
+                "UPDATE embeddings SET last_access = ? WHERE model = ? AND content_hash = ?",
+                [(now, model, key) for (model, key), now in self._accessed.items()],
+            )
+            self._accessed.clear()
+
+    def put_many(self, model: str, items: list[tuple[str, list[float]]]):
+        """
+        Stores the given (content hash, embedding) pairs and evicts the least recently used entries if the cache is over its size limit.
+        """
+        if not items:
+            return
+
+        now = time.time()
+        rows = [
+            (model, key, array("f", vector).tobytes(), now) for key, vector in items
+        ]
+
+        with self._lock:
+            # Written first, so the eviction below sees the latest hits
+            self._write_accessed()
+            cursor = self._conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (model, content_hash, vector, last_access) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            self._count += cursor.rowcount
+
+            if self._count > self.max_entries:
+                excess = self._count - self.max_entries
+                self._conn.execute(
+                    "DELETE FROM embeddings WHERE rowid IN (SELECT rowid FROM embeddings ORDER BY last_access LIMIT ?)",
+                    (excess,),
+                )
+                self._count -= excess
+                logger.debug("Evicted %d entries from the embedding cache", excess)
+
+            self._conn.commit()
+
+    def stats(self) -> dict[str, float]:
+        return {
+            "entries": self._count,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hit_rate,
+        }
+
+    def close(self):
+        with self._lock:
+            self._write_accessed()
+            self._conn.commit()
+            self._conn.close()
+
+
+__all__ = ["EmbeddingCache", "content_hash"]
@@ -3,35 +3,117 @@
 import asyncio
 import logging
 import os
-from typing import List
+import time
+from typing import AsyncIterable, AsyncIterator, Iterable, List
 
 import aiohttp
 import backoff
 from aiolimiter import AsyncLimiter
 from llama_index.core.schema import Document, MetadataMode
 from tqdm import tqdm
-from tqdm.asyncio import tqdm_asyncio
 
-from gef_ml.utils.log_config import setup_logging
+from gef_ml.ingestion.batching import AdaptiveBatcher, estimate_tokens
+from gef_ml.ingestion.embedding_cache import EmbeddingCache, content_hash
+from gef_ml.utils.metrics import metrics
 
-setup_logging()
 logger = logging.getLogger(__name__)
 
 
+class EmbeddingRequestError(Exception):
+    """Raised when the embedding endpoint responds with a non-200 status."""
+
+    def __init__(self, message: str, status: int):
+        super().__init__(message)
+        self.status = status
+
+
+def _is_request_too_large(e: Exception) -> bool:
+    # Retrying the same payload after a 413 can't succeed, the batch has to be split instead
+    return isinstance(e, EmbeddingRequestError) and e.status == 413
+
+
 class EmbeddingService:
     def __init__(
         self,
         api_key: str | None = None,
         embed_endpoint_url: str = "https://api.together.xyz/v1/embeddings",
+        cache: EmbeddingCache | None = None,
+        connector_limit: int = 100,
+        dns_cache_ttl: int = 300,
+        keepalive_timeout: float = 60,
+        request_timeout: float = 5 * 60,
     ):
         self.api_key = api_key if api_key else os.getenv("TOGETHER_API_KEY")
         self.embed_endpoint_url = embed_endpoint_url
+        self.cache = cache
+
+        # A single long-lived session is shared by every call, so TCP/TLS setup happens once per run
+        self.connector_limit = connector_limit
+        self.dns_cache_ttl = dns_cache_ttl
+        self.keepalive_timeout = keepalive_timeout
+        self.request_timeout = request_timeout
+        self._session: aiohttp.ClientSession | None = None
+        self._session_loop: asyncio.AbstractEventLoop | None = None
+
+        # Used to estimate how much API time the cache saved
+        self.api_seconds = 0.0
+        self.api_nodes_embedded = 0
+
+        self._batchers: dict[str, AdaptiveBatcher] = {}
 
         if api_key is None and self.api_key is None:
             raise ValueError("TOGETHER_API_KEY environment variable must be set")
 
-    @backoff.on_exception(backoff.expo, Exception, max_tries=3)
-    @backoff.on_predicate(backoff.expo, lambda x: x is None, max_tries=3)
+    async def _get_session(self) -> aiohttp.ClientSession:
+        loop = asyncio.get_running_loop()
+        if (
+            self._session is None
+            or self._session.closed
+            or self._session_loop is not loop
+        ):
+            connector = aiohttp.TCPConnector(
+                limit=self.connector_limit,
+                ttl_dns_cache=self.dns_cache_ttl,
+                keepalive_timeout=self.keepalive_timeout,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.request_timeout),
+            )
+            self._session_loop = loop
+        return self._session
+
+    async def aclose(self):
+        """Closes the shared HTTP session. A new one is opened on the next request."""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def __aenter__(self) -> "EmbeddingService":
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    def get_batcher(self, model: str) -> AdaptiveBatcher:
+        """Returns the batcher for a model, which keeps its learned token budget across calls."""
+        if model not in self._batchers:
+            self._batchers[model] = AdaptiveBatcher(model)
+        return self._batchers[model]
+
+    @backoff.on_exception(
+        backoff.expo,
+        Exception,
+        max_tries=3,
+        giveup=_is_request_too_large,
+        on_backoff=metrics.backoff_handler("embedding_request"),
+    )
+    @backoff.on_predicate(
+        backoff.expo,
+        lambda x: x is None,
+        max_tries=3,
+        on_backoff=metrics.backoff_handler("embedding_request"),
+    )
     async def _fetch_embeddings_with_retry(
         self,
         session: aiohttp.ClientSession,
@@ -51,11 +133,18 @@ class EmbeddingService:
             "Content-type": "application/json",
         }
 
+        metrics.increment("embedding_requests")
+        start = time.perf_counter()
         async with session.post(
             self.embed_endpoint_url, json=payload, headers=headers
         ) as response:
             if response.status == 200:
                 raw = await response.json()
+                latency = time.perf_counter() - start
+                metrics.observe("embedding_request", latency)
+                self.api_seconds += latency
+                self.api_nodes_embedded += len(nodes)
+                self.get_batcher(model).record_success(latency)
 
                 data = raw.get("data")
 
@@ -67,43 +156,180 @@ class EmbeddingService:
                 return nodes
 
             else:
-                raise Exception(
-                    f"Failed to generate embedding for node. HTTP Status: {response.status}. Reason: {response.reason}. Response: {await response.text()}\n\n Request: {payload}"
+                metrics.increment("embedding_request_errors", status=response.status)
+                if response.status in (413, 429):
+                    self.get_batcher(model).record_rejection(
+                        response.status, sum(estimate_tokens(i) for i in req_input)
+                    )
+                raise EmbeddingRequestError(
+                    f"Failed to generate embedding for node. HTTP Status: {response.status}. Reason: {response.reason}. Response: {await response.text()}\n\n Request: {payload}",
+                    status=response.status,
                 )
 
-    async def generate_embeddings(
+    async def _embed_batch(
+        self, session: aiohttp.ClientSession, nodes: list[Document], model: str
+    ) -> list[Document]:
+        """Embeds a batch of nodes, splitting it in half whenever the API rejects it as too large."""
+        try:
+            return await self._fetch_embeddings_with_retry(session, nodes, model)
+        except EmbeddingRequestError as e:
+            if e.status != 413 or len(nodes) == 1:
+                raise
+            logger.warning(
+                "Embedding request of %d nodes was too large, splitting it", len(nodes)
+            )
+            mid = len(nodes) // 2
+            first = await self._embed_batch(session, nodes[:mid], model)
+            second = await self._embed_batch(session, nodes[mid:], model)
+            return first + second
+
+    @property
+    def estimated_seconds_saved(self) -> float:
+        """Estimates the API time saved by the cache from the average per-node request latency."""
+        if self.cache is None or self.api_nodes_embedded == 0:
+            return 0.0
+        return self.cache.hits * self.api_seconds / self.api_nodes_embedded
+
+    def _apply_cached_embeddings(
+        self, nodes: List[Document], model: str
+    ) -> tuple[List[Document], dict[int, str]]:
+        """
+        Sets the embeddings of the nodes found in the cache, returning the nodes that still need to be embedded along with the content hash of every node.
+
+        Hashes are keyed by the identity of the node object rather than its ID: nodes of different chunking configs can share an ID while having different content.
+        """
+        hashes = {
+            id(n): content_hash(n.get_content(metadata_mode=MetadataMode.EMBED))
+            for n in nodes
+        }
+        if self.cache is None:
+            return nodes, hashes
+
+        cached = self.cache.get_many(model, list(hashes.values()))
+        missing = []
+        for n in nodes:
+            embedding = cached.get(hashes[id(n)])
+            if embedding is None:
+                missing.append(n)
+            else:
+                n.embedding = embedding
+
+        return missing, hashes
+
+    def _log_cache_stats(self):
+        if self.cache is not None:
+            logger.info(
+                "Embedding cache: %d hits, %d misses so far, ~%.1fs of API time saved",
+                self.cache.hits,
+                self.cache.misses,
+                self.estimated_seconds_saved,
+            )
+
+    async def embed_stream(
         self,
-        nodes: List[Document],
+        nodes: AsyncIterable[Document] | Iterable[Document],
         model: str = "togethercomputer/m2-bert-80M-2k-retrieval",
         max_requests_per_second: int = 75,
-        max_chunk_size: int = 10,
-    ) -> List[Document]:
-        timeout = aiohttp.ClientTimeout(total=60 * 60)  # 1 hour
-        async with aiohttp.ClientSession(timeout=timeout) as session:
-            limiter = AsyncLimiter(max_rate=max_requests_per_second, time_period=1)
+        max_chunk_size: int | None = None,
+        max_in_flight: int = 16,
+        lookup_size: int = 256,
+    ) -> AsyncIterator[List[Document]]:
+        """
+        Embeds a stream of nodes, yielding batches of embedded nodes as they finish (not in input order).
 
-            tasks = []
+        Nodes are consumed `lookup_size` at a time: the cached ones are yielded right away and the rest are packed into requests by the model's batcher. At most `max_in_flight` requests are outstanding, so memory stays flat however many nodes the input produces. Nodes without content are skipped.
+        """
+        session = await self._get_session()
+        limiter = AsyncLimiter(max_rate=max_requests_per_second, time_period=1)
+        batcher = self.get_batcher(model)
+        pending: set[asyncio.Task] = set()
 
-            chunks = [
-                nodes[i : i + max_chunk_size]
-                for i in range(0, len(nodes), max_chunk_size)
-            ]
+        async def embed(batch: List[Document], hashes: dict[int, str]):
+            await self._embed_batch(session, batch, model)
+            if self.cache is not None:
+                self.cache.put_many(
+                    model, [(hashes[id(n)], n.embedding) for n in batch]  # type: ignore
+                )
+            return batch
 
-            for node_chunk in tqdm(chunks, desc="Creating embedding requests"):
-                valid_chunk = [
+        try:
+            async for group in _agroup(nodes, lookup_size):
+                group = [
                     n
-                    for n in node_chunk
+                    for n in group
                     if len(n.get_content(metadata_mode=MetadataMode.EMBED)) > 0
                 ]
-                async with limiter:
-                    task = asyncio.create_task(
-                        self._fetch_embeddings_with_retry(session, valid_chunk, model)
-                    )
-                    tasks.append(task)
+                missing, hashes = self._apply_cached_embeddings(group, model)
+                if len(missing) < len(group):
+                    metrics.increment("embedding_cache_hits", len(group) - len(missing))
+                    missing_ids = {id(n) for n in missing}
+                    yield [n for n in group if id(n) not in missing_ids]
+
+                for batch in batcher.batches(missing, max_batch_size=max_chunk_size):
+                    while len(pending) >= max_in_flight:
+                        done, pending = await asyncio.wait(
+                            pending, return_when=asyncio.FIRST_COMPLETED
+                        )
+                        for task in done:
+                            yield task.result()
+                    async with metrics.limiter_wait(limiter, "embedding"):
+                        pending.add(asyncio.create_task(embed(batch, hashes)))
+
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    yield task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+            self._log_cache_stats()
+
+    async def generate_embeddings(
+        self,
+        nodes: List[Document],
+        model: str = "togethercomputer/m2-bert-80M-2k-retrieval",
+        max_requests_per_second: int = 75,
+        max_chunk_size: int | None = None,
+    ) -> List[Document]:
+        """
+        Generates embeddings for the given nodes, skipping the ones in the cache.
+
+        Nodes are packed into requests up to the adaptive token budget of the model's batcher. `max_chunk_size` optionally caps the number of nodes per request on top of the budget. Returns the nodes that have content, in input order.
+        """
+        valid_nodes = [
+            n for n in nodes if len(n.get_content(metadata_mode=MetadataMode.EMBED)) > 0
+        ]
+
+        with tqdm(total=len(valid_nodes), desc="Generating embeddings") as progress:
+            async for batch in self.embed_stream(
+                valid_nodes,
+                model=model,
+                max_requests_per_second=max_requests_per_second,
+                max_chunk_size=max_chunk_size,
+            ):
+                progress.update(len(batch))
+
+        return valid_nodes
 
-            embeddings = await tqdm_asyncio.gather(*tasks, desc="Gathering embeddings")
-            flattened_embeddings = [
-                item for sublist in embeddings for item in sublist
-            ]  # Flatten the list of lists
 
-            return flattened_embeddings
+async def _agroup(
+    items: AsyncIterable[Document] | Iterable[Document], size: int
+) -> AsyncIterator[List[Document]]:
+    """Groups a sync or async iterable into lists of at most `size` items."""
+    group: List[Document] = []
+    if isinstance(items, AsyncIterable):
+        async for item in items:
+            group.append(item)
+            if len(group) >= size:
+                yield group
+                group = []
+    else:
+        for item in items:
+            group.append(item)
+            if len(group) >= size:
+                yield group
+                group = []
+    if group:
+        yield group
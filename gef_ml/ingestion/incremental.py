@@ -0,0 +1,97 @@
+"""This module compares freshly chunked project nodes with the points already stored in Qdrant, so that updating a collection after a document refresh only embeds and upserts the chunks that changed and deletes the ones that no longer exist. Chunks are matched by their deterministic node ID and compared by the content hash the ingestion pipeline stores in their metadata."""
+
+import logging
+from typing import List, NamedTuple
+
+from llama_index.core.schema import BaseNode
+from qdrant_client import QdrantClient
+from qdrant_client.http import models as qdrant_models
+
+from gef_ml.ingestion.pipeline import CHUNK_HASH_KEY
+
+logger = logging.getLogger(__name__)
+
+
+class ProjectUpdate(NamedTuple):
+    changed: List[BaseNode]
+    stale_ids: List[str]
+    unchanged: int
+
+
+def _project_filter(project_id: str) -> qdrant_models.Filter:
+    return qdrant_models.Filter(
+        must=[
+            qdrant_models.FieldCondition(
+                key="project_id", match=qdrant_models.MatchValue(value=project_id)
+            )
+        ]
+    )
+
+
+def stored_chunk_hashes(
+    client: QdrantClient, collection_name: str, project_id: str, batch_size: int = 1024
+) -> dict[str, str | None]:
+    """Returns the chunk hash of every point stored for a project, by point ID. Points ingested before chunks were hashed map to None."""
+    if not client.collection_exists(collection_name):
+        return {}
+
+    hashes: dict[str, str | None] = {}
+    offset = None
+    while True:
+        records, offset = client.scroll(
+            collection_name=collection_name,
+            scroll_filter=_project_filter(project_id),
+            limit=batch_size,
+            offset=offset,
+            with_payload=[CHUNK_HASH_KEY],
+            with_vectors=False,
+        )
+        for record in records:
+            hashes[str(record.id)] = (record.payload or {}).get(CHUNK_HASH_KEY)
+        if offset is None:
+            return hashes
+
+
+def plan_project_update(
+    nodes: List[BaseNode], stored: dict[str, str | None]
+) -> ProjectUpdate:
+    """Splits a project's nodes into the ones that are new or changed and the stored point IDs that no longer have a node."""
+    changed = [
+        n for n in nodes if stored.get(n.node_id) != n.metadata.get(CHUNK_HASH_KEY)
+    ]
+    node_ids = {n.node_id for n in nodes}
+    stale_ids = [point_id for point_id in stored if point_id not in node_ids]
+    return ProjectUpdate(changed, stale_ids, len(nodes) - len(changed))
+
+
+def diff_project(
+    client: QdrantClient, collection_name: str, project_id: str, nodes: List[BaseNode]
+) -> ProjectUpdate:
+    update = plan_project_update(
+        nodes, stored_chunk_hashes(client, collection_name, project_id)
+    )
+    logger.info(
+        "Project %s: %d new or changed chunks, %d unchanged, %d stale",
+        project_id,
+        len(update.changed),
+        update.unchanged,
+        len(update.stale_ids),
+    )
+    return update
+
+
+def delete_points(client: QdrantClient, collection_name: str, point_ids: List[str]):
+    if point_ids:
+        client.delete(
+            collection_name=collection_name,
+            points_selector=qdrant_models.PointIdsList(points=point_ids),  # type: ignore
+        )
+
+
+__all__ = [
+    "ProjectUpdate",
+    "stored_chunk_hashes",
+    "plan_project_update",
+    "diff_project",
+    "delete_points",
+]
@@ -0,0 +1,198 @@
+"""This module contains the IngestionManifest class, which records the state of every project that has been ingested. It stores a fingerprint of each project's files along with the chunk count and status of the last run, so a restarted ingestion can skip projects that are done and unchanged and only retry the failed or modified ones."""
+
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import NamedTuple
+
+logger = logging.getLogger(__name__)
+
+STATUS_IN_PROGRESS = "in_progress"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+
+class FileFingerprint(NamedTuple):
+    filename: str
+    size: int
+    mtime: float
+    sha256: str
+
+
+def file_sha256(path: str, block_size: int = 1 << 20) -> str:
+    """Returns the hex SHA-256 digest of the file at the given path."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while block := f.read(block_size):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def project_fingerprint(files: list[FileFingerprint]) -> str:
+    """Combines the file fingerprints of a project into a single digest."""
+    digest = hashlib.sha256()
+    for f in sorted(files):
+        digest.update(f"{f.filename}\0{f.sha256}\n".encode("utf-8"))
+    return digest.hexdigest()
+
+
+class IngestionManifest:
+    """
+    SQLite backed record of the ingestion state of each project.
+
+    File content hashes are only recomputed when a file's size or mtime changed since it was last fingerprinted, so checking an unchanged corpus only costs a `stat` per file.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS projects (
+                project_id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                fingerprint TEXT NOT NULL,
+                num_files INTEGER NOT NULL,
+                num_chunks INTEGER,
+                error TEXT,
+                updated_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS files (
+                project_id TEXT NOT NULL,
+                filename TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime REAL NOT NULL,
+                sha256 TEXT NOT NULL,
+                PRIMARY KEY (project_id, filename)
+            );
+            """
+        )
+        self._conn.commit()
+
+    def _stored_files(self, project_id: str) -> dict[str, FileFingerprint]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT filename, size, mtime, sha256 FROM files WHERE project_id = ?",
+                (project_id,),
+            ).fetchall()
+        return {row[0]: FileFingerprint(*row) for row in rows}
+
+    def fingerprint_project(
+        self, project_id: str, project_dir: str
+    ) -> list[FileFingerprint]:
+        """
+        Fingerprints every file in a project directory, reusing the stored content hash of files whose size and mtime are unchanged.
+
+        Hidden files are skipped like `SimpleDirectoryReader` skips them, so bookkeeping such as the downloader's state file doesn't make a project look modified.
+        """
+        stored = self._stored_files(project_id)
+        fingerprints = []
+        for entry in sorted(os.scandir(project_dir), key=lambda e: e.name):
+            if not entry.is_file() or entry.name.startswith("."):
+                continue
+            stat = entry.stat()
+            previous = stored.get(entry.name)
+            if (
+                previous is not None
+                and previous.size == stat.st_size
+                and previous.mtime == stat.st_mtime
+            ):
+                fingerprints.append(previous)
+            else:
+                fingerprints.append(
+                    FileFingerprint(
+                        entry.name, stat.st_size, stat.st_mtime, file_sha256(entry.path)
+                    )
+                )
+        return fingerprints
+
+    def status(self, project_id: str) -> str | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT status FROM projects WHERE project_id = ?", (project_id,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def needs_ingestion(self, project_id: str, files: list[FileFingerprint]) -> bool:
+        """Returns False only if the project was ingested successfully from exactly these files."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT status, fingerprint FROM projects WHERE project_id = ?",
+                (project_id,),
+            ).fetchone()
+        if row is None:
+            return True
+        status, fingerprint = row
+        return status != STATUS_DONE or fingerprint != project_fingerprint(files)
+
+    def mark_started(self, project_id: str, files: list[FileFingerprint]):
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT INTO projects (project_id, status, fingerprint, num_files, num_chunks, error, updated_at)
+                VALUES (?, ?, ?, ?, NULL, NULL, ?)
+                ON CONFLICT (project_id) DO UPDATE SET
+                    status = excluded.status,
+                    fingerprint = excluded.fingerprint,
+                    num_files = excluded.num_files,
+                    num_chunks = NULL,
+                    error = NULL,
+                    updated_at = excluded.updated_at
+                """,
+                (
+                    project_id,
+                    STATUS_IN_PROGRESS,
+                    project_fingerprint(files),
+                    len(files),
+                    time.time(),
+                ),
+            )
+            self._conn.execute("DELETE FROM files WHERE project_id = ?", (project_id,))
+            self._conn.executemany(
+                "INSERT INTO files (project_id, filename, size, mtime, sha256) VALUES (?, ?, ?, ?, ?)",
+                [(project_id, *f) for f in files],
+            )
+            self._conn.commit()
+
+    def mark_done(self, project_id: str, num_chunks: int):
+        self._set_status(project_id, STATUS_DONE, num_chunks=num_chunks)
+
+    def mark_failed(self, project_id: str, error: str):
+        self._set_status(project_id, STATUS_FAILED, error=error)
+
+    def _set_status(
+        self,
+        project_id: str,
+        status: str,
+        num_chunks: int | None = None,
+        error: str | None = None,
+    ):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE projects SET status = ?, num_chunks = ?, error = ?, updated_at = ? WHERE project_id = ?",
+                (status, num_chunks, error, time.time(), project_id),
+            )
+            self._conn.commit()
+
+    def summary(self) -> dict[str, int]:
+        """Returns the number of projects in each status."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT status, COUNT(*) FROM projects GROUP BY status"
+            ).fetchall()
+        return dict(rows)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+__all__ = ["IngestionManifest", "FileFingerprint", "file_sha256"]
@@ -0,0 +1,144 @@
+"""This module contains the document parsing stage of ingestion and the ParsedTextCache. Extracting the text of PDF and DOCX files is the most CPU heavy part of ingestion and doesn't depend on the chunking settings, so the extracted documents are stored keyed by the SHA-256 of the file content and re-chunking runs only parse new or modified files."""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from concurrent.futures import Executor
+from typing import List
+
+import llama_index.core
+from llama_index.core import SimpleDirectoryReader
+from llama_index.core.schema import Document
+
+from gef_ml.ingestion.manifest import file_sha256
+from gef_ml.utils import file_metadata
+
+logger = logging.getLogger(__name__)
+
+# Cached documents are only reused when they were extracted by the same reader version
+PARSER_VERSION = llama_index.core.__version__
+
+
+class ParsedTextCache:
+    """
+    SQLite backed store of the documents extracted from each file, as zlib compressed JSON.
+
+    Entries are keyed by the file's content hash, so the filename-derived metadata is refreshed when an entry is loaded for a renamed copy of a file.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        # Parse worker processes of the pipelined ingestion write to the same file
+        self._conn = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS parsed (
+                sha256 TEXT NOT NULL,
+                parser TEXT NOT NULL,
+                documents BLOB NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (sha256, parser)
+            )
+            """
+        )
+        self._conn.commit()
+
+    def get(self, sha256: str, path: str) -> List[Document] | None:
+        """Returns the cached documents of a file, with their metadata updated for the file at `path`."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT documents FROM parsed WHERE sha256 = ? AND parser = ?",
+                (sha256, PARSER_VERSION),
+            ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+
+        metadata = file_metadata(path)
+        documents = []
+        for data in json.loads(zlib.decompress(row[0])):
+            document = Document.from_dict(data)
+            document.metadata.update(metadata)
+            if "file_name" in document.metadata:
+                document.metadata["file_name"] = os.path.basename(path)
+            documents.append(document)
+        return documents
+
+    def put(self, sha256: str, documents: List[Document]):
+        data = zlib.compress(json.dumps([d.to_dict() for d in documents]).encode())
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO parsed (sha256, parser, documents, created_at) VALUES (?, ?, ?, ?)",
+                (sha256, PARSER_VERSION, data, time.time()),
+            )
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def list_project_files(project_dir: str) -> List[str]:
+    """Lists the files of a project directory the same way SimpleDirectoryReader does."""
+    reader = SimpleDirectoryReader(project_dir, file_metadata=file_metadata)
+    return [str(f) for f in reader.input_files]
+
+
+def parse_file(path: str) -> List[Document]:
+    """Extracts the documents of a single file. Runs in the parse worker processes, so it only takes a path."""
+    reader = SimpleDirectoryReader(input_files=[path], file_metadata=file_metadata)
+    return reader.load_data()
+
+
+def load_documents(
+    project_dir: str,
+    cache: ParsedTextCache | None = None,
+    executor: Executor | None = None,
+) -> List[Document]:
+    """
+    Loads the documents of every file in a project directory, in the order SimpleDirectoryReader returns them.
+
+    Files found in the cache are not parsed again. The others are parsed on `executor` when given, one file per task so a project's files are spread across all workers, or in the calling process otherwise.
+    """
+    paths = list_project_files(project_dir)
+    documents: dict[str, List[Document]] = {}
+    hashes: dict[str, str] = {}
+
+    if cache is not None:
+        for path in paths:
+            hashes[path] = file_sha256(path)
+            cached = cache.get(hashes[path], path)
+            if cached is not None:
+                documents[path] = cached
+
+    missing = [p for p in paths if p not in documents]
+    if missing:
+        logger.info(
+            "Parsing %d of %d files in %s", len(missing), len(paths), project_dir
+        )
+        parsed = (
+            executor.map(parse_file, missing)
+            if executor is not None
+            else map(parse_file, missing)
+        )
+        for path, file_documents in zip(missing, parsed):
+            documents[path] = file_documents
+            if cache is not None:
+                cache.put(hashes[path], file_documents)
+
+    return [d for path in paths for d in documents[path]]
+
+
+__all__ = ["ParsedTextCache", "load_documents", "parse_file", "list_project_files"]
@@ -1,13 +1,84 @@
+import functools
+import hashlib
 import logging
+import uuid
+from collections import defaultdict
+from dataclasses import dataclass
 
 from llama_index.core.ingestion import IngestionPipeline
-from llama_index.core.node_parser import SentenceSplitter
+from llama_index.core.schema import BaseNode, Document, MetadataMode, TransformComponent
 from llama_index.core.vector_stores.types import BasePydanticVectorStore
 
+from gef_ml.ingestion.splitter import FastSentenceSplitter
+
 # Configure logger
 
 logger = logging.getLogger(__name__)
 
+# Metadata key of the chunk content hash, used to detect which stored chunks changed
+CHUNK_HASH_KEY = "chunk_hash"
+
+
+@dataclass(frozen=True)
+class ChunkingConfig:
+    """One way of splitting the corpus into chunks, and the vector store its chunks are written to."""
+
+    chunk_size: int
+    chunk_overlap: int
+    vector_store: BasePydanticVectorStore | None = None
+
+
+# Namespace for the deterministic document and node IDs, so re-ingesting a project overwrites its points in Qdrant instead of duplicating them
+GEF_ML_NAMESPACE = uuid.UUID("0c6b9a3e-6f1d-5e7a-9a43-2f4f3c6d8b11")
+
+
+def assign_document_ids(documents: list[Document]) -> list[Document]:
+    """
+    Replaces the random IDs of loaded documents with IDs derived from the project ID, the filename and the position of the document within the file (PDFs load as one document per page).
+    """
+    parts: dict[tuple[str, str], int] = defaultdict(int)
+    for doc in documents:
+        key = (doc.metadata.get("project_id", ""), doc.metadata.get("filename", ""))
+        doc.id_ = str(uuid.uuid5(GEF_ML_NAMESPACE, f"{key[0]}/{key[1]}/{parts[key]}"))
+        parts[key] += 1
+    return documents
+
+
+def deterministic_node_id(i: int, doc: BaseNode, chunking: str = "") -> str:
+    """
+    Node ID function for the splitter, derived from the chunking settings, the source document ID and the chunk index.
+
+    Args:
+    - chunking: The chunking settings, e.g. "512:64". Chunk `i` of a document holds different text under different settings, so it must get a different ID.
+    """
+    return str(uuid.uuid5(GEF_ML_NAMESPACE, f"{chunking}/{doc.node_id}/{i}"))
+
+
+def chunk_hash(node: BaseNode) -> str:
+    """Hashes everything about a chunk that ends up in its point: the text and all metadata except the hash itself."""
+    metadata = {k: v for k, v in node.metadata.items() if k != CHUNK_HASH_KEY}
+    digest = hashlib.sha256()
+    digest.update(node.get_content(metadata_mode=MetadataMode.NONE).encode("utf-8"))
+    digest.update(repr(sorted(metadata.items())).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class ChunkHasher(TransformComponent):
+    """
+    Stores the content hash of every chunk in its metadata. The key is excluded from the embed and LLM text, so it doesn't change what is embedded or prompted.
+    """
+
+    def __call__(self, nodes: list[BaseNode], **kwargs):
+        for node in nodes:
+            node.metadata[CHUNK_HASH_KEY] = chunk_hash(node)
+            for excluded in (
+                node.excluded_embed_metadata_keys,
+                node.excluded_llm_metadata_keys,
+            ):
+                if CHUNK_HASH_KEY not in excluded:
+                    excluded.append(CHUNK_HASH_KEY)
+        return nodes
+
 
 def get_pipeline(
     vector_store: BasePydanticVectorStore | None = None,
@@ -15,19 +86,25 @@ def get_pipeline(
     chunk_size=512,
     chunk_overlap=64,
     include_metadata=True,
+    num_threads: int = 1,
 ) -> IngestionPipeline:
     """
-    Initializes and returns an ingestion pipeline with predefined transformations.
+    Initializes and returns an ingestion pipeline with predefined transformations. `num_threads` is the number of threads the splitter tokenizes with, worth raising when the pipeline runs in a process of its own.
     """
     logger.debug(
         "Initializing ingestion pipeline with model: %s", together_embed_model_name
     )
     transformations = [
-        SentenceSplitter(
+        FastSentenceSplitter(
             chunk_size=chunk_size,
             chunk_overlap=chunk_overlap,
             include_metadata=include_metadata,
+            id_func=functools.partial(
+                deterministic_node_id, chunking=f"{chunk_size}:{chunk_overlap}"
+            ),
+            num_threads=num_threads,
         ),
+        ChunkHasher(),
     ]
 
     return IngestionPipeline(transformations=transformations)  # type: ignore
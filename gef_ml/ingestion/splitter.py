@@ -0,0 +1,291 @@
+"""
+This file contains FastSentenceSplitter, a drop-in replacement for llama-index's `SentenceSplitter` that produces the same chunks with less tokenization work.
+
+`SentenceSplitter` splits a text recursively (paragraphs, then sentences, then phrases and words) and tokenizes every piece on the way down, one `encode` call at a time. The whole text, each of its paragraphs and each sentence of a long paragraph are all tokenized, so most of the text is tokenized several times. FastSentenceSplitter walks the same recursion level by level over all documents of a batch at once:
+- Every level is tokenized in one pass, split over `num_threads` threads since tiktoken releases the GIL.
+- Pieces that are certainly too long for a chunk, judging by their length or word count, are split without being tokenized.
+- Token counts are reused within a batch, so repeated metadata strings, headers and footers are counted once.
+
+The token count of a piece is always measured on the piece itself, because tiktoken counts aren't additive over arbitrary substrings, so the chunk boundaries are exactly those of `SentenceSplitter`.
+"""
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Sequence
+
+import tiktoken
+from llama_index.core.bridge.pydantic import Field, PrivateAttr
+from llama_index.core.callbacks.schema import CBEventType, EventPayload
+from llama_index.core.node_parser import SentenceSplitter
+from llama_index.core.node_parser.node_utils import build_nodes_from_splits
+from llama_index.core.node_parser.text.sentence import _Split
+from llama_index.core.schema import BaseNode, MetadataMode
+from llama_index.core.utils import get_tqdm_iterable
+
+logger = logging.getLogger(__name__)
+
+
+# tiktoken encodings in which every whitespace separated word starts a new token, so a text has at least as many tokens as words
+_WORD_SPLITTING_ENCODINGS = {
+    "gpt2",
+    "r50k_base",
+    "p50k_base",
+    "cl100k_base",
+    "o200k_base",
+}
+
+
+def _tiktoken_encoding(tokenizer: Any) -> tiktoken.Encoding | None:
+    """Returns the encoding if the tokenizer is llama-index's default `partial(encoding.encode, allowed_special="all")`, for which `encode_batch` gives the same tokens."""
+    encode = getattr(tokenizer, "func", None)
+    encoding = getattr(encode, "__self__", None)
+    if (
+        isinstance(encoding, tiktoken.Encoding)
+        and getattr(encode, "__name__", None) == "encode"
+        and not tokenizer.args
+        and tokenizer.keywords == {"allowed_special": "all"}
+    ):
+        return encoding
+    return None
+
+
+class FastSentenceSplitter(SentenceSplitter):
+    """
+    `SentenceSplitter` that tokenizes the pieces of all documents in batches. Takes the same arguments, plus:
+
+    Args:
+    - num_threads: The threads tiktoken tokenizes each batch with.
+    """
+
+    num_threads: int = Field(
+        default=1, description="The threads tiktoken tokenizes each batch with.", gt=0
+    )
+
+    _encoding: tiktoken.Encoding | None = PrivateAttr()
+    _max_token_bytes: int = PrivateAttr()
+    _words_bound: bool = PrivateAttr()
+
+    def __init__(self, *args, num_threads: int = 1, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.num_threads = num_threads
+        self._encoding = _tiktoken_encoding(self._tokenizer)
+        if self._encoding is None:
+            logger.info(
+                "The tokenizer isn't a tiktoken encoding, splitting without batched tokenization"
+            )
+            self._max_token_bytes = 0
+            self._words_bound = False
+        else:
+            # No token covers more bytes than this, which bounds the token count of a text from below
+            self._max_token_bytes = max(
+                max(len(b) for b in self._encoding.token_byte_values()),
+                max(
+                    (len(s.encode("utf-8")) for s in self._encoding.special_tokens_set),
+                    default=1,
+                ),
+            )
+            # The pre-tokenization patterns of these encodings never join two words separated by whitespace into one piece, and BPE doesn't merge across pieces
+            self._words_bound = self._encoding.name in _WORD_SPLITTING_ENCODINGS
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "FastSentenceSplitter"
+
+    def _token_sizes(
+        self, texts: list[str], chunk_sizes: list[int], counts: dict[str, int]
+    ) -> list[int | None]:
+        """
+        Returns the token count of each text, or None for texts that are certainly longer than their chunk size. New counts are added to `counts`.
+        """
+        sizes: list[int | None] = [None] * len(texts)
+        missing: dict[str, list[int]] = {}
+        for i, (text, chunk_size) in enumerate(zip(texts, chunk_sizes)):
+            if text in counts:
+                sizes[i] = counts[text]
+            elif self._max_token_bytes and (
+                # Every character is at least a byte
+                len(text) > chunk_size * self._max_token_bytes
+                or self._words_bound
+                # Words have at least one character and a separator, and each starts a new token
+                and len(text) > 2 * chunk_size
+                and len(text.split(maxsplit=chunk_size)) > chunk_size
+            ):
+                continue
+            else:
+                missing.setdefault(text, []).append(i)
+
+        if not missing:
+            return sizes
+        new_counts = self._count_tokens(list(missing))
+        for (text, indices), count in zip(missing.items(), new_counts):
+            counts[text] = count
+            for i in indices:
+                sizes[i] = count
+        return sizes
+
+    def _count_tokens(self, texts: list[str]) -> list[int]:
+        """
+        Tokenizes the texts in `num_threads` slices. tiktoken releases the GIL while encoding, and unlike `encode_batch` this doesn't submit a thread pool task per text, which would cost more than encoding a sentence.
+        """
+        if self._encoding is None:
+            return [len(self._tokenizer(text)) for text in texts]
+        encode = self._encoding.encode
+
+        def count(texts: list[str]) -> list[int]:
+            return [len(encode(text, allowed_special="all")) for text in texts]
+
+        if self.num_threads == 1 or len(texts) < 2 * self.num_threads:
+            return count(texts)
+        size = -(-len(texts) // self.num_threads)
+        with ThreadPoolExecutor(self.num_threads) as executor:
+            slices = executor.map(
+                count, [texts[i : i + size] for i in range(0, len(texts), size)]
+            )
+            return [n for counts in slices for n in counts]
+
+    def _split_batch(
+        self,
+        texts: list[str],
+        chunk_sizes: list[int],
+        counts: dict[str, int] | None = None,
+    ) -> list[list[_Split]]:
+        """Splits every text like `SentenceSplitter._split`, one recursion level at a time."""
+        counts = {} if counts is None else counts
+        results: list[list[_Split]] = [[] for _ in texts]
+        # Pieces of the current level in text order: (text index, piece, is_sentence)
+        pieces = [(i, text, True) for i, text in enumerate(texts)]
+        # Pieces that fit are collected per level with their position, and merged back in order at the end
+        fitting: list[tuple[tuple[int, ...], _Split]] = []
+        positions: list[tuple[int, ...]] = [(i,) for i in range(len(texts))]
+
+        while pieces:
+            sizes = self._token_sizes(
+                [piece for _, piece, _ in pieces],
+                [chunk_sizes[i] for i, _, _ in pieces],
+                counts,
+            )
+            next_pieces = []
+            next_positions = []
+            for (i, piece, is_sentence), position, size in zip(
+                pieces, positions, sizes
+            ):
+                if size is not None and size <= chunk_sizes[i]:
+                    fitting.append((position, _Split(piece, is_sentence, size)))
+                    continue
+                splits, splits_are_sentences = self._get_splits_by_fns(piece)
+                if len(splits) == 1 and splits[0] == piece:
+                    # A single character that is still too long, `_merge` rejects it
+                    fitting.append(
+                        (
+                            position,
+                            _Split(piece, splits_are_sentences, size or 0),
+                        )
+                    )
+                    continue
+                for j, split in enumerate(splits):
+                    next_pieces.append((i, split, splits_are_sentences))
+                    next_positions.append(position + (j,))
+            pieces = next_pieces
+            positions = next_positions
+
+        # Positions are paths in the recursion tree, so sorting them restores the order of the pieces within their text
+        for position, split in sorted(fitting, key=lambda item: item[0]):
+            results[position[0]].append(split)
+        return results
+
+    def _split(self, text: str, chunk_size: int) -> list[_Split]:
+        return self._split_batch([text], [chunk_size])[0]
+
+    def _merge(self, splits: list[_Split], chunk_size: int) -> list[str]:
+        """`SentenceSplitter._merge`, walking the splits by index instead of popping them from the front of the list."""
+        chunks: list[str] = []
+        cur_chunk: list[tuple[str, int]] = []
+        cur_chunk_len = 0
+        new_chunk = True
+        index = 0
+
+        while index < len(splits):
+            cur_split = splits[index]
+            if cur_split.token_size > chunk_size:
+                raise ValueError("Single token exceeded chunk size")
+            if cur_chunk_len + cur_split.token_size > chunk_size and not new_chunk:
+                chunks.append("".join(text for text, _ in cur_chunk))
+                # Start the next chunk with as many trailing splits of this one as fit in the overlap
+                last_chunk = cur_chunk
+                cur_chunk = []
+                cur_chunk_len = 0
+                new_chunk = True
+                last_index = len(last_chunk) - 1
+                while (
+                    last_index >= 0
+                    and cur_chunk_len + last_chunk[last_index][1] <= self.chunk_overlap
+                ):
+                    cur_chunk_len += last_chunk[last_index][1]
+                    last_index -= 1
+                cur_chunk = last_chunk[last_index + 1 :]
+            else:
+                # Splits that aren't sentences only land here when they fit or the chunk is new, like in `SentenceSplitter`
+                cur_chunk_len += cur_split.token_size
+                cur_chunk.append((cur_split.text, cur_split.token_size))
+                index += 1
+                new_chunk = False
+
+        if not new_chunk:
+            chunks.append("".join(text for text, _ in cur_chunk))
+
+        return self._postprocess_chunks(chunks)
+
+    def _effective_chunk_size(self, metadata_str: str, counts: dict[str, int]) -> int:
+        """The chunk size left after the metadata, with the checks of `split_text_metadata_aware`."""
+        metadata_len = self._token_sizes([metadata_str], [self.chunk_size], counts)[0]
+        if metadata_len is None:
+            metadata_len = len(self._tokenizer(metadata_str))
+        effective_chunk_size = self.chunk_size - metadata_len
+        if effective_chunk_size <= 0:
+            raise ValueError(
+                f"Metadata length ({metadata_len}) is longer than chunk size "
+                f"({self.chunk_size}). Consider increasing the chunk size or "
+                "decreasing the size of your metadata to avoid this."
+            )
+        elif effective_chunk_size < 50:
+            logger.warning(
+                "Metadata length (%d) is close to chunk size (%d), resulting chunks are less than 50 tokens",
+                metadata_len,
+                self.chunk_size,
+            )
+        return effective_chunk_size
+
+    def _parse_nodes(
+        self, nodes: Sequence[BaseNode], show_progress: bool = False, **kwargs: Any
+    ) -> list[BaseNode]:
+        """Splits all nodes together, then builds the chunks of each node like `MetadataAwareTextSplitter._parse_nodes`."""
+        counts: dict[str, int] = {}
+        texts = [node.get_content(metadata_mode=MetadataMode.NONE) for node in nodes]
+        chunk_sizes = [
+            self._effective_chunk_size(self._get_metadata_str(node), counts)
+            for node in nodes
+        ]
+        splits_by_node = self._split_batch(texts, chunk_sizes, counts)
+
+        all_nodes: list[BaseNode] = []
+        nodes_with_progress = get_tqdm_iterable(
+            list(zip(nodes, texts, chunk_sizes, splits_by_node)),
+            show_progress,
+            "Parsing nodes",
+        )
+        for node, text, chunk_size, splits in nodes_with_progress:
+            if text == "":
+                chunks = [text]
+            else:
+                with self.callback_manager.event(
+                    CBEventType.CHUNKING, payload={EventPayload.CHUNKS: [text]}
+                ) as event:
+                    chunks = self._merge(splits, chunk_size)
+                    event.on_end(payload={EventPayload.CHUNKS: chunks})
+            all_nodes.extend(
+                build_nodes_from_splits(chunks, node, id_func=self.id_func)
+            )
+        return all_nodes
+
+
+__all__ = ["FastSentenceSplitter"]
@@ -1,24 +1,98 @@
 """This module contains the StreamingIngestion class, which is used to stream data into the vector DB in chunks as opposed to loading every document in the directory and calling the pipeline on the whole thing. Within each chunk, the documents are loaded in parallel."""
 
+import asyncio
+import contextlib
+import functools
 import logging
 import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor
 
 from dotenv import load_dotenv
-from llama_index.core import SimpleDirectoryReader
-from llama_index.core.schema import Document
+from llama_index.core.ingestion import IngestionPipeline
+from llama_index.core.schema import BaseNode, MetadataMode
 from llama_index.core.vector_stores.types import BasePydanticVectorStore
 from tqdm import tqdm
 
+from gef_ml.ingestion.embedding_cache import content_hash
 from gef_ml.ingestion.embedding_service import EmbeddingService
-from gef_ml.ingestion.pipeline import get_pipeline
-from gef_ml.utils import file_metadata
-from gef_ml.utils.log_config import setup_logging
+from gef_ml.ingestion.incremental import delete_points, diff_project
+from gef_ml.ingestion.manifest import IngestionManifest
+from gef_ml.ingestion.parsing import ParsedTextCache, load_documents
+from gef_ml.ingestion.pipeline import (
+    ChunkingConfig,
+    assign_document_ids,
+    get_pipeline,
+)
+from gef_ml.ingestion.work_queue import WorkQueue, default_worker_id
+from gef_ml.utils.metrics import metrics, project_scope
 
 load_dotenv()
-setup_logging()
 logger = logging.getLogger(__name__)
 
-embed_service = EmbeddingService()
+
+@contextlib.asynccontextmanager
+async def _process_pool(max_workers: int | None):
+    """A ProcessPoolExecutor whose shutdown waits for the workers on a thread, so the event loop keeps running meanwhile."""
+    executor = ProcessPoolExecutor(max_workers=max_workers)
+    try:
+        yield executor
+    finally:
+        await asyncio.to_thread(executor.shutdown)
+
+
+@functools.lru_cache(maxsize=None)
+def _get_worker_pipeline(chunk_size: int, chunk_overlap: int) -> IngestionPipeline:
+    """Builds the chunking pipeline once per parse worker process."""
+    return get_pipeline(
+        chunk_size=chunk_size, chunk_overlap=chunk_overlap, include_metadata=True
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def _get_worker_parsed_cache(path: str) -> ParsedTextCache:
+    """Opens the parsed text cache once per parse worker process."""
+    return ParsedTextCache(path)
+
+
+def load_project_nodes(
+    project_dir: str,
+    chunk_size: int,
+    chunk_overlap: int,
+    parsed_cache_path: str | None = None,
+) -> list[BaseNode]:
+    """
+    Loads and chunks every file in a project directory.
+
+    This runs inside the parse worker processes of the pipelined ingestion, so it only takes picklable arguments and builds its own pipeline and cache connection.
+    """
+    return _load_project_nodes_timed(
+        project_dir, [(chunk_size, chunk_overlap)], parsed_cache_path
+    )[0][0]
+
+
+def _load_project_nodes_timed(
+    project_dir: str,
+    chunkings: list[tuple[int, int]],
+    parsed_cache_path: str | None = None,
+) -> tuple[list[list[BaseNode]], dict[str, float]]:
+    """
+    Loads the files of a project once and chunks them with every `(chunk_size, chunk_overlap)` pair, returning the nodes of each pair and the seconds spent parsing and chunking for the parent process to record.
+    """
+    cache = _get_worker_parsed_cache(parsed_cache_path) if parsed_cache_path else None
+    start = time.perf_counter()
+    documents = assign_document_ids(load_documents(project_dir, cache=cache))
+    parsed = time.perf_counter()
+    nodes_by_config = [
+        _get_worker_pipeline(chunk_size, chunk_overlap).run(
+            documents=documents, show_progress=False
+        )
+        for chunk_size, chunk_overlap in chunkings
+    ]
+    return nodes_by_config, {
+        "parse": parsed - start,
+        "chunk": time.perf_counter() - parsed,
+    }
 
 
 class StreamingIngestion:
@@ -26,6 +100,10 @@ class StreamingIngestion:
     This class is used to stream data into the vector DB in chunks as opposed to loading every document in the directory and calling the pipeline on the whole thing. Within each chunk, the documents are loaded in parallel.
 
     This class assumes that the data is in a directory with subdirectories for each project. Each subdirectory contains the files for each project.
+
+    With `incremental=True` the chunks of a project are compared with the points stored for it in the (Qdrant) vector store, and only new or changed chunks are embedded and upserted while chunks that no longer exist are deleted.
+
+    With `chunking_configs` the documents of a project are loaded once and split with every config in the same pass, and each config's chunks go to its own vector store (`vector_store`, `chunk_size` and `chunk_overlap` are then ignored). Chunks with the same embedding text under several configs are embedded once. The manifest then records a project as done when every config has been stored.
     """
 
     WORKERS_PER_CHUNK = 1
@@ -36,51 +114,79 @@ class StreamingIngestion:
         vector_store: BasePydanticVectorStore | None = None,
         chunk_size=512,
         chunk_overlap=64,
+        embedding_service: EmbeddingService | None = None,
+        manifest: IngestionManifest | None = None,
+        parsed_cache: ParsedTextCache | None = None,
+        incremental: bool = False,
+        max_embed_requests_per_second: int = 75,
+        chunking_configs: list[ChunkingConfig] | None = None,
     ):
         logger.info("Initializing StreamingIngestion for directory: %s", directory)
         self.directory = directory
         self.vector_store = vector_store
-        self.pipeline = get_pipeline(
-            vector_store,
-            chunk_size=chunk_size,
-            chunk_overlap=chunk_overlap,
-            include_metadata=True,
-        )
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.embed_service = embedding_service or EmbeddingService()
+        self.manifest = manifest
+        self.parsed_cache = parsed_cache
+        self.incremental = incremental
+        # Per ingestion, workers sharing an API key have to split the limit between them
+        self.max_embed_requests_per_second = max_embed_requests_per_second
+        self.chunking_configs = chunking_configs or [
+            ChunkingConfig(chunk_size, chunk_overlap, vector_store)
+        ]
+        self.pipelines = [
+            get_pipeline(
+                config.vector_store,
+                chunk_size=config.chunk_size,
+                chunk_overlap=config.chunk_overlap,
+                include_metadata=True,
+                # Chunking runs in this process, the parse workers only load the files
+                num_threads=os.cpu_count() or 1,
+            )
+            for config in self.chunking_configs
+        ]
 
     def _ingest_project_id(
-        self, project_id: str, show_progress: bool = True
-    ) -> list[Document]:
+        self,
+        project_id: str,
+        show_progress: bool = True,
+        executor: Executor | None = None,
+    ) -> list[list[BaseNode]]:
         """
-        Ingests documents for a given project ID, returning the processed nodes.
+        Ingests documents for a given project ID, returning the processed nodes of every chunking config.
+
+        Files that aren't in the parsed text cache are parsed on `executor` when given.
         """
 
         project_dir = os.path.join(self.directory, project_id)
         logger.info(
             "Ingesting documents for project ID: %s from %s", project_id, project_dir
         )
-        reader = SimpleDirectoryReader(project_dir, file_metadata=file_metadata)
-        documents = reader.load_data(num_workers=4)
+        with metrics.timer("parse", project_id):
+            documents = assign_document_ids(
+                load_documents(project_dir, cache=self.parsed_cache, executor=executor)
+            )
         logger.info("Loaded %d documents for project %s.", len(documents), project_id)
 
-        processed_nodes = self.pipeline.run(
-            show_progress=show_progress,
-            documents=documents,
-            num_workers=self.WORKERS_PER_CHUNK,
-        )
+        with metrics.timer("chunk", project_id):
+            nodes_by_config = [
+                pipeline.run(
+                    show_progress=show_progress,
+                    documents=documents,
+                    num_workers=self.WORKERS_PER_CHUNK,
+                )
+                for pipeline in self.pipelines
+            ]
         logger.info(
-            "Processed %d documents for project %s.", len(processed_nodes), project_id
+            "Processed %s documents for project %s.",
+            "/".join(str(len(nodes)) for nodes in nodes_by_config),
+            project_id,
         )
 
-        return processed_nodes  # type: ignore
-
-    async def ingest(self):
-        """
-        Ingests the data for the entire directory.
-
-        Args:
-        - directory: The directory containing the data.
-        """
+        return nodes_by_config  # type: ignore
 
+    def _list_project_ids(self) -> list[str]:
         project_ids = [
             f
             for f in os.listdir(self.directory)
@@ -89,22 +195,345 @@ class StreamingIngestion:
         logger.info(
             "Found %d projects in directory %s", len(project_ids), self.directory
         )
+        return project_ids
+
+    def _start_project(self, project_id: str) -> bool:
+        """
+        Checks the manifest and records the start of a project's ingestion, returning False if the project is done and unchanged.
+        """
+        if self.manifest is None:
+            return True
+
+        files = self.manifest.fingerprint_project(
+            project_id, os.path.join(self.directory, project_id)
+        )
+        if not self.manifest.needs_ingestion(project_id, files):
+            logger.info(
+                "Skipping project %s, already ingested and unchanged", project_id
+            )
+            return False
+
+        self.manifest.mark_started(project_id, files)
+        return True
+
+    def _plan_update(
+        self,
+        project_id: str,
+        nodes: list[BaseNode],
+        vector_store: BasePydanticVectorStore | None,
+    ) -> tuple[list[BaseNode], list[str]]:
+        """
+        Returns the nodes to embed and upsert and the point IDs to delete. Without incremental updates that is every node and no deletions, otherwise only the chunks that differ from what the collection stores for the project.
+        """
+        metrics.increment("chunks", len(nodes), project_id)
+        if not self.incremental or vector_store is None:
+            metrics.increment("changed_chunks", len(nodes), project_id)
+            return nodes, []
+        with metrics.timer("diff", project_id):
+            update = diff_project(
+                vector_store.client,
+                vector_store.collection_name,  # type: ignore
+                project_id,
+                nodes,
+            )
+        metrics.increment("changed_chunks", len(update.changed), project_id)
+        return update.changed, update.stale_ids
+
+    def _plan_updates(
+        self, project_id: str, nodes_by_config: list[list[BaseNode]]
+    ) -> tuple[list[list[BaseNode]], list[list[str]]]:
+        """`_plan_update` for every chunking config, returning the changed nodes and stale point IDs of each."""
+        updates = [
+            self._plan_update(project_id, nodes, config.vector_store)
+            for nodes, config in zip(nodes_by_config, self.chunking_configs)
+        ]
+        return [changed for changed, _ in updates], [stale for _, stale in updates]
+
+    async def _embed(
+        self, changed_by_config: list[list[BaseNode]]
+    ) -> list[list[BaseNode]]:
+        """
+        Embeds the changed nodes of every chunking config, sending each distinct embedding text once. Returns the nodes of each config that have content, with their embeddings set.
+        """
+        hashes = [
+            [
+                content_hash(n.get_content(metadata_mode=MetadataMode.EMBED))
+                for n in nodes
+            ]
+            for nodes in changed_by_config
+        ]
+        unique: dict[str, BaseNode] = {}
+        for nodes, node_hashes in zip(changed_by_config, hashes):
+            for node, h in zip(nodes, node_hashes):
+                unique.setdefault(h, node)
+
+        total = sum(len(nodes) for nodes in changed_by_config)
+        if len(unique) < total:
+            metrics.increment("deduplicated_chunks", total - len(unique))
+        await self.embed_service.generate_embeddings(
+            list(unique.values()),  # type: ignore
+            max_requests_per_second=self.max_embed_requests_per_second,
+        )
+
+        embedded_by_config = []
+        for nodes, node_hashes in zip(changed_by_config, hashes):
+            embedded = []
+            for node, h in zip(nodes, node_hashes):
+                embedding = unique[h].embedding
+                if embedding is not None:
+                    node.embedding = embedding
+                    embedded.append(node)
+            embedded_by_config.append(embedded)
+        return embedded_by_config
+
+    def _store(
+        self,
+        vector_store: BasePydanticVectorStore | None,
+        embeddings: list[BaseNode],
+        stale_ids: list[str],
+    ):
+        if vector_store is None:
+            return
+        with metrics.timer("upsert"):
+            if embeddings:
+                vector_store.add(embeddings)  # type: ignore
+            # Stale points are only deleted once their replacements are stored
+            delete_points(
+                vector_store.client,
+                vector_store.collection_name,  # type: ignore
+                stale_ids,
+            )
+
+    def _store_all(
+        self,
+        embedded_by_config: list[list[BaseNode]],
+        stale_by_config: list[list[str]],
+    ):
+        for config, embeddings, stale_ids in zip(
+            self.chunking_configs, embedded_by_config, stale_by_config
+        ):
+            self._store(config.vector_store, embeddings, stale_ids)
+
+    def _complete_project(self, project_id: str, num_chunks: int):
+        logger.info("Completed ingestion for project %s", project_id)
+        metrics.finish_project(project_id, "done", run="ingestion")
+        if self.manifest is not None:
+            self.manifest.mark_done(project_id, num_chunks)
+
+    def _fail_project(self, project_id: str, e: Exception):
+        logger.error("Failed to ingest project %s due to error: %s", project_id, e)
+        logger.exception("Error details:")
+        metrics.finish_project(project_id, "failed", run="ingestion", error=repr(e))
+        if self.manifest is not None:
+            self.manifest.mark_failed(project_id, repr(e))
+
+    async def _ingest_project(
+        self, project_id: str, executor: Executor | None = None
+    ) -> int | None:
+        """Runs every stage for one project, returning its number of chunks or None if the manifest says it's done and unchanged. Errors are raised to the caller."""
+        if not self._start_project(project_id):
+            return None
+        with project_scope(project_id):
+            nodes_by_config = self._ingest_project_id(
+                project_id, show_progress=True, executor=executor
+            )
+            changed_by_config, stale_by_config = self._plan_updates(
+                project_id, nodes_by_config
+            )
+            with metrics.timer("embed"):
+                embedded_by_config = await self._embed(changed_by_config)
+            logger.info("Adding embeddings to vector store for project %s", project_id)
+            self._store_all(embedded_by_config, stale_by_config)
+        num_chunks = sum(len(nodes) for nodes in nodes_by_config)
+        self._complete_project(project_id, num_chunks)
+        return num_chunks
+
+    async def ingest(self, parse_workers: int | None = None):
+        """
+        Ingests the data for the entire directory.
+
+        Args:
+        - parse_workers: The number of processes the files of a project are parsed in, defaults to the number of CPUs.
+        """
+
+        project_ids = self._list_project_ids()
+
+        async with _process_pool(parse_workers) as executor:
+            for project_id in tqdm(project_ids, desc="Ingesting projects"):
+                logger.info("Starting ingestion for project %s", project_id)
+                try:
+                    await self._ingest_project(project_id, executor)
+                except Exception as e:
+                    self._fail_project(project_id, e)
+
+        await self.embed_service.aclose()
+        metrics.flush()
+
+    async def ingest_from_queue(
+        self,
+        work_queue: WorkQueue,
+        worker_id: str | None = None,
+        parse_workers: int | None = None,
+        max_wait_seconds: float = 30,
+    ) -> int:
+        """
+        Ingests the projects claimed from a work queue shared with other workers until the queue has nothing left to claim, returning the number of projects this worker completed.
+
+        The lease of the current project is kept alive by heartbeats from a background thread. When a heartbeat finds the lease lost, the ingestion of the project is cancelled and left to the worker that reclaimed it. Node IDs are deterministic, so chunks both workers wrote before that are overwritten rather than duplicated. While the only projects left are leased by other workers, this worker waits for the leases to expire, so the project of a worker that died is still reclaimed.
+
+        Args:
+        - work_queue: The queue filled by the coordinator with project directory names of `directory`.
+        - worker_id: Identifies this worker in the queue, defaults to the host name and process ID.
+        - parse_workers: The number of processes the files of a project are parsed in, defaults to the number of CPUs.
+        - max_wait_seconds: The longest wait before checking the queue again while other workers hold the remaining projects.
+        """
+        worker_id = worker_id or default_worker_id()
+        completed = 0
 
-        for project_id in tqdm(project_ids, desc="Ingesting projects"):
-            logger.info("Starting ingestion for project %s", project_id)
-            try:
-                nodes = self._ingest_project_id(project_id, show_progress=True)
-                embeddings = await embed_service.generate_embeddings(
-                    nodes, max_chunk_size=8
+        async with _process_pool(parse_workers) as executor:
+            while True:
+                item = work_queue.claim(worker_id)
+                if item is None:
+                    expires_at = work_queue.next_expiry()
+                    if expires_at is None:
+                        break
+                    delay = min(max(expires_at - time.time(), 0), max_wait_seconds)
+                    logger.info(
+                        "Worker %s waiting %.1fs for the leases of other workers",
+                        worker_id,
+                        delay,
+                    )
+                    await asyncio.sleep(delay)
+                    continue
+                project_id = item.project_id
+                logger.info(
+                    "Worker %s claimed project %s (attempt %d)",
+                    worker_id,
+                    project_id,
+                    item.attempts,
                 )
+                loop = asyncio.get_running_loop()
+                task = asyncio.ensure_future(self._ingest_project(project_id, executor))
+                try:
+                    with work_queue.lease(
+                        worker_id,
+                        project_id,
+                        on_lost=lambda: loop.call_soon_threadsafe(task.cancel),
+                    ) as lost:
+                        try:
+                            num_chunks = await task
+                        except asyncio.CancelledError:
+                            if not lost.is_set():
+                                raise
+                            # Another worker holds the project now, it finishes and records it
+                            logger.warning(
+                                "Worker %s stopped ingesting project %s after losing its lease",
+                                worker_id,
+                                project_id,
+                            )
+                            continue
+                except Exception as e:
+                    self._fail_project(project_id, e)
+                    work_queue.fail(worker_id, project_id, repr(e))
+                    continue
+                if work_queue.complete(worker_id, project_id, num_chunks or 0):
+                    completed += 1
+
+        await self.embed_service.aclose()
+        metrics.flush()
+        logger.info("Worker %s completed %d projects", worker_id, completed)
+        return completed
+
+    async def ingest_pipelined(self, parse_workers: int = 4, queue_size: int = 4):
+        """
+        Ingests the data for the entire directory with parsing, embedding and upserting running as overlapping stages.
+
+        Projects are loaded and chunked in a process pool while earlier projects are embedded and written to the vector store. The stages are joined by bounded queues, so at most `parse_workers + queue_size` parsed projects are held in memory ahead of the embedding stage. With a parsed text cache, files parsed by an earlier run (with any chunking settings) are only re-chunked. With several chunking configs, the workers split each project with all of them after loading it once.
+
+        Args:
+        - parse_workers: The number of processes used to load and chunk projects.
+        - queue_size: The maximum number of projects buffered between two stages.
+        """
+
+        project_ids = self._list_project_ids()
+        loop = asyncio.get_running_loop()
+        parsed_queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        embedded_queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        parse_slots = asyncio.Semaphore(parse_workers)
+        # Only the chunking settings are sent to the parse workers, the vector stores stay here
+        chunkings = [(c.chunk_size, c.chunk_overlap) for c in self.chunking_configs]
+        progress = tqdm(total=len(project_ids), desc="Ingesting projects")
+
+        async def parse_project(executor: ProcessPoolExecutor, project_id: str):
+            async with parse_slots:
+                logger.info("Parsing project %s", project_id)
+                try:
+                    if not await asyncio.to_thread(self._start_project, project_id):
+                        progress.update(1)
+                        return
+                    nodes_by_config, timings = await loop.run_in_executor(
+                        executor,
+                        _load_project_nodes_timed,
+                        os.path.join(self.directory, project_id),
+                        chunkings,
+                        self.parsed_cache.path if self.parsed_cache else None,
+                    )
+                    for stage, seconds in timings.items():
+                        metrics.observe(stage, seconds, project_id)
+                    changed_by_config, stale_by_config = await asyncio.to_thread(
+                        self._plan_updates, project_id, nodes_by_config
+                    )
+                except Exception as e:
+                    self._fail_project(project_id, e)
+                    progress.update(1)
+                    return
+                num_chunks = sum(len(nodes) for nodes in nodes_by_config)
+                logger.info("Parsed %d nodes for project %s", num_chunks, project_id)
+                await parsed_queue.put(
+                    (project_id, num_chunks, changed_by_config, stale_by_config)
+                )
+
+        async def parse_stage():
+            async with _process_pool(parse_workers) as executor:
+                await asyncio.gather(
+                    *[parse_project(executor, project_id) for project_id in project_ids]
+                )
+            await parsed_queue.put(None)
+
+        async def embed_stage():
+            while (item := await parsed_queue.get()) is not None:
+                project_id, num_chunks, changed_by_config, stale_by_config = item
+                try:
+                    with project_scope(project_id), metrics.timer("embed"):
+                        embedded_by_config = await self._embed(changed_by_config)
+                except Exception as e:
+                    self._fail_project(project_id, e)
+                    progress.update(1)
+                    continue
+                await embedded_queue.put(
+                    (project_id, num_chunks, embedded_by_config, stale_by_config)
+                )
+            await embedded_queue.put(None)
+
+        async def upsert_stage():
+            while (item := await embedded_queue.get()) is not None:
+                project_id, num_chunks, embedded_by_config, stale_by_config = item
                 logger.info(
                     "Adding embeddings to vector store for project %s", project_id
                 )
-                if self.vector_store:
-                    self.vector_store.add(embeddings)  # type: ignore
-                logger.info("Completed ingestion for project %s", project_id)
-            except Exception as e:
-                logger.error(
-                    "Failed to ingest project %s due to error: %s", project_id, e
-                )
-                logger.exception("Error details:")
+                try:
+                    with project_scope(project_id):
+                        await asyncio.to_thread(
+                            self._store_all, embedded_by_config, stale_by_config
+                        )
+                    self._complete_project(project_id, num_chunks)
+                except Exception as e:
+                    self._fail_project(project_id, e)
+                progress.update(1)
+
+        try:
+            await asyncio.gather(parse_stage(), embed_stage(), upsert_stage())
+        finally:
+            progress.close()
+            await self.embed_service.aclose()
+            metrics.flush()
@@ -1,14 +1,42 @@
 import logging
 import re
 import unicodedata
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, List
 
+from llama_index.core.bridge.pydantic import Field
 from llama_index.core.schema import Document, TransformComponent
 
-from gef_ml.utils.log_config import setup_logging
-
-setup_logging()
 logger = logging.getLogger(__name__)
 
+# Non-breaking spaces (\xa0) and the C0/C1 control characters all become regular spaces.
+# The non-breaking space substitutions around word characters the cleaner used to make
+# all reduce to this same replacement, so one character class covers every one of them.
+_SPACE_PATTERN = re.compile(r"[\x00-\x1F\x7F-\xA0]")
+
+
+def clean_text(text: str) -> str:
+    """
+    Cleans a single text in one pass: replaces non-breaking spaces and control characters with spaces, normalizes to NFKC and strips surrounding whitespace.
+    """
+    text = _SPACE_PATTERN.sub(" ", text)
+    # The quick check avoids building a normalized copy of text that is already NFKC
+    if not unicodedata.is_normalized("NFKC", text):
+        text = unicodedata.normalize("NFKC", text)
+    return text.strip()
+
+
+def clean_texts(
+    texts: Iterable[str], num_workers: int = 1, batch_size: int = 64
+) -> List[str]:
+    """Cleans many texts, in `batch_size` batches across a process pool when `num_workers` is above 1."""
+    texts = list(texts)
+    if num_workers <= 1 or len(texts) <= batch_size:
+        return [clean_text(t) for t in texts]
+
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        return list(executor.map(clean_text, texts, chunksize=batch_size))
+
 
 class TextCleaner(TransformComponent):
     """
@@ -17,19 +45,20 @@ class TextCleaner(TransformComponent):
     other non-standard whitespace or control characters.
     """
 
+    num_workers: int = Field(
+        default=1, description="Processes used to clean large batches of nodes."
+    )
+    batch_size: int = Field(
+        default=64, description="Nodes sent to a worker process at a time."
+    )
+
     def __call__(self, nodes: list[Document], **kwargs):
-        for node in nodes:
-            node.text = re.sub(r"(\w)\u00a0(\w)", r"\1 \2", node.text)
-            node.text = re.sub(r"(\w)\u00a0", r"\1 ", node.text)
-            node.text = re.sub(r"\u00a0(\w)", r" \1", node.text)
-
-            # Replace non-breaking spaces with regular spaces
-            node.text = node.text.replace("\u00a0", " ")
-            # Replace other types of control characters
-            node.text = re.sub(r"[\x00-\x1F\x7F-\x9F]", " ", node.text)
-            # Normalize unicode to ensure consistent character representation
-            node.text = unicodedata.normalize("NFKC", node.text)
-            # Optionally, you might want to strip leading and trailing whitespace
-            node.text = node.text.strip()
+        cleaned = clean_texts(
+            (node.text for node in nodes),
+            num_workers=self.num_workers,
+            batch_size=self.batch_size,
+        )
+        for node, text in zip(nodes, cleaned):
+            node.text = text
 
         return nodes
@@ -0,0 +1,280 @@
+"""This module contains the WorkQueue class, a durable SQLite queue of projects shared by any number of ingestion workers. A coordinator enqueues the project directories once, and each worker repeatedly claims a project, keeps its lease alive with heartbeats while ingesting it and marks it done or failed. A project whose lease expires because its worker died is handed to the next worker that asks for work, until it runs out of attempts."""
+
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator, NamedTuple
+
+logger = logging.getLogger(__name__)
+
+STATUS_PENDING = "pending"
+STATUS_CLAIMED = "claimed"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+
+class WorkItem(NamedTuple):
+    project_id: str
+    attempts: int
+
+
+def default_worker_id() -> str:
+    """Identifies the current process across hosts."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class WorkQueue:
+    """
+    SQLite backed queue of project IDs with leases.
+
+    Claims run in an immediate transaction, so two workers never hold the same project while its lease is valid. Lease expiry compares wall clock times, so hosts sharing a queue need clocks that agree to well within `lease_seconds`. WAL mode only works when every worker is on the same host; for workers on several hosts sharing the file over a network filesystem with working locks, pass `wal=False`.
+
+    Args:
+    - path: The SQLite file of the queue.
+    - lease_seconds: How long a claim is valid without a heartbeat.
+    - max_attempts: How many times a project is claimed before it is left as failed.
+    - wal: Whether to use the write-ahead log.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        lease_seconds: float = 300,
+        max_attempts: int = 3,
+        wal: bool = True,
+    ):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        # Autocommit mode, the transactions are started explicitly. The timeout covers other processes holding the write lock.
+        self._conn = sqlite3.connect(
+            path, timeout=60, isolation_level=None, check_same_thread=False
+        )
+        if wal:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS work_items (
+                project_id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                worker_id TEXT,
+                lease_expires_at REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                num_chunks INTEGER,
+                error TEXT,
+                updated_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS work_items_status ON work_items (status, lease_expires_at);
+            """
+        )
+
+    def enqueue(self, project_ids: list[str]) -> int:
+        """Adds the projects that aren't queued yet, returning how many were added."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO work_items (project_id, status, updated_at) VALUES (?, ?, ?)",
+                [(project_id, STATUS_PENDING, now) for project_id in project_ids],
+            )
+            added = self._conn.total_changes - before
+            self._conn.execute("COMMIT")
+        logger.info("Enqueued %d of %d projects", added, len(project_ids))
+        return added
+
+    def claim(self, worker_id: str) -> WorkItem | None:
+        """Claims a pending project or one whose lease expired, returning None when there is nothing to claim right now (see `next_expiry`)."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    """
+                    SELECT project_id, attempts, status, worker_id FROM work_items
+                    WHERE attempts < ? AND (
+                        status = ? OR (status = ? AND lease_expires_at < ?)
+                    )
+                    ORDER BY attempts, project_id
+                    LIMIT 1
+                    """,
+                    (self.max_attempts, STATUS_PENDING, STATUS_CLAIMED, now),
+                ).fetchone()
+                if row is None:
+                    # Expired claims that ran out of attempts won't be retried
+                    self._conn.execute(
+                        "UPDATE work_items SET status = ?, error = ?, updated_at = ? WHERE status = ? AND lease_expires_at < ? AND attempts >= ?",
+                        (
+                            STATUS_FAILED,
+                            "lease expired",
+                            now,
+                            STATUS_CLAIMED,
+                            now,
+                            self.max_attempts,
+                        ),
+                    )
+                    self._conn.execute("COMMIT")
+                    return None
+
+                project_id, attempts, status, previous_worker = row
+                self._conn.execute(
+                    "UPDATE work_items SET status = ?, worker_id = ?, lease_expires_at = ?, attempts = ?, updated_at = ? WHERE project_id = ?",
+                    (
+                        STATUS_CLAIMED,
+                        worker_id,
+                        now + self.lease_seconds,
+                        attempts + 1,
+                        now,
+                        project_id,
+                    ),
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+        if status == STATUS_CLAIMED:
+            logger.warning(
+                "Reclaimed project %s from worker %s after its lease expired",
+                project_id,
+                previous_worker,
+            )
+        return WorkItem(project_id, attempts + 1)
+
+    def _update_claimed(self, worker_id: str, project_id: str, sql: str, *args) -> bool:
+        """Runs an update of a project claimed by the worker, returning False if the worker no longer holds it."""
+        with self._lock:
+            cursor = self._conn.execute(
+                sql + " WHERE project_id = ? AND worker_id = ? AND status = ?",
+                (*args, project_id, worker_id, STATUS_CLAIMED),
+            )
+        return cursor.rowcount == 1
+
+    def heartbeat(self, worker_id: str, project_id: str) -> bool:
+        """Extends the lease of a claimed project, returning False if the lease was lost to another worker."""
+        now = time.time()
+        return self._update_claimed(
+            worker_id,
+            project_id,
+            "UPDATE work_items SET lease_expires_at = ?, updated_at = ?",
+            now + self.lease_seconds,
+            now,
+        )
+
+    def complete(self, worker_id: str, project_id: str, num_chunks: int) -> bool:
+        if not self._update_claimed(
+            worker_id,
+            project_id,
+            "UPDATE work_items SET status = ?, num_chunks = ?, error = NULL, lease_expires_at = NULL, updated_at = ?",
+            STATUS_DONE,
+            num_chunks,
+            time.time(),
+        ):
+            logger.warning(
+                "Completed project %s after its lease was lost, it may be ingested twice",
+                project_id,
+            )
+            return False
+        return True
+
+    def fail(self, worker_id: str, project_id: str, error: str) -> bool:
+        """Records a failed attempt. The project is claimable again until it runs out of attempts."""
+        now = time.time()
+        with self._lock:
+            # The attempts are read and the status written in one transaction, so a reclaim can't slip in between
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT attempts FROM work_items WHERE project_id = ? AND worker_id = ? AND status = ?",
+                    (project_id, worker_id, STATUS_CLAIMED),
+                ).fetchone()
+                if row is not None:
+                    status = (
+                        STATUS_FAILED if row[0] >= self.max_attempts else STATUS_PENDING
+                    )
+                    self._conn.execute(
+                        "UPDATE work_items SET status = ?, error = ?, lease_expires_at = NULL, updated_at = ? WHERE project_id = ?",
+                        (status, error, now, project_id),
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return row is not None
+
+    def next_expiry(self) -> float | None:
+        """
+        Returns the earliest expiry time of the leases other workers hold on projects that can still be reclaimed, or None when no such lease is left.
+
+        When `claim` returns None and this doesn't, projects are still being ingested and one of them is claimable again if its worker dies.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT MIN(lease_expires_at) FROM work_items WHERE status = ? AND attempts < ?",
+                (STATUS_CLAIMED, self.max_attempts),
+            ).fetchone()
+        return row[0]
+
+    @contextmanager
+    def lease(
+        self,
+        worker_id: str,
+        project_id: str,
+        interval: float | None = None,
+        on_lost: Callable[[], None] | None = None,
+    ) -> Iterator[threading.Event]:
+        """
+        Sends heartbeats for a claimed project from a background thread while the block runs, so the lease stays valid however long the (possibly blocking) ingestion takes. Yields an event that is set if the lease is lost, when `on_lost` is also called from the heartbeat thread.
+        """
+        interval = interval or self.lease_seconds / 3
+        stop = threading.Event()
+        lost = threading.Event()
+
+        def beat():
+            while not stop.wait(interval):
+                if not self.heartbeat(worker_id, project_id):
+                    logger.warning("Lost the lease on project %s", project_id)
+                    lost.set()
+                    if on_lost is not None:
+                        on_lost()
+                    return
+
+        thread = threading.Thread(target=beat, daemon=True)
+        thread.start()
+        try:
+            yield lost
+        finally:
+            stop.set()
+            thread.join()
+
+    def reset_failed(self) -> int:
+        """Makes the failed projects claimable again with fresh attempts, returning how many there were."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE work_items SET status = ?, attempts = 0, worker_id = NULL, updated_at = ? WHERE status = ?",
+                (STATUS_PENDING, time.time(), STATUS_FAILED),
+            )
+        return cursor.rowcount
+
+    def summary(self) -> dict[str, int]:
+        """Returns the number of projects in each status."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT status, COUNT(*) FROM work_items GROUP BY status"
+            ).fetchall()
+        return dict(rows)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+__all__ = ["WorkQueue", "WorkItem", "default_worker_id"]
@@ -1,4 +1,39 @@
-from .base import file_metadata, parse_filename
-from .qdrant import get_qdrant_vectorstore
+from typing import TYPE_CHECKING
 
-__all__ = ["get_qdrant_vectorstore", "file_metadata", "parse_filename"]
+from .lazy import lazy_attributes
+
+if TYPE_CHECKING:
+    from .base import file_metadata, parse_filename
+    from .project_list import get_project_ids, load_project_list
+    from .qdrant import (
+        ensure_collection,
+        get_qdrant_client,
+        get_qdrant_vectorstore,
+        get_vectorstore,
+    )
+
+# The qdrant helpers load qdrant-client and llama-index, so they're only imported when used
+__getattr__, __dir__ = lazy_attributes(
+    __name__,
+    {
+        "ensure_collection": ".qdrant",
+        "get_qdrant_client": ".qdrant",
+        "get_qdrant_vectorstore": ".qdrant",
+        "get_vectorstore": ".qdrant",
+        "file_metadata": ".base",
+        "parse_filename": ".base",
+        "get_project_ids": ".project_list",
+        "load_project_list": ".project_list",
+    },
+)
+
+__all__ = [
+    "ensure_collection",
+    "get_qdrant_client",
+    "get_qdrant_vectorstore",
+    "get_vectorstore",
+    "file_metadata",
+    "parse_filename",
+    "get_project_ids",
+    "load_project_list",
+]
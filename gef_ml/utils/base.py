@@ -1,11 +1,6 @@
 import logging
 import os
 
-from gef_ml.utils.log_config import setup_logging
-
-
-setup_logging()
-
 logger = logging.getLogger(__name__)
 
 
@@ -32,7 +27,10 @@ def parse_filename(filename: str) -> tuple[str, str]:
     project_id = parts[0][1:]
     doc_id = parts[1].split(".")[0][3:]
     logger.debug(
-        "Parsed filename %s into project_id=%s, doc_id=%s", filename, project_id, doc_id
+        "Parsed filename %s into project_id=%s, doc_id=%s",
+        filename,
+        project_id,
+        doc_id,
     )
     return project_id, doc_id
 
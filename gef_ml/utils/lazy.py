@@ -0,0 +1,37 @@
+"""
+This file contains the lazy attribute loading used by the `__init__` of the gef_ml packages.
+
+The public names of a package are mapped to the submodule defining them, and the submodule is only imported when a name is first accessed. Importing a package (or any of its light submodules, like `gef_ml.utils.metrics`) therefore doesn't load llama-index, qdrant-client or the Together clients until something that needs them is used.
+"""
+
+import importlib
+from typing import Any, Callable
+
+
+def lazy_attributes(
+    package: str, attributes: dict[str, str]
+) -> tuple[Callable[[str], Any], Callable[[], list[str]]]:
+    """
+    Returns the module `__getattr__` and `__dir__` of a package whose attributes are imported on first access.
+
+    Args:
+    - package: The `__name__` of the package.
+    - attributes: The submodule (relative to the package, e.g. ".qdrant") of each public name.
+    """
+    namespace = importlib.import_module(package).__dict__
+
+    def __getattr__(name: str) -> Any:
+        if name not in attributes:
+            raise AttributeError(f"module {package!r} has no attribute {name!r}")
+        value = getattr(importlib.import_module(attributes[name], package), name)
+        # Cache it on the package so later accesses skip __getattr__
+        namespace[name] = value
+        return value
+
+    def __dir__() -> list[str]:
+        return sorted(set(namespace) | set(attributes))
+
+    return __getattr__, __dir__
+
+
+__all__ = ["lazy_attributes"]
@@ -0,0 +1,260 @@
+"""
+Local, memory-mapped alternative to querying Qdrant for every project.
+
+A collection is exported once into a directory holding:
+- `vectors.f32`: an (N, D) float32 matrix of L2-normalized vectors, sorted by project
+- `payloads.jsonl`: the point payloads, one JSON object per line in the same order
+- `index.json`: the dimension, point IDs, payload line offsets and the (offset, count) row range of every project
+
+LocalVectorStore then answers the same filtered top-k queries as `QdrantVectorStore.query` with NumPy over the project's rows, and can score many projects and queries in one matrix product. Like the Qdrant integration, which doesn't implement the MMR query mode, it always returns the plain top-k, so both backends give the LLM the same chunks.
+"""
+
+import json
+import logging
+import os
+import tempfile
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from llama_index.core.schema import BaseNode
+from llama_index.core.vector_stores.types import (
+    VectorStoreQuery,
+    VectorStoreQueryResult,
+)
+from llama_index.core.vector_stores.utils import metadata_dict_to_node
+from qdrant_client import QdrantClient
+from qdrant_client.http import models as qdrant_models
+
+logger = logging.getLogger(__name__)
+
+VECTORS_FILE = "vectors.f32"
+PAYLOADS_FILE = "payloads.jsonl"
+INDEX_FILE = "index.json"
+
+
+def export_collection(
+    qdrant_client: QdrantClient,
+    collection_name: str,
+    output_dir: str,
+    batch_size: int = 1024,
+) -> str:
+    """
+    Exports every point of a Qdrant collection into a local vector directory, returning its path.
+
+    Points are first streamed to temporary files in scroll order and then rewritten grouped by project, so memory use is bounded by one batch of vectors plus the per-point project IDs.
+    """
+    collection_dir = os.path.join(output_dir, collection_name)
+    os.makedirs(collection_dir, exist_ok=True)
+
+    project_ids: List[str] = []
+    point_ids: List[str] = []
+    dim: Optional[int] = None
+    offset = None
+
+    with tempfile.TemporaryDirectory(dir=collection_dir) as tmp_dir:
+        tmp_vectors_path = os.path.join(tmp_dir, VECTORS_FILE)
+        tmp_payloads_path = os.path.join(tmp_dir, PAYLOADS_FILE)
+        payload_offsets: List[int] = []
+
+        with open(tmp_vectors_path, "wb") as vectors_file, open(
+            tmp_payloads_path, "wb"
+        ) as payloads_file:
+            while True:
+                records, offset = qdrant_client.scroll(
+                    collection_name=collection_name,
+                    limit=batch_size,
+                    offset=offset,
+                    with_payload=True,
+                    with_vectors=True,
+                )
+                if not records:
+                    break
+
+                vectors = np.asarray([r.vector for r in records], dtype=np.float32)
+                dim = vectors.shape[1]
+                norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+                vectors /= np.where(norms == 0, 1, norms)
+                vectors_file.write(vectors.tobytes())
+
+                for r in records:
+                    payload = r.payload or {}
+                    project_ids.append(str(payload.get("project_id", "")))
+                    point_ids.append(str(r.id))
+                    payload_offsets.append(payloads_file.tell())
+                    payloads_file.write(json.dumps(payload).encode("utf-8") + b"\n")
+
+                logger.info(
+                    "Exported %d points from collection %s",
+                    len(point_ids),
+                    collection_name,
+                )
+                if offset is None:
+                    break
+
+        if dim is None:
+            raise ValueError(f"Collection {collection_name} has no points to export")
+
+        # Group the rows by project, keeping scroll order within a project
+        order = np.argsort(np.asarray(project_ids), kind="stable")
+        tmp_vectors = np.memmap(
+            tmp_vectors_path, dtype=np.float32, mode="r", shape=(len(order), dim)
+        )
+        vectors_out = np.memmap(
+            os.path.join(collection_dir, VECTORS_FILE),
+            dtype=np.float32,
+            mode="w+",
+            shape=(len(order), dim),
+        )
+        for start in range(0, len(order), batch_size * 16):
+            rows = order[start : start + batch_size * 16]
+            vectors_out[start : start + len(rows)] = tmp_vectors[rows]
+        vectors_out.flush()
+        del tmp_vectors, vectors_out
+
+        sorted_offsets = []
+        with open(tmp_payloads_path, "rb") as src, open(
+            os.path.join(collection_dir, PAYLOADS_FILE), "wb"
+        ) as dst:
+            for row in order:
+                src.seek(payload_offsets[row])
+                sorted_offsets.append(dst.tell())
+                dst.write(src.readline())
+
+    projects: Dict[str, Tuple[int, int]] = {}
+    for position, row in enumerate(order):
+        project_id = project_ids[row]
+        start, count = projects.get(project_id, (position, 0))
+        projects[project_id] = (start, count + 1)
+
+    with open(os.path.join(collection_dir, INDEX_FILE), "w") as f:
+        json.dump(
+            {
+                "collection_name": collection_name,
+                "dim": dim,
+                "point_ids": [point_ids[row] for row in order],
+                "payload_offsets": sorted_offsets,
+                "projects": projects,
+            },
+            f,
+        )
+
+    logger.info(
+        "Exported %d points for %d projects to %s",
+        len(order),
+        len(projects),
+        collection_dir,
+    )
+    return collection_dir
+
+
+def _project_id_from_filter(qdrant_filters: Optional[qdrant_models.Filter]) -> str:
+    conditions = (qdrant_filters.must or []) if qdrant_filters is not None else []
+    for condition in conditions:  # type: ignore
+        if (
+            isinstance(condition, qdrant_models.FieldCondition)
+            and condition.key == "project_id"
+            and isinstance(condition.match, qdrant_models.MatchValue)
+        ):
+            return str(condition.match.value)
+    raise ValueError("LocalVectorStore only supports queries filtered by project_id")
+
+
+class LocalVectorStore:
+    """
+    Read-only vector store over a collection exported with `export_collection`.
+
+    `query` has the same signature as `QdrantVectorStore.query`, so it can be swapped in wherever the inference functions query a project.
+    """
+
+    def __init__(self, collection_dir: str):
+        with open(os.path.join(collection_dir, INDEX_FILE)) as f:
+            index = json.load(f)
+
+        self.collection_name: str = index["collection_name"]
+        self.dim: int = index["dim"]
+        self.point_ids: List[str] = index["point_ids"]
+        self.projects: Dict[str, Tuple[int, int]] = {
+            k: tuple(v) for k, v in index["projects"].items()  # type: ignore
+        }
+        self._payload_offsets = np.asarray(index["payload_offsets"], dtype=np.int64)
+        self._payloads_path = os.path.join(collection_dir, PAYLOADS_FILE)
+        self.vectors = np.memmap(
+            os.path.join(collection_dir, VECTORS_FILE),
+            dtype=np.float32,
+            mode="r",
+            shape=(len(self.point_ids), self.dim),
+        )
+
+    def _load_nodes(self, rows: Sequence[int]) -> List[BaseNode]:
+        nodes = []
+        with open(self._payloads_path, "rb") as f:
+            for row in rows:
+                f.seek(self._payload_offsets[row])
+                nodes.append(metadata_dict_to_node(json.loads(f.readline())))
+        return nodes
+
+    def _rank(
+        self, start: int, similarities: np.ndarray, top_k: int
+    ) -> Tuple[List[int], List[float]]:
+        k = min(top_k, len(similarities))
+        rows = np.argpartition(-similarities, k - 1)[:k]
+        rows = rows[np.argsort(-similarities[rows], kind="stable")].tolist()
+        return [start + r for r in rows], [float(similarities[r]) for r in rows]
+
+    def _result(self, rows: List[int], scores: List[float]) -> VectorStoreQueryResult:
+        return VectorStoreQueryResult(
+            nodes=self._load_nodes(rows),
+            similarities=scores,
+            ids=[self.point_ids[r] for r in rows],
+        )
+
+    def query(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        project_id = _project_id_from_filter(kwargs.get("qdrant_filters"))
+        return self.query_batch(
+            [project_id],
+            [query.query_embedding],  # type: ignore
+            top_k=query.similarity_top_k,
+        )[project_id][0]
+
+    def query_batch(
+        self,
+        project_ids: Sequence[str],
+        query_embeddings: Sequence[Sequence[float]],
+        top_k: int = 20,
+    ) -> Dict[str, List[VectorStoreQueryResult]]:
+        """
+        Runs every query against every project, returning one result per query for each project.
+
+        The rows of all requested projects are scored against all queries with a single matrix product; only the ranking runs per project.
+        """
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        queries /= np.where(norms == 0, 1, norms)
+
+        ranges = [self.projects.get(p, (0, 0)) for p in project_ids]
+        rows = (
+            np.concatenate([np.arange(s, s + c) for s, c in ranges])
+            if ranges
+            else np.empty(0, dtype=np.int64)
+        )
+        all_similarities = np.asarray(self.vectors[rows]) @ queries.T
+
+        results: Dict[str, List[VectorStoreQueryResult]] = {}
+        position = 0
+        for project_id, (start, count) in zip(project_ids, ranges):
+            similarities = all_similarities[position : position + count]
+            position += count
+            project_results = []
+            for q in range(len(queries)):
+                if count == 0:
+                    project_results.append(
+                        VectorStoreQueryResult(nodes=[], similarities=[], ids=[])
+                    )
+                    continue
+                ranked_rows, scores = self._rank(start, similarities[:, q], top_k)
+                project_results.append(self._result(ranked_rows, scores))
+            results[project_id] = project_results
+        return results
+
+
+__all__ = ["LocalVectorStore", "export_collection"]
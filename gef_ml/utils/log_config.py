@@ -1,8 +1,34 @@
+"""
+Logging setup for the scripts, configured from the environment:
+
+- GEF_ML_LOG_LEVEL: Level of the console output, INFO by default.
+- GEF_ML_LOG_FILE: File to also write the logs to, none by default.
+- GEF_ML_LOG_FILE_LEVEL: Level of the file output, DEBUG by default.
+- GEF_ML_LOG_JSON: Write one JSON object per record instead of text when true.
+
+Records are put on a queue by the logging calls and written to the console and file by a listener thread, so logging never blocks a pipeline on terminal or disk I/O. The listener thread isn't copied into forked processes, e.g. the workers of a ProcessPoolExecutor, so these write their records with the console and file handlers directly. The root logger is set to the most verbose level any output needs, so `logger.debug` calls are dropped right away when no output wants them.
+
+The library modules never call `setup_logging`, importing them doesn't touch the logging configuration or the filesystem.
+"""
+
+import atexit
+import json
 import logging
+import logging.handlers
 import os
+import queue
+
 from colorlog import ColoredFormatter
 
 _already_setup = False
+_listener: logging.handlers.QueueListener | None = None
+_queue_handler: logging.handlers.QueueHandler | None = None
+
+# Attributes every LogRecord has, anything else was passed with `extra`
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {
+    "message",
+    "asctime",
+}
 
 
 class ExcludeSpecificLoggerFilter(logging.Filter):
@@ -17,21 +43,67 @@ class ExcludeSpecificLoggerFilter(logging.Filter):
         return True  # Include all other logs
 
 
-def setup_logging():
-    global _already_setup
+class JsonFormatter(logging.Formatter):
+    """Formats a record as a JSON object, including the fields passed with `extra`."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS:
+                data[key] = value
+        if record.exc_info:
+            data["exc_info"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            data["exc_info"] = record.exc_text
+        return json.dumps(data, default=str)
+
+
+def _env_flag(name: str) -> bool:
+    return os.getenv(name, "").lower() in ("1", "true", "yes")
+
+
+def _level(value: str | int) -> int:
+    if isinstance(value, int):
+        return value
+    return logging.getLevelName(value.upper())  # type: ignore
+
+
+def _log_directly():
+    """Replaces the queue handler of the root logger with the listener's handlers, in a forked child where nothing drains the queue."""
+    if _listener is None or _queue_handler is None:
+        return
+    logger = logging.getLogger()
+    logger.removeHandler(_queue_handler)
+    for handler in _listener.handlers:
+        logger.addHandler(handler)
+
+
+def setup_logging(
+    level: str | int | None = None,
+    log_file: str | None = None,
+    file_level: str | int | None = None,
+    json_format: bool | None = None,
+):
+    """
+    Configures the root logger with a console and an optional file output behind a queue. Arguments that aren't given are taken from the environment, see the module docstring. Only the first call has an effect.
+    """
+    global _already_setup, _listener, _queue_handler
     if _already_setup:
         return
 
     else:
         _already_setup = True
 
-    log_file_path = os.path.join("/home/sawyer/git/gef-ml/", "ingestion.log")
-
-    # Create a custom logger
-    logger = logging.getLogger()
-    logger.setLevel(
-        logging.DEBUG
-    )  # Set root logger to handle DEBUG and higher level logs
+    console_level = _level(level or os.getenv("GEF_ML_LOG_LEVEL", "INFO"))
+    log_file = log_file or os.getenv("GEF_ML_LOG_FILE")
+    file_level = _level(file_level or os.getenv("GEF_ML_LOG_FILE_LEVEL", "DEBUG"))
+    if json_format is None:
+        json_format = _env_flag("GEF_ML_LOG_JSON")
 
     # Define log format
     log_format = (
@@ -44,25 +116,43 @@ def setup_logging():
         "ERROR": "red",
         "CRITICAL": "red,bg_white",
     }
+    plain_format = logging.Formatter(
+        "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+    )
 
     # Console handler with colored output
     c_handler = logging.StreamHandler()
-    c_format = ColoredFormatter(log_format, log_colors=colors)
-    c_handler.setFormatter(c_format)
-    c_handler.setLevel(logging.INFO)
+    c_handler.setFormatter(
+        JsonFormatter()
+        if json_format
+        else ColoredFormatter(log_format, log_colors=colors)
+    )
+    c_handler.setLevel(console_level)
+    handlers: list[logging.Handler] = [c_handler]
 
     # File handler with standard formatting
-    f_handler = logging.FileHandler(log_file_path)
-    f_format = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
-    f_handler.setFormatter(f_format)
-    f_handler.setLevel(logging.DEBUG)
+    if log_file:
+        f_handler = logging.FileHandler(log_file)
+        f_handler.setFormatter(JsonFormatter() if json_format else plain_format)
+        f_handler.setLevel(file_level)
+        # Add a filter to exclude DEBUG logs from 'llamaindex'
+        f_handler.addFilter(ExcludeSpecificLoggerFilter("llama_index", logging.DEBUG))
+        handlers.append(f_handler)
+
+    # The handlers run on the listener thread, the logging calls only enqueue the records
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(
+        log_queue, *handlers, respect_handler_level=True
+    )
+    _listener.start()
+    atexit.register(_listener.stop)
 
-    # Add a filter to exclude DEBUG logs from 'llamaindex'
-    f_handler.addFilter(ExcludeSpecificLoggerFilter("llama_index", logging.DEBUG))
+    os.register_at_fork(after_in_child=_log_directly)
 
-    # Add handlers to the logger
-    logger.addHandler(c_handler)
-    logger.addHandler(f_handler)
+    logger = logging.getLogger()
+    logger.setLevel(min(h.level for h in handlers))
+    _queue_handler = logging.handlers.QueueHandler(log_queue)
+    logger.addHandler(_queue_handler)
 
 
-__all__ = ["setup_logging"]
+__all__ = ["setup_logging", "JsonFormatter"]
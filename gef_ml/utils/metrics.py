@@ -0,0 +1,243 @@
+"""
+This file contains the stage timers and counters of the ingestion and inference pipelines.
+
+Every timed stage (parsing, chunking, embedding, upserting, retrieval, synthesis, ...) is added to process-wide totals and, when it belongs to a project, to that project's trace. The totals can be written as Prometheus text to a file or served over HTTP, and the trace of each finished project is appended as one line to a JSONL file, so a slow project can be broken down by stage after a long run.
+
+The project a stage belongs to is either passed explicitly or taken from `project_scope`, which also covers the tasks and threads started (with `asyncio.to_thread`) inside the scope.
+"""
+
+import contextlib
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, AsyncIterator, Callable, Iterator
+
+from aiolimiter import AsyncLimiter
+
+logger = logging.getLogger(__name__)
+
+PREFIX = "gef_ml"
+
+_current_project: contextvars.ContextVar[str | None] = contextvars.ContextVar(
+    "gef_ml_current_project", default=None
+)
+
+_LabelKey = tuple[str, tuple[tuple[str, str], ...]]
+
+
+def _key(name: str, labels: dict[str, Any]) -> _LabelKey:
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(labels: tuple[tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+    escaped = [
+        (k, v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for k, v in labels
+    ]
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+
+class Metrics:
+    """
+    Thread-safe stage timers and counters.
+
+    Args:
+    - trace_path: JSONL file the trace of every finished project is appended to, None to keep no traces. The file is only opened on the first write.
+    - prometheus_path: File `flush` writes the Prometheus text to, None to not write one.
+    """
+
+    def __init__(
+        self, trace_path: str | None = None, prometheus_path: str | None = None
+    ):
+        self.trace_path = trace_path
+        self.prometheus_path = prometheus_path
+        self._lock = threading.Lock()
+        self._seconds: dict[_LabelKey, float] = defaultdict(float)
+        self._observations: dict[_LabelKey, int] = defaultdict(int)
+        self._counters: dict[_LabelKey, float] = defaultdict(float)
+        self._traces: dict[str, dict[str, Any]] = {}
+
+    def _trace(self, project_id: str) -> dict[str, Any]:
+        # Called with the lock held
+        if project_id not in self._traces:
+            self._traces[project_id] = {
+                "project_id": project_id,
+                "started_at": time.time(),
+                "seconds": defaultdict(float),
+                "counts": defaultdict(int),
+            }
+        return self._traces[project_id]
+
+    def observe(self, stage: str, seconds: float, project_id: str | None = None):
+        """Adds the duration of one run of a stage."""
+        project_id = project_id or _current_project.get()
+        with self._lock:
+            key = _key("stage_seconds", {"stage": stage})
+            self._seconds[key] += seconds
+            self._observations[key] += 1
+            if project_id is not None:
+                self._trace(project_id)["seconds"][stage] += seconds
+
+    def increment(
+        self, name: str, value: float = 1, project_id: str | None = None, **labels: Any
+    ):
+        """Adds to a counter, and to the project's trace when the counter belongs to a project."""
+        project_id = project_id or _current_project.get()
+        with self._lock:
+            self._counters[_key(name, labels)] += value
+            if project_id is not None:
+                self._trace(project_id)["counts"][name] += value
+
+    @contextlib.contextmanager
+    def timer(self, stage: str, project_id: str | None = None) -> Iterator[None]:
+        """Times the block as a run of `stage`, also when it raises."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start, project_id)
+
+    @contextlib.asynccontextmanager
+    async def limiter_wait(
+        self, limiter: AsyncLimiter, name: str
+    ) -> AsyncIterator[None]:
+        """Acquires the limiter, recording the time spent waiting for capacity as `<name>_limiter_wait`."""
+        start = time.perf_counter()
+        async with limiter:
+            self.observe(f"{name}_limiter_wait", time.perf_counter() - start)
+            yield
+
+    def backoff_handler(self, name: str) -> Callable[[dict], None]:
+        """Returns an `on_backoff` handler for the `backoff` decorators that counts retries and the time slept before them."""
+
+        def on_backoff(details: dict):
+            self.increment("retries", target=name)
+            self.observe(f"{name}_backoff", details.get("wait") or 0.0)
+
+        return on_backoff
+
+    def finish_project(self, project_id: str, status: str = "done", **fields: Any):
+        """Appends the trace of a project to the trace file and drops it from memory."""
+        with self._lock:
+            trace = self._traces.pop(project_id, None)
+        if trace is None:
+            trace = {"project_id": project_id, "started_at": time.time()}
+        trace.update(fields)
+        trace["status"] = status
+        trace["finished_at"] = time.time()
+        trace["wall_seconds"] = trace["finished_at"] - trace["started_at"]
+
+        if self.trace_path is None:
+            return
+        line = json.dumps(trace, default=str)
+        with self._lock:
+            with open(self.trace_path, "a") as f:
+                f.write(line + "\n")
+
+    def stage_seconds(self) -> dict[str, float]:
+        """Returns the total seconds spent in each stage."""
+        with self._lock:
+            return {
+                dict(labels)["stage"]: s for (_, labels), s in self._seconds.items()
+            }
+
+    def reset(self):
+        with self._lock:
+            self._seconds.clear()
+            self._observations.clear()
+            self._counters.clear()
+            self._traces.clear()
+
+    def prometheus_text(self) -> str:
+        """Renders the totals in the Prometheus text exposition format."""
+        with self._lock:
+            seconds = dict(self._seconds)
+            observations = dict(self._observations)
+            counters = dict(self._counters)
+
+        lines = [
+            f"# HELP {PREFIX}_stage_seconds Time spent in each pipeline stage.",
+            f"# TYPE {PREFIX}_stage_seconds summary",
+        ]
+        for key, total in sorted(seconds.items()):
+            labels = _format_labels(key[1])
+            lines.append(f"{PREFIX}_stage_seconds_sum{labels} {total}")
+            lines.append(f"{PREFIX}_stage_seconds_count{labels} {observations[key]}")
+
+        for name in sorted({name for name, _ in counters}):
+            lines.append(f"# TYPE {PREFIX}_{name}_total counter")
+            for (counter, labels), value in sorted(counters.items()):
+                if counter == name:
+                    lines.append(
+                        f"{PREFIX}_{name}_total{_format_labels(labels)} {value}"
+                    )
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str):
+        """Writes the Prometheus text to a file, e.g. for the node exporter's textfile collector. The file is replaced atomically."""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp_path, path)
+
+    def flush(self):
+        """Writes the Prometheus text to `prometheus_path` if it is set, called at the end of every ingestion and inference run."""
+        if self.prometheus_path is not None:
+            self.write_prometheus(self.prometheus_path)
+
+    def serve_prometheus(
+        self, port: int, host: str = "127.0.0.1"
+    ) -> ThreadingHTTPServer:
+        """Serves the Prometheus text at `/metrics` from a daemon thread. Call `shutdown()` on the returned server to stop it."""
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.prometheus_text().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        logger.info("Serving metrics on http://%s:%d/metrics", host, port)
+        return server
+
+
+@contextlib.contextmanager
+def project_scope(project_id: str) -> Iterator[None]:
+    """Attributes the stages and counters recorded inside the block (without an explicit project) to a project."""
+    token = _current_project.set(project_id)
+    try:
+        yield
+    finally:
+        _current_project.reset(token)
+
+
+def current_project() -> str | None:
+    return _current_project.get()
+
+
+# Process-wide metrics, written to the files in GEF_ML_METRICS_TRACE and GEF_ML_METRICS_PROM if they are set
+metrics = Metrics(
+    trace_path=os.getenv("GEF_ML_METRICS_TRACE"),
+    prometheus_path=os.getenv("GEF_ML_METRICS_PROM"),
+)
+
+
+__all__ = ["Metrics", "metrics", "project_scope", "current_project"]
@@ -0,0 +1,58 @@
+"""
+Cached loading of the IEO project list workbook.
+
+Parsing the workbook with openpyxl takes a few seconds, so the sheet is stored once as a pandas pickle next to it and read from there while the workbook is unchanged.
+"""
+
+import logging
+import os
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+def project_list_cache_path(excel_path: str, sheet_name: str) -> str:
+    """The cache file of a sheet, next to the workbook."""
+    return f"{os.path.splitext(excel_path)[0]}.{sheet_name}.pkl"
+
+
+def load_project_list(
+    excel_path: str, sheet_name: str = "projectlist", cache: bool = True
+) -> pd.DataFrame:
+    """
+    Returns a sheet of the project list workbook with "GEF ID" as strings, from the cache file when it is newer than the workbook.
+
+    Args:
+    - cache: Whether to read and write the cache file, False to always parse the workbook.
+    """
+    cache_path = project_list_cache_path(excel_path, sheet_name)
+    if (
+        cache
+        and os.path.exists(cache_path)
+        and os.path.getmtime(cache_path) >= os.path.getmtime(excel_path)
+    ):
+        return pd.read_pickle(cache_path)
+
+    df = pd.read_excel(io=excel_path, sheet_name=sheet_name)
+    df["GEF ID"] = df["GEF ID"].astype(str)
+    if cache:
+        # Write to a temporary file first so concurrent readers never see a partial cache
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        df.to_pickle(tmp_path)
+        os.replace(tmp_path, cache_path)
+        logger.info(f"Cached sheet {sheet_name} of {excel_path} in {cache_path}")
+    return df
+
+
+def get_project_ids(
+    excel_path: str, gef_phase: int, sheet_name: str = "projectlist"
+) -> list[str]:
+    """Returns the IDs of the projects of a GEF phase in the project list."""
+    df = load_project_list(excel_path, sheet_name)
+    return df.loc[
+        df["GEF Phase"].astype(str).str.contains(f"GEF - {gef_phase}"), "GEF ID"
+    ].tolist()
+
+
+__all__ = ["get_project_ids", "load_project_list", "project_list_cache_path"]
@@ -1,18 +1,297 @@
+import logging
+import os
+from typing import TYPE_CHECKING, Any, List, Optional, Sequence
+
+from llama_index.core.schema import BaseNode
 from llama_index.vector_stores.qdrant import QdrantVectorStore
 from qdrant_client import QdrantClient
-from qdrant_client.http.models import Distance, VectorParams
+from qdrant_client.http.models import (
+    BinaryQuantization,
+    BinaryQuantizationConfig,
+    Distance,
+    PayloadSchemaType,
+    QuantizationConfig,
+    QuantizationSearchParams,
+    ScalarQuantization,
+    ScalarQuantizationConfig,
+    ScalarType,
+    SearchParams,
+    SearchRequest,
+    VectorParams,
+)
+
+if TYPE_CHECKING:
+    from .local_vectors import LocalVectorStore
+
+logger = logging.getLogger(__name__)
+
+QDRANT_URL = os.getenv("QDRANT_URL", "http://localhost:6333")
+QDRANT_GRPC_PORT = int(os.getenv("QDRANT_GRPC_PORT", "6334"))
+
+# Payload fields that retrieval filters on, indexed so filtering doesn't scan every point
+PAYLOAD_INDEX_FIELDS = ("project_id", "doc_id")
+
+
+# Storage options for collections, see `quantization_config`
+QUANTIZATION_CHOICES = ("none", "scalar", "binary")
+
+
+def get_qdrant_client(
+    url: str | None = None,
+    prefer_grpc: bool | None = None,
+    grpc_port: int = QDRANT_GRPC_PORT,
+    **kwargs: Any,
+) -> QdrantClient:
+    """
+    Get a QdrantClient for the given URL, defaulting to the `QDRANT_URL` environment variable. gRPC is used when `prefer_grpc` is set or, when it isn't given, the `QDRANT_PREFER_GRPC` environment variable is true.
+    """
+    if prefer_grpc is None:
+        prefer_grpc = os.getenv("QDRANT_PREFER_GRPC", "").lower() in ("1", "true")
+    return QdrantClient(
+        url or QDRANT_URL, prefer_grpc=prefer_grpc, grpc_port=grpc_port, **kwargs
+    )
+
+
+def ensure_payload_indexes(
+    qdrant_client: QdrantClient,
+    collection_name: str,
+    fields: Sequence[str] = PAYLOAD_INDEX_FIELDS,
+):
+    """Creates keyword payload indexes on the given fields. Indexes that already exist are left as they are."""
+    existing = qdrant_client.get_collection(collection_name).payload_schema or {}
+    for field in fields:
+        if field not in existing:
+            logger.info(
+                "Creating payload index on %s for collection %s", field, collection_name
+            )
+            qdrant_client.create_payload_index(
+                collection_name=collection_name,
+                field_name=field,
+                field_schema=PayloadSchemaType.KEYWORD,
+                wait=True,
+            )
+
+
+def quantization_config(quantization: str | None) -> QuantizationConfig | None:
+    """
+    Get the Qdrant quantization config for a storage option: "scalar" keeps int8 vectors in RAM (4x smaller), "binary" keeps one bit per dimension (32x smaller) and "none" or None keeps the float32 vectors.
+    """
+    if quantization in (None, "none"):
+        return None
+    if quantization == "scalar":
+        return ScalarQuantization(
+            scalar=ScalarQuantizationConfig(
+                type=ScalarType.INT8, quantile=0.99, always_ram=True
+            )
+        )
+    if quantization == "binary":
+        return BinaryQuantization(binary=BinaryQuantizationConfig(always_ram=True))
+    raise ValueError(
+        f"Unknown quantization: {quantization}, expected one of {QUANTIZATION_CHOICES}"
+    )
+
+
+def ensure_collection(
+    qdrant_client: QdrantClient,
+    collection_name: str,
+    vector_size: int,
+    distance: Distance = Distance.COSINE,
+    payload_index_fields: Sequence[str] = PAYLOAD_INDEX_FIELDS,
+    quantization: str | None = None,
+) -> bool:
+    """
+    Creates the collection with explicit vector params if it doesn't exist and makes sure its payload indexes exist. Returns True if the collection was created.
+
+    With a `quantization` option the quantized vectors are kept in RAM and the original vectors on disk, where they are only read to rescore the candidates of a search.
+    """
+    created = False
+    if not qdrant_client.collection_exists(collection_name):
+        logger.info(
+            "Creating collection %s with %d dimensional %s vectors (quantization: %s)",
+            collection_name,
+            vector_size,
+            distance,
+            quantization or "none",
+        )
+        config = quantization_config(quantization)
+        qdrant_client.create_collection(
+            collection_name=collection_name,
+            vectors_config=VectorParams(
+                size=vector_size, distance=distance, on_disk=config is not None
+            ),
+            quantization_config=config,
+        )
+        created = True
+    ensure_payload_indexes(qdrant_client, collection_name, payload_index_fields)
+    return created
+
+
+class _SearchParamsClient:
+    """
+    Wraps a sync or async Qdrant client so its searches use `search_params` unless they set their own. Everything else is passed through to the client.
+    """
+
+    def __init__(self, client: Any, search_params: SearchParams):
+        self._client = client
+        self._search_params = search_params
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._client, name)
+
+    def search(self, *args: Any, **kwargs: Any) -> Any:
+        if kwargs.get("search_params") is None:
+            kwargs["search_params"] = self._search_params
+        return self._client.search(*args, **kwargs)
+
+    def search_batch(
+        self, collection_name: str, requests: Sequence[SearchRequest], **kwargs: Any
+    ) -> Any:
+        requests = [
+            (
+                request
+                if request.params is not None
+                else request.model_copy(update={"params": self._search_params})
+            )
+            for request in requests
+        ]
+        return self._client.search_batch(
+            collection_name=collection_name, requests=requests, **kwargs
+        )
+
+
+class GefQdrantVectorStore(QdrantVectorStore):
+    """
+    QdrantVectorStore that creates its collection with `ensure_collection` and can upload points without waiting for each batch to be applied.
+
+    Searches of a quantized collection oversample the quantized vectors and rescore the candidates with the original vectors. The search params are added to the client's searches, so queries still go through the parent's handling of query modes and filters.
+    """
+
+    wait: bool = True
+    quantization: Optional[str] = None
+    rescore_oversampling: float = 2.0
+    search_params: Optional[Any] = None
+
+    def __init__(
+        self,
+        *args: Any,
+        wait: bool = True,
+        quantization: str | None = None,
+        rescore_oversampling: float = 2.0,
+        **kwargs: Any,
+    ):
+        super().__init__(*args, **kwargs)
+        self.wait = wait
+        self.quantization = quantization
+        self.rescore_oversampling = rescore_oversampling
+        if self._collection_initialized:
+            ensure_payload_indexes(self._client, self.collection_name)
+            self._set_search_params()
+
+    def _set_search_params(self):
+        # The collection's own config decides, so readers don't need to know how it was created
+        info = self._client.get_collection(self.collection_name)
+        if info.config.quantization_config is not None:
+            self._use_search_params(
+                SearchParams(
+                    quantization=QuantizationSearchParams(
+                        rescore=True, oversampling=self.rescore_oversampling
+                    )
+                )
+            )
+
+    def _use_search_params(self, search_params: SearchParams):
+        self.search_params = search_params
+        if isinstance(self._client, _SearchParamsClient):
+            self._client = self._client._client
+        self._client = _SearchParamsClient(self._client, search_params)
+        if self._aclient is not None:
+            if isinstance(self._aclient, _SearchParamsClient):
+                self._aclient = self._aclient._client
+            self._aclient = _SearchParamsClient(self._aclient, search_params)
+
+    def _create_collection(self, collection_name: str, vector_size: int) -> None:
+        ensure_collection(
+            self._client, collection_name, vector_size, quantization=self.quantization
+        )
+        self._collection_initialized = True
+        self._set_search_params()
+
+    def add(self, nodes: List[BaseNode], **add_kwargs: Any) -> List[str]:
+        if len(nodes) > 0 and not self._collection_initialized:
+            self._create_collection(
+                collection_name=self.collection_name,
+                vector_size=len(nodes[0].get_embedding()),
+            )
+
+        points, ids = self._build_points(nodes)
+
+        self._client.upload_points(
+            collection_name=self.collection_name,
+            points=points,
+            batch_size=self.batch_size,
+            parallel=self.parallel,
+            max_retries=self.max_retries,
+            wait=self.wait,
+        )
+
+        return ids
 
 
 def get_qdrant_vectorstore(
-    collection_name: str, qdrant_client: QdrantClient | None = None
+    collection_name: str,
+    qdrant_client: QdrantClient | None = None,
+    batch_size: int = 64,
+    parallel: int = 1,
+    wait: bool = True,
+    quantization: str | None = None,
 ) -> QdrantVectorStore:
-    """Get a QdrantVectorStore instance for a given collection name. If a QdrantClient is not provided, a new one will be created."""
+    """
+    Get a QdrantVectorStore instance for a given collection name. If a QdrantClient is not provided, a new one will be created.
+
+    Args:
+    - batch_size: The number of points per upsert request.
+    - parallel: The number of processes uploading batches at once.
+    - wait: Whether each upsert waits until the points are applied. Without waiting, Qdrant applies the batches in order in the background while the next ones are sent.
+    - quantization: The storage option used if the collection is created, one of `QUANTIZATION_CHOICES`.
+    """
 
     if qdrant_client is None:
-        qdrant_client = QdrantClient("http://localhost:6333")
+        qdrant_client = get_qdrant_client()
 
-    vector_store = QdrantVectorStore(
-        client=qdrant_client, collection_name=collection_name
+    vector_store = GefQdrantVectorStore(
+        client=qdrant_client,
+        collection_name=collection_name,
+        batch_size=batch_size,
+        parallel=parallel,
+        wait=wait,
+        quantization=quantization,
     )
 
     return vector_store
+
+
+def get_vectorstore(
+    collection_name: str,
+    qdrant_client: QdrantClient | None = None,
+    backend: str | None = None,
+    local_vectors_dir: str | None = None,
+) -> "QdrantVectorStore | LocalVectorStore":
+    """
+    Get a vector store for a collection from the configured backend.
+
+    The backend is "qdrant" (default) or "local", taken from the `GEF_ML_VECTOR_BACKEND` environment variable when not given. The local backend reads collections exported by `gef_ml.utils.local_vectors.export_collection` from `local_vectors_dir`, or `GEF_ML_LOCAL_VECTORS_DIR`.
+    """
+    backend = backend or os.getenv("GEF_ML_VECTOR_BACKEND", "qdrant")
+
+    if backend == "qdrant":
+        return get_qdrant_vectorstore(collection_name, qdrant_client=qdrant_client)
+
+    if backend == "local":
+        from .local_vectors import LocalVectorStore
+
+        directory = local_vectors_dir or os.getenv(
+            "GEF_ML_LOCAL_VECTORS_DIR", "../data/local_vectors"
+        )
+        return LocalVectorStore(os.path.join(directory, collection_name))
+
+    raise ValueError(f"Unknown vector store backend: {backend}")
@@ -0,0 +1,108 @@
+"""
+Import time benchmark of the gef_ml modules.
+
+Every module is imported in fresh interpreters without TOGETHER_API_KEY set, so the timings are cold-start costs as seen by a CLI tool or a worker process, and a module that still needs credentials at import time shows up as a failure. `--profile` prints the slowest imports of one module from `python -X importtime`.
+"""
+
+import argparse
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from gef_ml.utils.log_config import setup_logging
+
+setup_logging()
+
+logger = logging.getLogger(__name__)
+
+MODULES = [
+    "gef_ml",
+    "gef_ml.utils",
+    "gef_ml.utils.metrics",
+    "gef_ml.ingestion",
+    "gef_ml.inference",
+    "gef_ml.benchmark",
+    "gef_ml.utils.qdrant",
+    "gef_ml.ingestion.streaming_ingestion",
+    "gef_ml.inference.context",
+    "gef_ml.inference.batch",
+]
+
+# Measures the import itself, without the interpreter startup
+_IMPORT_SNIPPET = (
+    "import time; start = time.perf_counter(); import {module}; "
+    "print(time.perf_counter() - start)"
+)
+
+
+def _env() -> dict[str, str]:
+    env = {k: v for k, v in os.environ.items() if k != "TOGETHER_API_KEY"}
+    repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env["PYTHONPATH"] = os.pathsep.join(
+        p for p in [repo_root, env.get("PYTHONPATH")] if p
+    )
+    return env
+
+
+def time_import(module: str) -> tuple[float, float] | None:
+    """Returns the seconds the import and the whole process took, or None if the import failed."""
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-c", _IMPORT_SNIPPET.format(module=module)],
+        env=_env(),
+        capture_output=True,
+        text=True,
+    )
+    process_seconds = time.perf_counter() - start
+    if result.returncode != 0:
+        logger.error(
+            "Importing %s failed: %s", module, result.stderr.strip().splitlines()[-1]
+        )
+        return None
+    return float(result.stdout.strip().splitlines()[-1]), process_seconds
+
+
+def profile_import(module: str, top: int = 20):
+    """Logs the imports with the largest cumulative time from `python -X importtime`."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        env=_env(),
+        capture_output=True,
+        text=True,
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        rows.append((int(cumulative), name.strip()))
+    for cumulative, name in sorted(rows, reverse=True)[:top]:
+        logger.info(f"{cumulative / 1e6:>8.3f}s  {name}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("modules", nargs="*", default=MODULES)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--profile", help="Module to print the slowest imports of")
+    args = parser.parse_args()
+
+    logger.info(f"{'module':<40} {'import s':>9} {'process s':>10}")
+    for module in args.modules:
+        timings = [time_import(module) for _ in range(args.runs)]
+        if any(t is None for t in timings):
+            logger.info(f"{module:<40} {'failed':>9}")
+            continue
+        import_seconds = statistics.median(t[0] for t in timings)  # type: ignore
+        process_seconds = statistics.median(t[1] for t in timings)  # type: ignore
+        logger.info(f"{module:<40} {import_seconds:>9.3f} {process_seconds:>10.3f}")
+
+    if args.profile:
+        profile_import(args.profile)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+"""
+Recall vs memory benchmark of the collection storage options.
+
+The points of a fixed sample of projects are copied from an existing collection into one collection per storage option. A fixed sample of the copied chunk vectors is then used as queries filtered to their project, and the top-k results of each option are compared with an exact search over the float32 vectors. The quantized options are searched through `GefQdrantVectorStore.query`, the path retrieval uses. Needs a Qdrant server, the local mode ignores quantization.
+
+With `SIMULATE=1` no server is needed: the search of each option (int8 scalar quantization at the 0.99 quantile, or sign bits compared by Hamming distance, each oversampled 2x and rescored with the float32 vectors) is reproduced with NumPy on synthetic clustered embeddings, which gives the recall but not Qdrant's latency. Simulated results, 768 dimensions, 50 projects of 200 chunks, 500 queries:
+
+    storage   recall@20
+    none         1.0000
+    scalar       0.9919
+    binary       0.5042
+
+The shared component of the synthetic embeddings fixes most sign bits, so binary storage loses half of the top 20 at 2x oversampling. It should be checked against a real collection on a server before it is used.
+"""
+
+import logging
+import os
+import random
+import time
+
+import numpy as np
+from llama_index.core.vector_stores import VectorStoreQuery
+from qdrant_client import QdrantClient
+from qdrant_client.http import models as qdrant_models
+
+from gef_ml.utils import ensure_collection, get_qdrant_client
+from gef_ml.utils.log_config import setup_logging
+from gef_ml.utils.qdrant import QUANTIZATION_CHOICES, get_qdrant_vectorstore
+
+setup_logging()
+
+logger = logging.getLogger(__name__)
+
+SOURCE_COLLECTION = os.getenv("SOURCE_COLLECTION", "gef_6_1024_96_2")
+NUM_PROJECTS = int(os.getenv("NUM_PROJECTS", "50"))
+QUERIES_PER_PROJECT = int(os.getenv("QUERIES_PER_PROJECT", "10"))
+TOP_K = 20
+# Fixed so every run benchmarks the same projects and queries
+SEED = 0
+
+# Bytes per dimension held in RAM by each storage option, the originals of the quantized options stay on disk
+RAM_BYTES_PER_DIM = {"none": 4.0, "scalar": 1.0, "binary": 1 / 8}
+
+
+def _project_filter(project_id: str) -> qdrant_models.Filter:
+    return qdrant_models.Filter(
+        must=[
+            qdrant_models.FieldCondition(
+                key="project_id", match=qdrant_models.MatchValue(value=project_id)
+            )
+        ]
+    )
+
+
+def sample_project_ids(client: QdrantClient, collection_name: str) -> list[str]:
+    project_ids = set()
+    offset = None
+    while True:
+        records, offset = client.scroll(
+            collection_name,
+            limit=4096,
+            offset=offset,
+            with_payload=["project_id"],
+            with_vectors=False,
+        )
+        project_ids.update(str((r.payload or {}).get("project_id")) for r in records)
+        if offset is None:
+            break
+    project_ids = sorted(project_ids)
+    return random.Random(SEED).sample(project_ids, min(NUM_PROJECTS, len(project_ids)))
+
+
+def load_project_points(
+    client: QdrantClient, collection_name: str, project_id: str
+) -> list[qdrant_models.Record]:
+    points = []
+    offset = None
+    while True:
+        records, offset = client.scroll(
+            collection_name,
+            scroll_filter=_project_filter(project_id),
+            limit=1024,
+            offset=offset,
+            with_payload=True,
+            with_vectors=True,
+        )
+        points.extend(records)
+        if offset is None:
+            return points
+
+
+def build_collection(
+    client: QdrantClient,
+    name: str,
+    quantization: str,
+    points: list[qdrant_models.Record],
+):
+    if client.collection_exists(name):
+        client.delete_collection(name)
+    ensure_collection(client, name, len(points[0].vector), quantization=quantization)  # type: ignore
+    client.upload_points(
+        name,
+        points=[
+            qdrant_models.PointStruct(id=p.id, vector=p.vector, payload=p.payload)  # type: ignore
+            for p in points
+        ],
+        batch_size=256,
+        wait=True,
+    )
+
+
+def exact_search(
+    client: QdrantClient, name: str, project_id: str, vector: list[float]
+) -> list:
+    """Full scan over the original float32 vectors, the ground truth for every option."""
+    hits = client.search(
+        name,
+        query_vector=vector,
+        query_filter=_project_filter(project_id),
+        limit=TOP_K,
+        search_params=qdrant_models.SearchParams(
+            exact=True, quantization=qdrant_models.QuantizationSearchParams(ignore=True)
+        ),
+    )
+    return [str(h.id) for h in hits]
+
+
+def simulate():
+    """Recall of each option from a NumPy reproduction of its search, see the module docstring."""
+    rng = np.random.default_rng(SEED)
+    dim, chunks_per_project, oversampling = 768, 200, 2.0
+    # Embeddings of one model share a large common component, and the chunks of a project are close together
+    common = rng.standard_normal(dim)
+    vectors, queries = [], []
+    for _ in range(NUM_PROJECTS):
+        center = common + 0.8 * rng.standard_normal(dim)
+        project = center + 0.9 * rng.standard_normal((chunks_per_project, dim))
+        project /= np.linalg.norm(project, axis=1, keepdims=True)
+        vectors.append(project)
+        queries += [
+            (len(vectors) - 1, project[i])
+            for i in rng.choice(chunks_per_project, QUERIES_PER_PROJECT, replace=False)
+        ]
+
+    def quantized_scores(quantization: str, project: np.ndarray, query: np.ndarray):
+        if quantization == "scalar":
+            low, high = np.quantile(project, [0.005, 0.995])
+            step = (high - low) / 255
+            codes = np.round((np.clip(project, low, high) - low) / step)
+            return (codes * step + low) @ query
+        return (np.sign(project) == np.sign(query)).sum(axis=1)
+
+    results = {}
+    for quantization in QUANTIZATION_CHOICES:
+        recalls = []
+        for project_index, query in queries:
+            project = vectors[project_index]
+            exact = project @ query
+            expected = set(np.argsort(-exact, kind="stable")[:TOP_K])
+            if quantization == "none":
+                found = expected
+            else:
+                scores = quantized_scores(quantization, project, query)
+                candidates = np.argsort(-scores, kind="stable")[
+                    : int(TOP_K * oversampling)
+                ]
+                found = set(candidates[np.argsort(-exact[candidates])[:TOP_K]])
+            recalls.append(len(expected & found) / TOP_K)
+        results[quantization] = float(np.mean(recalls))
+
+    logger.info(
+        f"Simulated {NUM_PROJECTS * chunks_per_project} points of {NUM_PROJECTS} projects with {len(queries)} queries"
+    )
+    logger.info(f"{'storage':<8} {'recall@' + str(TOP_K):>10}")
+    for quantization, recall in results.items():
+        logger.info(f"{quantization:<8} {recall:>10.4f}")
+
+
+def main():
+    if os.getenv("SIMULATE", "").lower() in ("1", "true"):
+        simulate()
+        return
+
+    client = get_qdrant_client()
+    rng = random.Random(SEED)
+
+    project_ids = sample_project_ids(client, SOURCE_COLLECTION)
+    points = []
+    queries = []
+    for project_id in project_ids:
+        project_points = load_project_points(client, SOURCE_COLLECTION, project_id)
+        points.extend(project_points)
+        for p in rng.sample(
+            project_points, min(QUERIES_PER_PROJECT, len(project_points))
+        ):
+            queries.append((project_id, p.vector))
+    dim = len(points[0].vector)  # type: ignore
+    logger.info(
+        f"Benchmarking {len(points)} points of {len(project_ids)} projects with {len(queries)} queries"
+    )
+
+    results = {}
+    for quantization in QUANTIZATION_CHOICES:
+        name = f"bench_quantization_{quantization}"
+        build_collection(client, name, quantization, points)
+        vector_store = get_qdrant_vectorstore(name, client)
+
+        recalls = []
+        latencies = []
+        for project_id, vector in queries:
+            expected = set(exact_search(client, name, project_id, vector))
+            start = time.perf_counter()
+            result = vector_store.query(
+                VectorStoreQuery(query_embedding=vector, similarity_top_k=TOP_K),
+                qdrant_filters=_project_filter(project_id),
+            )
+            latencies.append(time.perf_counter() - start)
+            found = result.ids or []
+            recalls.append(len(expected.intersection(found)) / max(len(expected), 1))
+
+        results[quantization] = (
+            float(np.mean(recalls)),
+            float(np.percentile(latencies, 50) * 1000),
+            len(points) * dim * RAM_BYTES_PER_DIM[quantization] / 2**20,
+        )
+        client.delete_collection(name)
+
+    logger.info(
+        f"{'storage':<8} {'recall@' + str(TOP_K):>10} {'p50 ms':>8} {'RAM MiB':>8}"
+    )
+    for quantization, (recall, p50, ram) in results.items():
+        logger.info(f"{quantization:<8} {recall:>10.4f} {p50:>8.2f} {ram:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Benchmark of FastSentenceSplitter against llama-index's SentenceSplitter, on the GEF PDFs in notebooks/ or the projects of a downloaded corpus.
+
+Both splitters chunk the same documents with each chunk size, the chunks are checked to be identical and the throughput of each is reported in chunks per second.
+"""
+
+import argparse
+import glob
+import logging
+import os
+import time
+
+from llama_index.core import SimpleDirectoryReader
+from llama_index.core.node_parser import SentenceSplitter
+from llama_index.core.schema import Document
+
+from gef_ml.ingestion.parsing import load_documents
+from gef_ml.ingestion.pipeline import assign_document_ids, deterministic_node_id
+from gef_ml.ingestion.splitter import FastSentenceSplitter
+from gef_ml.utils.log_config import setup_logging
+
+setup_logging()
+
+logger = logging.getLogger(__name__)
+
+NOTEBOOKS_DIR = os.path.join(os.path.dirname(__file__), "..", "notebooks")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--directory",
+        help="Corpus directory with one subdirectory per project, instead of the notebook PDFs",
+    )
+    parser.add_argument("--max-projects", type=int, default=20)
+    parser.add_argument(
+        "--chunk-sizes", type=int, nargs="+", default=[256, 512, 1024, 2048]
+    )
+    parser.add_argument("--overlap-ratio", type=float, default=0.1)
+    parser.add_argument("--num-threads", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--runs", type=int, default=3)
+    return parser.parse_args()
+
+
+def load_corpus(directory: str | None, max_projects: int) -> list[Document]:
+    if directory is None:
+        files = sorted(glob.glob(os.path.join(NOTEBOOKS_DIR, "*.pdf")))
+        documents = SimpleDirectoryReader(input_files=files).load_data()
+    else:
+        documents = []
+        for project_id in sorted(os.listdir(directory))[:max_projects]:
+            project_dir = os.path.join(directory, project_id)
+            if os.path.isdir(project_dir):
+                documents += assign_document_ids(load_documents(project_dir))
+    logger.info(
+        f"Loaded {len(documents)} documents ({sum(len(d.text) for d in documents):,} characters)"
+    )
+    return documents
+
+
+def best_time(splitter: SentenceSplitter, documents: list[Document], runs: int):
+    """Returns the nodes and the fastest of `runs` passes over the documents."""
+    best = float("inf")
+    for _ in range(runs):
+        start = time.perf_counter()
+        nodes = splitter(documents)
+        best = min(best, time.perf_counter() - start)
+    return nodes, best
+
+
+def main():
+    args = parse_args()
+    documents = load_corpus(args.directory, args.max_projects)
+
+    logger.info(
+        f"{'chunk size':>10} {'chunks':>7} {'legacy chunks/s':>16} {'fast chunks/s':>14} {'speedup':>8}"
+    )
+    for chunk_size in args.chunk_sizes:
+        chunk_overlap = int(chunk_size * args.overlap_ratio)
+        legacy = SentenceSplitter(
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            id_func=deterministic_node_id,
+        )
+        fast = FastSentenceSplitter(
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            id_func=deterministic_node_id,
+            num_threads=args.num_threads,
+        )
+        legacy_nodes, legacy_seconds = best_time(legacy, documents, args.runs)
+        fast_nodes, fast_seconds = best_time(fast, documents, args.runs)
+        assert [n.to_dict() for n in fast_nodes] == [
+            n.to_dict() for n in legacy_nodes
+        ], f"FastSentenceSplitter chunks differ with chunk size {chunk_size}"
+
+        logger.info(
+            f"{chunk_size:>10} {len(fast_nodes):>7} {len(legacy_nodes) / legacy_seconds:>16.0f} {len(fast_nodes) / fast_seconds:>14.0f} {legacy_seconds / fast_seconds:>7.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
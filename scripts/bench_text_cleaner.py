@@ -0,0 +1,64 @@
+"""Micro-benchmark of the single-pass TextCleaner against the previous multi-pass implementation, on the sample PDFs and markdown in notebooks/."""
+
+import glob
+import logging
+import os
+import time
+
+from llama_index.core import SimpleDirectoryReader
+from llama_index.core.schema import Document
+
+from gef_ml.benchmark.legacy import legacy_clean
+from gef_ml.ingestion.text_cleaner import TextCleaner
+from gef_ml.utils.log_config import setup_logging
+
+setup_logging()
+
+logger = logging.getLogger(__name__)
+
+NOTEBOOKS_DIR = os.path.join(os.path.dirname(__file__), "..", "notebooks")
+REPEATS = int(os.getenv("REPEATS", "50"))
+
+
+def load_texts() -> list[str]:
+    files = sorted(
+        glob.glob(os.path.join(NOTEBOOKS_DIR, "*.pdf"))
+        + glob.glob(os.path.join(NOTEBOOKS_DIR, "*.md"))
+    )
+    documents = SimpleDirectoryReader(input_files=files).load_data()
+    texts = [d.text for d in documents]
+    logger.info(
+        f"Loaded {len(texts)} documents ({sum(map(len, texts)):,} characters) from {len(files)} files"
+    )
+    return texts
+
+
+def time_it(fn, repeats: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    return (time.perf_counter() - start) / repeats
+
+
+def main():
+    texts = load_texts()
+    # Control characters and non-breaking spaces are rare in the samples, so add some
+    texts += [t.replace(" ", "\u00a0", 200).replace("\n", "\x0c\n", 50) for t in texts]
+
+    expected = [legacy_clean(t) for t in texts]
+    cleaned = TextCleaner()([Document(text=t) for t in texts])
+    assert [n.text for n in cleaned] == expected, "TextCleaner output changed"
+
+    legacy = time_it(lambda: [legacy_clean(t) for t in texts], REPEATS)
+    single = time_it(lambda: TextCleaner()([Document(text=t) for t in texts]), REPEATS)
+    nodes_only = time_it(lambda: [Document(text=t) for t in texts], REPEATS)
+
+    logger.info(f"Legacy cleaner:      {legacy * 1000:.2f} ms per pass")
+    logger.info(
+        f"Single-pass cleaner: {single * 1000:.2f} ms per pass ({(single - nodes_only) * 1000:.2f} ms excluding Document construction)"
+    )
+    logger.info(f"Speedup: {legacy / max(single - nodes_only, 1e-9):.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,22 @@
-import csv
+import asyncio
 import logging
+import os
 
-import pandas as pd
 from dotenv import load_dotenv
-from tqdm import tqdm
 
 load_dotenv()
 
 from gef_ml.inference import (
-    determine_private_sector_involvement,
-    generate_private_sector_summary,
+    INVOLVEMENT_TASK,
+    SUMMARY_TASK,
+    BatchInferenceEngine,
+    CascadeClassifier,
+    InferenceContext,
+    LLMResponseCache,
+    ResultsStore,
 )
 from gef_ml.utils.log_config import setup_logging
+from gef_ml.utils.project_list import get_project_ids
 
 setup_logging()
 
@@ -19,94 +24,50 @@ logger = logging.getLogger(__name__)
 
 GEF_6_COLLECTION = "gef_6_512_64"
 
-OUTPUT_CSV = "involvement_summaries.csv"
+INVOLVEMENT_CSV = "involvement_results_latest.csv"
+SUMMARY_CSV = "involvement_summaries_latest.csv"
 EXCEL_PATH = "../data/ieo_private_sector_analysis.xlsx"
 EXCEL_SHEET = "projectlist"
+LLM_CACHE_PATH = "../data/llm_response_cache.sqlite"
+# Every run appends here, the CSVs are exported from it with the latest result of each project
+RESULTS_PATH = "../data/inference_results.sqlite"
+# Trained with train_cascade.py, projects are only sent to the LLM when no model exists for the collection
+CASCADE_PATH = "../data/cascade_{collection}.npz"
+
+
+def get_engine(qdrant_collection: str) -> BatchInferenceEngine:
+    context = InferenceContext(response_cache=LLMResponseCache(LLM_CACHE_PATH))
+    cascade_path = CASCADE_PATH.format(collection=qdrant_collection)
+    cascade = None
+    if os.path.exists(cascade_path):
+        logger.info(f"Using the cascade classifier in {cascade_path}")
+        cascade = CascadeClassifier.load(cascade_path)
+    return BatchInferenceEngine(
+        qdrant_collection=qdrant_collection,
+        context=context,
+        cascade=cascade,
+        results_store=ResultsStore(RESULTS_PATH),
+    )
 
 
 def determine_involvement_batch(
     project_ids: list[str], qdrant_collection: str = GEF_6_COLLECTION
 ):
-
-    logger.info(f"Processing {len(project_ids)} project IDs")
-    path = "../data/" + OUTPUT_CSV
-    with open(path, "w", newline="") as f:
-        logger.info(f"Writing results to {path}")
-        writer = csv.writer(f)
-        writer.writerow(
-            [
-                "project_id",
-                "involvement_level",
-                "secondary_involvement_level",
-                "reason",
-                "extra_info",
-            ]
-        )
-
-        for project_id in tqdm(project_ids, desc="Processing projects"):
-            logger.info(f"Processing project ID {project_id}")
-            response = determine_private_sector_involvement(
-                project_id, qdrant_collection=qdrant_collection
-            )
-            if response:
-                writer.writerow(
-                    [
-                        project_id,
-                        response.involvement_level,
-                        response.secondary_involvement_level,
-                        response.reason,
-                        response.extra_info,
-                    ]
-                )
-                f.flush()
-                logger.info(f"Successfully processed project ID {project_id}")
-            else:
-                writer.writerow([project_id, "No data", "No data"])
-                logger.warning(f"No data received for project ID {project_id}")
+    path = "../data/" + INVOLVEMENT_CSV
+    engine = get_engine(qdrant_collection)
+    asyncio.run(engine.run(INVOLVEMENT_TASK, project_ids, path))
 
 
 def generate_summary_batch(
     project_ids: list[str], qdrant_collection: str = GEF_6_COLLECTION
 ):
-
-    logger.info(f"Processing {len(project_ids)} project IDs")
-    path = "../data/" + OUTPUT_CSV
-    with open(path, "w", newline="") as f:
-        logger.info(f"Writing results to {path}")
-        writer = csv.writer(f, quoting=csv.QUOTE_ALL)
-        writer.writerow(
-            [
-                "project_id",
-                "summary",
-            ]
-        )
-
-        for project_id in tqdm(project_ids, desc="Processing projects"):
-            logger.info(f"Processing project ID {project_id}")
-            response = generate_private_sector_summary(
-                project_id, qdrant_collection=qdrant_collection
-            )
-            if response:
-                writer.writerow(
-                    [
-                        project_id,
-                        response,
-                    ]
-                )
-                f.flush()
-                logger.info(f"Successfully processed project ID {project_id}")
-            else:
-                writer.writerow([project_id, "No data"])
-                logger.warning(f"No data received for project ID {project_id}")
+    path = "../data/" + SUMMARY_CSV
+    engine = get_engine(qdrant_collection)
+    asyncio.run(engine.run(SUMMARY_TASK, project_ids, path))
 
 
 def get_project_ids_from_xlsx(gef_phase: int) -> list[str]:
-    df = pd.read_excel(io=EXCEL_PATH, sheet_name=EXCEL_SHEET)
-    df["GEF ID"] = df["GEF ID"].astype(str)
-
-    gef_6 = df[df["GEF Phase"].str.contains(f"GEF - {gef_phase}")]
-
-    return gef_6["GEF ID"].tolist()
+    return get_project_ids(EXCEL_PATH, gef_phase, EXCEL_SHEET)
 
 
 def main():
@@ -1,13 +1,14 @@
+import asyncio
 import csv
+import hashlib
 import json
 import logging
 import os
-from urllib.parse import unquote, urlparse
+import re
+from urllib.parse import unquote, urljoin, urlparse
 
-import requests
+import aiohttp
 from bs4 import BeautifulSoup
-from dask.base import compute
-from dask.delayed import delayed
 
 # Constants
 PROJECTS_CSV_PATH = os.getenv("PROJECTS_CSV_PATH", "projects.csv")
@@ -18,6 +19,13 @@ BASE_URL = os.getenv("BASE_URL", "https://www.thegef.org/projects-operations/pro
 
 JSON_PATH = "../data/project_ids.json"
 
+MAX_CONCURRENT_PROJECTS = int(os.getenv("MAX_CONCURRENT_PROJECTS", "16"))
+MAX_CONNECTIONS_PER_HOST = int(os.getenv("MAX_CONNECTIONS_PER_HOST", "8"))
+CHUNK_SIZE = 1 << 16
+
+# Per-project record of what was downloaded from each URL, used to skip unchanged files on re-runs
+STATE_FILENAME = ".download_state.json"
+
 
 # Set up logging
 def setup_logging():
@@ -61,68 +69,316 @@ def create_directory(path: str):
     os.chmod(path, 0o777)  # Ensure the directory is writable
 
 
-def download_file(href, project_id, idx):
-    try:
+def load_state(project_dir: str) -> dict:
+    path = os.path.join(project_dir, STATE_FILENAME)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def save_state(project_dir: str, state: dict):
+    path = os.path.join(project_dir, STATE_FILENAME)
+    with open(path + ".tmp", "w") as f:
+        json.dump(state, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def file_sha256(path: str) -> str:
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(CHUNK_SIZE):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def original_filename(href: str) -> str:
+    return os.path.basename(unquote(urlparse(href).path))
+
+
+def assign_filenames(
+    project_id: str, hrefs: list[str], state: dict, project_dir: str
+) -> dict[str, str]:
+    """
+    Picks the file name of every link, `p{project_id}_doc{index}__{original filename}`.
+
+    A link keeps the file name it got in an earlier run: from the state, or for files downloaded before there was a state, from the first unclaimed file on disk with the same original name. Those files are hashed and added to the state, so they are only rewritten if their content changed. New links get the next unused document index, so existing files are never renamed.
+    """
+    pattern = re.compile(rf"^p{re.escape(str(project_id))}_doc(\d+)__(.*)$")
+    on_disk = []
+    for name in os.listdir(project_dir):
+        match = pattern.match(name)
+        if match and not name.endswith(".part"):
+            on_disk.append((int(match.group(1)), name, match.group(2)))
+    on_disk.sort()
+
+    names: dict[str, str] = {}
+    taken = {entry["filename"] for entry in state.values()}
+    for href in hrefs:
+        if href in state:
+            names[href] = state[href]["filename"]
+
+    for href in hrefs:
+        if href in names:
+            continue
+        original = original_filename(href)
+        for _, name, name_original in on_disk:
+            if name not in taken and name_original == original:
+                names[href] = name
+                taken.add(name)
+                state[href] = {
+                    "filename": name,
+                    "sha256": file_sha256(os.path.join(project_dir, name)),
+                    "etag": None,
+                    "last_modified": None,
+                }
+                break
+
+    indices = [index for index, _, _ in on_disk] + [
+        int(match.group(1)) for name in taken if (match := pattern.match(name))
+    ]
+    next_index = max(indices, default=-1) + 1
+    for href in hrefs:
+        if href not in names:
+            names[href] = f"p{project_id}_doc{next_index}__{original_filename(href)}"
+            next_index += 1
+    return names
+
+
+def conditional_headers(entry: dict | None, project_dir: str) -> dict[str, str]:
+    """Builds If-None-Match / If-Modified-Since headers when the file from a previous run (or the file it duplicated) is still on disk."""
+    if not entry:
+        return {}
+    stored_filename = entry.get("duplicate_of", entry["filename"])
+    if not os.path.exists(os.path.join(project_dir, stored_filename)):
+        return {}
+    headers = {}
+    if entry.get("etag"):
+        headers["If-None-Match"] = entry["etag"]
+    if entry.get("last_modified"):
+        headers["If-Modified-Since"] = entry["last_modified"]
+    return headers
+
+
+def find_project_links(html: str, page_url: str) -> tuple[list[str], set[str]]:
+    """Returns the unique document links of a project page in page order, along with the skipped extensions."""
+    soup = BeautifulSoup(html, "html.parser")
+    hrefs = []
+    skipped_extensions = set()
+    for link in soup.find_all("a"):
+        href = link.get("href")
+        if not href:
+            continue
+        href = urljoin(page_url, href)
+        file_extension = os.path.splitext(urlparse(href).path)[1]
+        if file_extension in VALID_EXTENSIONS:
+            if href not in hrefs:
+                hrefs.append(href)
+        else:
+            skipped_extensions.add(file_extension)
+    return hrefs, skipped_extensions
+
+
+class Downloader:
+    """
+    Downloads the documents linked from GEF project pages with asyncio.
+
+    All requests share one pooled session whose connector caps the connections per host. Files are streamed to disk in chunks and hashed on the way. On re-runs, a file is skipped when the server answers the conditional request with 304 Not Modified, and it isn't rewritten when its content hash is unchanged. A document linked twice under different URLs is only kept once per project.
+
+    Args:
+    - output_path: The directory to write the project directories to.
+    - base_url: The URL the project ID is appended to, to get the project page.
+    - max_concurrent_projects: The maximum number of projects downloaded at once.
+    - max_connections_per_host: The maximum number of open connections to a single host.
+    """
+
+    def __init__(
+        self,
+        output_path: str = OUTPUT_PATH,
+        base_url: str = BASE_URL,
+        max_concurrent_projects: int = MAX_CONCURRENT_PROJECTS,
+        max_connections_per_host: int = MAX_CONNECTIONS_PER_HOST,
+        request_timeout: float = 10 * 60,
+    ):
+        self.output_path = output_path
+        self.base_url = base_url
+        self.max_concurrent_projects = max_concurrent_projects
+        self.max_connections_per_host = max_connections_per_host
+        self.request_timeout = request_timeout
+        self.stats = {
+            "downloaded": 0,
+            "not_modified": 0,
+            "unchanged": 0,
+            "duplicate": 0,
+            "failed": 0,
+        }
+
+    async def download_file(
+        self,
+        session: aiohttp.ClientSession,
+        href: str,
+        project_id: str,
+        filename: str,
+        state: dict,
+        known_hashes: dict[str, str],
+    ) -> str | None:
+        """Downloads one file into the project directory, returning its path, or None when it failed or duplicates another file."""
         parsed_url = urlparse(href)
         if parsed_url.scheme == "" or parsed_url.netloc == "":
             logging.warning(f"Skipping invalid URL: {href}")
             return None
 
-        original_filename = os.path.basename(unquote(parsed_url.path))
-        file_response = requests.get(href)
-        file_response.raise_for_status()  # Raise an error for bad status codes
-
-        project_dir = os.path.join(OUTPUT_PATH, str(project_id))
-        create_directory(project_dir)
-
-        file_path = os.path.join(
-            project_dir, f"p{project_id}_doc{idx}__{original_filename}"
-        )
-        with open(file_path, "wb") as file:
-            file.write(file_response.content)
+        project_dir = os.path.join(self.output_path, str(project_id))
+        file_path = os.path.join(project_dir, filename)
+        tmp_path = file_path + ".part"
+        entry = state.get(href)
+
+        try:
+            async with session.get(
+                href, headers=conditional_headers(entry, project_dir)
+            ) as response:
+                if response.status == 304:
+                    if "duplicate_of" in entry:  # type: ignore
+                        self.stats["duplicate"] += 1
+                        return None
+                    self.stats["not_modified"] += 1
+                    logging.info(f"Not modified, skipping: {file_path}")
+                    known_hashes.setdefault(entry["sha256"], file_path)  # type: ignore
+                    return file_path
+                response.raise_for_status()
+
+                sha256 = hashlib.sha256()
+                with open(tmp_path, "wb") as file:
+                    async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                        sha256.update(chunk)
+                        file.write(chunk)
+                digest = sha256.hexdigest()
+                etag = response.headers.get("ETag")
+                last_modified = response.headers.get("Last-Modified")
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self.stats["failed"] += 1
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            logging.error(f"Failed to download file from: {href}. Error: {e}")
+            return None
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        state[href] = {
+            "filename": os.path.basename(file_path),
+            "sha256": digest,
+            "etag": etag,
+            "last_modified": last_modified,
+        }
+
+        duplicate_of = known_hashes.get(digest)
+        if duplicate_of is not None and duplicate_of != file_path:
+            os.remove(tmp_path)
+            state[href]["duplicate_of"] = os.path.basename(duplicate_of)
+            self.stats["duplicate"] += 1
+            logging.info(f"Same content as {duplicate_of}, skipping: {href}")
+            return None
+        known_hashes[digest] = file_path
+
+        if (
+            entry is not None
+            and entry.get("sha256") == digest
+            and os.path.exists(file_path)
+        ):
+            os.remove(tmp_path)
+            self.stats["unchanged"] += 1
+            logging.info(f"Unchanged, skipping: {file_path}")
+            return file_path
+
+        os.replace(tmp_path, file_path)
         os.chmod(file_path, 0o666)  # Ensure the file is writable
+        self.stats["downloaded"] += 1
         logging.info(f"Downloaded file: {file_path}")
         return file_path
-    except requests.RequestException as e:
-        logging.error(f"Failed to download file from: {href}. Error: {e}")
-        return None
-
-
-def download_pdfs_from_project_page(project_id):
-    url = BASE_URL + str(project_id)
-    response = requests.get(url)
-    if response.status_code != 200:
-        logging.warning(f"Failed to access website: {url}")
-        return [], []
-
-    soup = BeautifulSoup(response.text, "html.parser")
-    links = soup.find_all("a")
-
-    downloaded_files = []
-    skipped_extensions = set()
-    idx = 0
-
-    for link in links:
-        href = link.get("href")
-        if href:
-            file_extension = os.path.splitext(href)[1]
-            if file_extension in VALID_EXTENSIONS:
-                downloaded_file = download_file(href, project_id, idx)
-                if downloaded_file:
-                    downloaded_files.append(downloaded_file)
-                    idx += 1
-            else:
-                skipped_extensions.add(file_extension)
 
-    if skipped_extensions:
-        logging.warning(f"Skipped extensions: {skipped_extensions}")
-
-    return downloaded_files, skipped_extensions
+    async def download_project(
+        self, session: aiohttp.ClientSession, project_id: str
+    ) -> tuple[list[str], set[str]]:
+        url = self.base_url + str(project_id)
+        try:
+            async with session.get(url) as response:
+                if response.status != 200:
+                    logging.warning(f"Failed to access website: {url}")
+                    return [], set()
+                html = await response.text()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logging.warning(f"Failed to access website: {url}. Error: {e}")
+            return [], set()
+
+        hrefs, skipped_extensions = find_project_links(html, url)
+        if skipped_extensions:
+            logging.warning(f"Skipped extensions: {skipped_extensions}")
+        if not hrefs:
+            return [], skipped_extensions
+
+        project_dir = os.path.join(self.output_path, str(project_id))
+        create_directory(project_dir)
+        state = load_state(project_dir)
+        filenames = assign_filenames(project_id, hrefs, state, project_dir)
+
+        # Files already on disk from previous runs, so duplicates are detected across runs too
+        known_hashes = {
+            entry["sha256"]: os.path.join(project_dir, entry["filename"])
+            for entry in state.values()
+            if "duplicate_of" not in entry
+        }
+
+        # Files of a project are fetched concurrently, the connector limits the connections per host
+        try:
+            results = await asyncio.gather(
+                *[
+                    self.download_file(
+                        session, href, project_id, filenames[href], state, known_hashes
+                    )
+                    for href in hrefs
+                ],
+                return_exceptions=True,
+            )
+        finally:
+            # Keep the state of the files that finished, also when the download was cancelled
+            save_state(project_dir, state)
+
+        downloaded_files = []
+        for href, result in zip(hrefs, results):
+            if isinstance(result, BaseException):
+                self.stats["failed"] += 1
+                logging.error(
+                    f"Failed to download file from: {href}. Error: {result!r}"
+                )
+            elif result is not None:
+                downloaded_files.append(result)
+        return downloaded_files, skipped_extensions
+
+    async def download_project_ids(self, project_ids: list[str]):
+        create_directory(self.output_path)
+        connector = aiohttp.TCPConnector(limit_per_host=self.max_connections_per_host)
+        semaphore = asyncio.Semaphore(self.max_concurrent_projects)
+
+        async def bounded(session, project_id):
+            async with semaphore:
+                return await self.download_project(session, project_id)
+
+        async with aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=self.request_timeout),
+        ) as session:
+            results = await asyncio.gather(
+                *[bounded(session, pid) for pid in project_ids]
+            )
+
+        logging.info(f"Download stats: {self.stats}")
+        return results
 
 
 def download_project_ids(project_ids: list[str]):
-    tasks = [delayed(download_pdfs_from_project_page)(pid) for pid in project_ids]
-    _ = compute(*tasks)
+    asyncio.run(Downloader().download_project_ids(project_ids))
 
 
 def main():
@@ -0,0 +1,25 @@
+import logging
+import sys
+
+from gef_ml.utils import get_qdrant_client
+from gef_ml.utils.local_vectors import export_collection
+from gef_ml.utils.log_config import setup_logging
+
+setup_logging()
+
+logger = logging.getLogger(__name__)
+
+OUTPUT_DIR = "../data/local_vectors"
+
+
+def main():
+    collection_name = sys.argv[1] if len(sys.argv) > 1 else "gef_6_1024_96_2"
+    client = get_qdrant_client()
+    path = export_collection(client, collection_name, OUTPUT_DIR)
+    logger.info(
+        f"Exported {collection_name} to {path}, set GEF_ML_VECTOR_BACKEND=local to query it"
+    )
+
+
+if __name__ == "__main__":
+    main()
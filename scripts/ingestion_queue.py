@@ -0,0 +1,111 @@
+"""
+Sharded ingestion through a work queue.
+
+    python ingestion_queue.py enqueue    # once, from any host
+    python ingestion_queue.py work       # on every worker process or host
+    python ingestion_queue.py status
+
+Workers claim projects until the queue has nothing left to claim, so more can be started (or restarted) at any time. Each worker sends its own embedding requests, so keep the workers' combined request rate within the API limit with `--embed-rate`.
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+
+from gef_ml.ingestion.work_queue import WorkQueue
+from gef_ml.utils.log_config import setup_logging
+
+setup_logging()
+
+logger = logging.getLogger(__name__)
+
+COLLECTION_NAME = "gef_6_1024_96"
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("command", choices=["enqueue", "work", "status"])
+    parser.add_argument("--directory", default="../data/gef-6/")
+    parser.add_argument("--collection", default=COLLECTION_NAME)
+    parser.add_argument(
+        "--queue",
+        help="SQLite file of the queue, defaults to one per collection in ../data",
+    )
+    parser.add_argument("--lease-seconds", type=float, default=300)
+    parser.add_argument("--max-attempts", type=int, default=3)
+    parser.add_argument(
+        "--no-wal",
+        action="store_true",
+        help="Use when workers on several hosts share the queue over a network filesystem",
+    )
+    parser.add_argument("--reset-failed", action="store_true")
+    parser.add_argument("--parse-workers", type=int, default=os.cpu_count() or 4)
+    parser.add_argument("--embed-rate", type=int, default=75)
+    parser.add_argument("--chunk-size", type=int, default=1024)
+    parser.add_argument("--chunk-overlap", type=int, default=96)
+    return parser.parse_args()
+
+
+def enqueue(args: argparse.Namespace, work_queue: WorkQueue):
+    project_ids = sorted(
+        f
+        for f in os.listdir(args.directory)
+        if os.path.isdir(os.path.join(args.directory, f))
+    )
+    work_queue.enqueue(project_ids)
+    if args.reset_failed:
+        logger.info("Reset %d failed projects", work_queue.reset_failed())
+
+
+async def work(args: argparse.Namespace, work_queue: WorkQueue):
+    # Only the workers need the ingestion stack and credentials
+    from gef_ml.ingestion import StreamingIngestion
+    from gef_ml.ingestion.embedding_cache import EmbeddingCache
+    from gef_ml.ingestion.embedding_service import EmbeddingService
+    from gef_ml.ingestion.parsing import ParsedTextCache
+    from gef_ml.utils import get_qdrant_client, get_qdrant_vectorstore
+
+    vector_store = get_qdrant_vectorstore(
+        collection_name=args.collection,
+        qdrant_client=get_qdrant_client(prefer_grpc=True),
+        batch_size=256,
+        wait=False,
+        quantization=os.getenv("QDRANT_QUANTIZATION"),
+    )
+    embedding_service = EmbeddingService(
+        cache=EmbeddingCache("../data/embedding_cache.sqlite")
+    )
+    ingestion = StreamingIngestion(
+        directory=args.directory,
+        vector_store=vector_store,
+        chunk_size=args.chunk_size,
+        chunk_overlap=args.chunk_overlap,
+        embedding_service=embedding_service,
+        parsed_cache=ParsedTextCache("../data/parsed_text_cache.sqlite"),
+        max_embed_requests_per_second=args.embed_rate,
+    )
+    await ingestion.ingest_from_queue(work_queue, parse_workers=args.parse_workers)
+
+
+def main():
+    args = parse_args()
+    work_queue = WorkQueue(
+        args.queue or f"../data/ingestion_queue_{args.collection}.sqlite",
+        lease_seconds=args.lease_seconds,
+        max_attempts=args.max_attempts,
+        wal=not args.no_wal,
+    )
+
+    if args.command == "enqueue":
+        enqueue(args, work_queue)
+    elif args.command == "work":
+        asyncio.run(work(args, work_queue))
+    logger.info("Queue status: %s", work_queue.summary())
+    work_queue.close()
+
+
+if __name__ == "__main__":
+    main()
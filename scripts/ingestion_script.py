@@ -1,26 +1,61 @@
 import asyncio
 import logging
-
-from gef_ml.ingestion import StreamingIngestion
-from gef_ml.utils import get_qdrant_vectorstore
+import os
+
+from gef_ml.ingestion import ChunkingConfig, StreamingIngestion
+from gef_ml.ingestion.embedding_cache import EmbeddingCache
+from gef_ml.ingestion.embedding_service import EmbeddingService
+from gef_ml.ingestion.manifest import IngestionManifest
+from gef_ml.ingestion.parsing import ParsedTextCache
+from gef_ml.utils import get_qdrant_client, get_qdrant_vectorstore
 from gef_ml.utils.log_config import setup_logging
 
 setup_logging()
 
 logger = logging.getLogger(__name__)
 
+# (chunk_size, chunk_overlap) of every collection to build, each document is parsed once for all of them
+CHUNKINGS = [(1024, 96)]
+
 
 async def main():
-    vector_store = get_qdrant_vectorstore(collection_name="gef_6_1024_96")
+    qdrant_client = get_qdrant_client(prefer_grpc=True)
+    chunking_configs = [
+        ChunkingConfig(
+            chunk_size,
+            chunk_overlap,
+            get_qdrant_vectorstore(
+                collection_name=f"gef_6_{chunk_size}_{chunk_overlap}",
+                qdrant_client=qdrant_client,
+                batch_size=256,
+                # Upserts are applied in order by Qdrant, so there's no need to block on each batch
+                wait=False,
+                # "scalar" or "binary" keeps quantized vectors in RAM and the originals on disk
+                quantization=os.getenv("QDRANT_QUANTIZATION"),
+            ),
+        )
+        for chunk_size, chunk_overlap in CHUNKINGS
+    ]
+    collection_names = "_".join(
+        config.vector_store.collection_name for config in chunking_configs  # type: ignore
+    )
+    embedding_service = EmbeddingService(
+        cache=EmbeddingCache("../data/embedding_cache.sqlite")
+    )
 
     ingest_manager = StreamingIngestion(
         directory="../data/gef-6/",
-        vector_store=vector_store,
-        chunk_size=1024,
-        chunk_overlap=96,
+        chunking_configs=chunking_configs,
+        embedding_service=embedding_service,
+        # The manifest is per set of collections since a project is only done once all of them are stored
+        manifest=IngestionManifest(
+            f"../data/ingestion_manifest_{collection_names}.sqlite"
+        ),
+        # Shared by every collection, the extracted text doesn't depend on the chunking settings
+        parsed_cache=ParsedTextCache("../data/parsed_text_cache.sqlite"),
     )
 
-    await ingest_manager.ingest()
+    await ingest_manager.ingest_pipelined(parse_workers=os.cpu_count() or 4)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,147 @@
+"""Runs the ingestion and inference benchmarks offline, against the fake Together API and an in-memory Qdrant."""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import tempfile
+
+from qdrant_client import QdrantClient
+
+from gef_ml.benchmark import (
+    FakeTogetherServer,
+    generate_corpus,
+    run_embedding_benchmark,
+    run_inference_benchmark,
+    run_ingestion_benchmark,
+)
+from gef_ml.inference import INVOLVEMENT_TASK, SUMMARY_TASK
+from gef_ml.utils.log_config import setup_logging
+
+setup_logging()
+
+logger = logging.getLogger(__name__)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__)
+    corpus = parser.add_argument_group("corpus")
+    corpus.add_argument("--corpus", help="Existing corpus directory to ingest")
+    corpus.add_argument("--projects", type=int, default=20)
+    corpus.add_argument("--files-per-project", type=int, default=5)
+    corpus.add_argument("--paragraphs-per-file", type=int, default=40)
+
+    api = parser.add_argument_group("fake API")
+    api.add_argument("--embed-latency", type=float, default=0.05)
+    api.add_argument("--llm-latency", type=float, default=0.5)
+    api.add_argument("--latency-jitter", type=float, default=0.2)
+    api.add_argument("--embed-rate-limit", type=float)
+    api.add_argument("--llm-rate-limit", type=float)
+    api.add_argument("--error-rate", type=float, default=0.0)
+    api.add_argument("--max-input-chars", type=int)
+
+    ingestion = parser.add_argument_group("ingestion")
+    ingestion.add_argument("--chunk-size", type=int, default=512)
+    ingestion.add_argument("--chunk-overlap", type=int, default=64)
+    ingestion.add_argument("--parse-workers", type=int, default=4)
+    ingestion.add_argument("--serial", action="store_true")
+    ingestion.add_argument("--max-requests-per-second", type=int, default=75)
+    ingestion.add_argument("--max-chunk-size", type=int)
+
+    inference = parser.add_argument_group("inference")
+    inference.add_argument("--task", choices=["involvement", "summary"])
+    inference.add_argument("--max-concurrency", type=int, default=16)
+    inference.add_argument("--llm-rate", type=float, default=2)
+    inference.add_argument("--embedding-rate", type=float, default=10)
+    inference.add_argument(
+        "--context-window",
+        type=int,
+        default=32768,
+        help="Lower it to have the chunks of a project summarized in several LLM calls",
+    )
+
+    parser.add_argument("--json", help="Write the reports to this JSON file")
+    return parser.parse_args()
+
+
+async def main(args: argparse.Namespace):
+    server = FakeTogetherServer(
+        embed_latency=args.embed_latency,
+        llm_latency=args.llm_latency,
+        latency_jitter=args.latency_jitter,
+        embed_rate_limit=args.embed_rate_limit,
+        llm_rate_limit=args.llm_rate_limit,
+        error_rate=args.error_rate,
+        max_input_chars=args.max_input_chars,
+    )
+    qdrant_client = QdrantClient(":memory:")
+    tasks = {"involvement": [INVOLVEMENT_TASK], "summary": [SUMMARY_TASK]}.get(
+        args.task, [INVOLVEMENT_TASK, SUMMARY_TASK]
+    )
+
+    reports = []
+    async with server:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            corpus_dir = args.corpus or tmp_dir
+            if args.corpus:
+                project_ids = sorted(os.listdir(corpus_dir))
+            else:
+                project_ids = generate_corpus(
+                    corpus_dir,
+                    num_projects=args.projects,
+                    files_per_project=args.files_per_project,
+                    paragraphs_per_file=args.paragraphs_per_file,
+                )
+
+            texts = []
+            for root, _, files in os.walk(corpus_dir):
+                for name in files[:2]:
+                    with open(os.path.join(root, name), errors="ignore") as f:
+                        texts.extend(p for p in f.read().split("\n\n") if p.strip())
+            reports.append(
+                await run_embedding_benchmark(
+                    server,
+                    texts,
+                    max_requests_per_second=args.max_requests_per_second,
+                    max_chunk_size=args.max_chunk_size,
+                )
+            )
+
+            reports.append(
+                await run_ingestion_benchmark(
+                    server,
+                    corpus_dir,
+                    qdrant_client,
+                    chunk_size=args.chunk_size,
+                    chunk_overlap=args.chunk_overlap,
+                    pipelined=not args.serial,
+                    parse_workers=args.parse_workers,
+                )
+            )
+
+        for task in tasks:
+            reports.append(
+                await run_inference_benchmark(
+                    server,
+                    qdrant_client,
+                    "benchmark",
+                    project_ids,
+                    task=task,
+                    max_concurrency=args.max_concurrency,
+                    embedding_rate=args.embedding_rate,
+                    llm_rate=args.llm_rate,
+                    context_window=args.context_window,
+                )
+            )
+
+    for report in reports:
+        print(report.format())
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump([r.as_dict() for r in reports], f, indent=2)
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
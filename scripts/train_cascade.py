@@ -0,0 +1,111 @@
+"""
+Trains the cascade classifier that decides the private sector involvement of confidently easy projects without the LLM, see `gef_ml.inference.cascade`.
+
+The labels come from the past involvement result CSVs and the "Private sector tagged" column of the project list, and the project embeddings from the chunk embeddings in the collection. The classifier is cross-validated first, reporting for each threshold the fraction of LLM calls it would avoid and how often its decisions agree with the labels, then fitted on every labelled project and saved with the chosen threshold.
+"""
+
+import argparse
+import logging
+
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from gef_ml.inference import InferenceContext
+from gef_ml.inference.cascade import (
+    LEVELS,
+    CascadeClassifier,
+    build_targets,
+    evaluate,
+    load_result_labels,
+    load_tagged_projects,
+    project_embedding,
+)
+from gef_ml.utils.log_config import setup_logging
+
+setup_logging()
+
+logger = logging.getLogger(__name__)
+
+RESULT_CSVS = [
+    "../data/involvement_results.csv",
+    "../data/involvement_results_1.csv",
+    "../data/involvement_results_v2.csv",
+]
+EXCEL_PATH = "../data/ieo_private_sector_analysis.xlsx"
+EXCEL_SHEET = "projectlist"
+CASCADE_PATH = "../data/cascade_{collection}.npz"
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--collection", default="gef_6_1024_96_2")
+    parser.add_argument(
+        "--results",
+        nargs="+",
+        default=RESULT_CSVS,
+        help="Result CSVs with the labels, later files take precedence",
+    )
+    parser.add_argument("--excel", default=EXCEL_PATH)
+    parser.add_argument(
+        "--no-tags",
+        action="store_true",
+        help="Only train on the result CSVs, not on the project list tags",
+    )
+    parser.add_argument(
+        "--thresholds", type=float, nargs="+", default=[0.6, 0.7, 0.8, 0.9, 0.95]
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.9,
+        help="The threshold saved with the model",
+    )
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--output", help=f"Defaults to {CASCADE_PATH}")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    labels = load_result_labels(args.results)
+    tagged = set() if args.no_tags else load_tagged_projects(args.excel, EXCEL_SHEET)
+    targets = build_targets(labels, tagged)
+    logger.info(
+        f"{len(labels)} projects labelled by past results, {len(tagged - labels.keys())} more by the project list tags"
+    )
+
+    context = InferenceContext()
+    project_ids, X, Y = [], [], []
+    for project_id, target in targets.items():
+        embedding = project_embedding(project_id, args.collection, context)
+        if embedding is None:
+            continue
+        project_ids.append(project_id)
+        X.append(embedding)
+        Y.append(target)
+    if not project_ids:
+        raise SystemExit(f"None of the labelled projects are in {args.collection}")
+    X, Y = np.asarray(X), np.asarray(Y)
+    logger.info(
+        f"{len(project_ids)} labelled projects have chunks in {args.collection}"
+    )
+    for level, count in zip(LEVELS, (Y == 1).sum(axis=0)):
+        logger.info(f"  {level}: {count}")
+
+    logger.info(
+        f"{'threshold':>9} {'decided':>8} {'LLM calls avoided':>18} {'agreement':>10}"
+    )
+    for report in evaluate(X, Y, args.thresholds, folds=args.folds):
+        logger.info(
+            f"{report.threshold:>9.2f} {report.decided:>8} {report.llm_calls_avoided:>18.1%} {report.agreement:>10.1%}"
+        )
+
+    output = args.output or CASCADE_PATH.format(collection=args.collection)
+    CascadeClassifier(threshold=args.threshold).fit(X, Y).save(output)
+    logger.info(f"Saved the cascade classifier to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+import asyncio
+import csv
+import dataclasses
+
+import numpy as np
+import pytest
+
+from gef_ml.inference import batch
+from gef_ml.inference.batch import BatchInferenceEngine, InferenceTask
+from gef_ml.inference.cascade import LEVELS, CascadeClassifier
+from gef_ml.inference.context import InferenceContext
+from gef_ml.inference.results_store import ResultsStore
+
+TASK = InferenceTask(
+    name="echo",
+    query="query",
+    top_k=1,
+    mmr_threshold=0.5,
+    synthesize=lambda nodes, context: None,
+    header=["project_id", "answer"],
+    to_row=lambda project_id, response: [project_id, response],
+    prompt_version="test",
+)
+
+
+class EchoEngine(BatchInferenceEngine):
+    """Answers every project without any clients, failing the projects in `failing` on their first attempt."""
+
+    def __init__(self, failing=(), delay=0.0, **kwargs):
+        super().__init__("collection", context=InferenceContext(), **kwargs)
+        self.failing = set(failing)
+        self.delay = delay
+        self.attempts = {}
+
+    async def _process(self, task, project_id, executor):
+        await asyncio.sleep(self.delay)
+        self.attempts[project_id] = self.attempts.get(project_id, 0) + 1
+        if project_id in self.failing and self.attempts[project_id] == 1:
+            raise RuntimeError("transient error")
+        return f"answer {project_id}"
+
+
+def read_rows(path):
+    with open(path, newline="") as f:
+        return sorted(list(csv.reader(f))[1:])
+
+
+def test_run_writes_one_row_per_project(tmp_path):
+    engine = EchoEngine(failing=["2"], max_concurrency=2, retry_delay=0)
+    output_path = tmp_path / "out.csv"
+
+    asyncio.run(engine.run(TASK, ["1", "2", "3"], str(output_path)))
+
+    assert read_rows(output_path) == [
+        ["1", "answer 1"],
+        ["2", "answer 2"],
+        ["3", "answer 3"],
+    ]
+    assert engine.attempts["2"] == 2
+
+
+def test_writer_failure_cancels_the_workers(tmp_path):
+    class FailingStore:
+        def completed(self, *args):
+            return set()
+
+        def append(self, *args):
+            raise OSError("disk full")
+
+    engine = EchoEngine(delay=0.05, max_concurrency=2, results_store=FailingStore())
+    project_ids = [str(i) for i in range(20)]
+
+    async def run():
+        with pytest.raises(OSError, match="disk full"):
+            await asyncio.wait_for(engine.run(TASK, project_ids), timeout=10)
+        return [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+
+    assert asyncio.run(run()) == []
+
+
+def confident_about_positive_embeddings(threshold=0.9):
+    cascade = CascadeClassifier(threshold=threshold)
+    cascade.mean = np.zeros(1)
+    cascade.weights = np.zeros((1, len(LEVELS)))
+    cascade.weights[0, 0] = 10
+    cascade.bias = np.zeros(len(LEVELS))
+    return cascade
+
+
+def test_cascade_answers_are_stored_under_their_own_version(tmp_path, monkeypatch):
+    llm_calls = []
+    monkeypatch.setattr(
+        batch,
+        "project_embedding",
+        lambda project_id, *args: np.array([1.0 if project_id == "1" else -1.0]),
+    )
+    monkeypatch.setattr(batch, "get_query_embedding", lambda *args: [0.0])
+    monkeypatch.setattr(batch, "query_project_nodes", lambda *args: ["node"])
+    task = dataclasses.replace(
+        TASK,
+        cascadable=True,
+        synthesize=lambda nodes, context: llm_calls.append(1) or "llm answer",
+    )
+    store = ResultsStore(str(tmp_path / "results.sqlite"))
+
+    def run(cascade):
+        engine = BatchInferenceEngine(
+            "collection",
+            context=InferenceContext(),
+            cascade=cascade,
+            results_store=store,
+        )
+        asyncio.run(engine.run(task, ["1", "2"], str(tmp_path / "out.csv")))
+
+    run(confident_about_positive_embeddings())
+    assert len(llm_calls) == 1
+    assert store.completed(task.name, "collection", task.prompt_version) == {"2"}
+    assert [row[0] for row in read_rows(tmp_path / "out.csv")] == ["1", "2"]
+
+    # The same classifier reuses its answers
+    run(confident_about_positive_embeddings())
+    assert len(llm_calls) == 1
+
+    # Without the cascade the project goes to the LLM, and another threshold is another version
+    run(None)
+    assert len(llm_calls) == 2
+    assert store.completed(task.name, "collection", task.prompt_version) == {"1", "2"}
+    assert confident_about_positive_embeddings(0.8).version != (
+        confident_about_positive_embeddings().version
+    )
@@ -0,0 +1,145 @@
+import asyncio
+import hashlib
+import importlib.util
+import json
+import os
+import socket
+from pathlib import Path
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+SCRIPT = Path(__file__).resolve().parents[1] / "scripts" / "download_files.py"
+spec = importlib.util.spec_from_file_location("download_files", SCRIPT)
+download_files = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(download_files)
+
+PROJECT_ID = "42"
+
+
+class StandIn:
+    """A local stand-in for the GEF website, serving one project page and its documents with ETags."""
+
+    def __init__(self, files):
+        self.files = dict(files)
+        self.requests = []
+        # The state is keyed by URL, so every run must serve on the same port
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            self.port = sock.getsockname()[1]
+
+    def app(self):
+        # An application is bound to one event loop, so every run gets its own
+        app = web.Application()
+        app.router.add_get("/projects/{project_id}", self.page)
+        app.router.add_get("/docs/{name}", self.document)
+        return app
+
+    async def page(self, request):
+        links = "".join(f'<a href="/docs/{name}">{name}</a>' for name in self.files)
+        return web.Response(text=f"<html><body>{links}</body></html>")
+
+    async def document(self, request):
+        name = request.match_info["name"]
+        self.requests.append(name)
+        if name not in self.files:
+            raise web.HTTPNotFound()
+        etag = '"' + hashlib.sha256(self.files[name]).hexdigest()[:16] + '"'
+        if request.headers.get("If-None-Match") == etag:
+            return web.Response(status=304)
+        return web.Response(body=self.files[name], headers={"ETag": etag})
+
+
+def run(stand_in, output_path, downloader_cls=None):
+    async def main():
+        server = TestServer(stand_in.app(), port=stand_in.port)
+        await server.start_server()
+        try:
+            downloader = (downloader_cls or download_files.Downloader)(
+                output_path=str(output_path),
+                base_url=str(server.make_url("/projects/")),
+            )
+            await downloader.download_project_ids([PROJECT_ID])
+            return downloader
+        finally:
+            await server.close()
+
+    return asyncio.run(main())
+
+
+def project_files(output_path):
+    project_dir = output_path / PROJECT_ID
+    return sorted(
+        name
+        for name in os.listdir(project_dir)
+        if name != download_files.STATE_FILENAME
+    )
+
+
+def test_rerun_skips_unmodified_files(tmp_path):
+    stand_in = StandIn({"a.pdf": b"first", "b.pdf": b"second"})
+
+    first = run(stand_in, tmp_path)
+    assert first.stats["downloaded"] == 2
+    assert project_files(tmp_path) == ["p42_doc0__a.pdf", "p42_doc1__b.pdf"]
+
+    second = run(stand_in, tmp_path)
+    assert second.stats["not_modified"] == 2
+    assert second.stats["downloaded"] == 0
+    assert project_files(tmp_path) == ["p42_doc0__a.pdf", "p42_doc1__b.pdf"]
+
+
+def test_files_from_before_the_state_are_reused(tmp_path):
+    # A folder downloaded by the old script: idx-based names and no state file
+    project_dir = tmp_path / PROJECT_ID
+    project_dir.mkdir()
+    (project_dir / "p42_doc0__b.pdf").write_bytes(b"second")
+    (project_dir / "p42_doc3__a.pdf").write_bytes(b"first")
+    mtime = os.path.getmtime(project_dir / "p42_doc0__b.pdf")
+    stand_in = StandIn({"a.pdf": b"first", "b.pdf": b"second", "c.pdf": b"third"})
+
+    downloader = run(stand_in, tmp_path)
+
+    assert project_files(tmp_path) == [
+        "p42_doc0__b.pdf",
+        "p42_doc3__a.pdf",
+        "p42_doc4__c.pdf",
+    ]
+    assert downloader.stats["unchanged"] == 2
+    assert downloader.stats["downloaded"] == 1
+    assert downloader.stats["duplicate"] == 0
+    assert os.path.getmtime(project_dir / "p42_doc0__b.pdf") == mtime
+
+    # The bootstrapped state now has the ETags, so the next run doesn't fetch anything
+    downloader = run(stand_in, tmp_path)
+    assert downloader.stats["not_modified"] == 3
+
+
+def test_state_is_kept_when_a_file_fails(tmp_path):
+    class FailingDownloader(download_files.Downloader):
+        async def download_file(self, session, href, *args):
+            if href.endswith("/bad.pdf"):
+                raise OSError("disk full")
+            return await super().download_file(session, href, *args)
+
+    stand_in = StandIn({"a.pdf": b"first", "bad.pdf": b"bad", "b.pdf": b"second"})
+
+    downloader = run(stand_in, tmp_path, FailingDownloader)
+
+    assert downloader.stats["failed"] == 1
+    assert downloader.stats["downloaded"] == 2
+    state_path = tmp_path / PROJECT_ID / download_files.STATE_FILENAME
+    state = json.loads(state_path.read_text())
+    assert sorted(entry["filename"] for entry in state.values()) == [
+        "p42_doc0__a.pdf",
+        "p42_doc2__b.pdf",
+    ]
+    assert not any(name.endswith(".part") for name in project_files(tmp_path))
+
+
+@pytest.mark.parametrize("links", [["a.pdf", "a.pdf"], []])
+def test_find_project_links_deduplicates(links):
+    html = "".join(f'<a href="/docs/{name}">x</a>' for name in links)
+    hrefs, _ = download_files.find_project_links(html, "http://host/projects/1")
+    assert hrefs == ["http://host/docs/a.pdf"][: len(links)]
@@ -0,0 +1,68 @@
+import multiprocessing
+import sqlite3
+
+from gef_ml.ingestion.embedding_cache import EmbeddingCache, content_hash
+
+MODEL = "model"
+
+
+def last_access(path, key):
+    with sqlite3.connect(path) as conn:
+        return conn.execute(
+            "SELECT last_access FROM embeddings WHERE content_hash = ?", (key,)
+        ).fetchone()[0]
+
+
+def test_round_trip(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite"))
+    cache.put_many(MODEL, [(content_hash("a"), [1.0, 2.0])])
+
+    assert cache.get_many(MODEL, [content_hash("a"), content_hash("b")]) == {
+        content_hash("a"): [1.0, 2.0]
+    }
+    assert cache.get_many("other model", [content_hash("a")]) == {}
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_access_times_are_written_in_batches(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    cache = EmbeddingCache(path, access_flush_size=2)
+    cache.put_many(MODEL, [("a", [1.0]), ("b", [2.0])])
+    written = last_access(path, "a")
+
+    cache.get_many(MODEL, ["a"])
+    assert last_access(path, "a") == written
+
+    cache.get_many(MODEL, ["b"])
+    assert last_access(path, "a") > written
+
+
+def test_eviction_keeps_the_recent_hits(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite"), max_entries=2)
+    cache.put_many(MODEL, [("a", [1.0])])
+    cache.put_many(MODEL, [("b", [2.0])])
+    # Only pending in memory, but written before the next put evicts
+    cache.get_many(MODEL, ["a"])
+
+    cache.put_many(MODEL, [("c", [3.0])])
+
+    assert set(cache.get_many(MODEL, ["a", "b", "c"])) == {"a", "c"}
+
+
+def write_and_read(path, worker):
+    cache = EmbeddingCache(path)
+    for i in range(50):
+        cache.put_many(MODEL, [(f"{worker}-{i}", [float(i)])])
+        cache.get_many(MODEL, [f"{(worker + 1) % 4}-{i}", f"{worker}-{i}"])
+    cache.close()
+
+
+def test_processes_share_a_cache(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    EmbeddingCache(path).close()
+
+    with multiprocessing.get_context("fork").Pool(4) as pool:
+        pool.starmap(write_and_read, [(path, worker) for worker in range(4)])
+
+    keys = [f"{worker}-{i}" for worker in range(4) for i in range(50)]
+    assert len(EmbeddingCache(path).get_many(MODEL, keys)) == len(keys)
@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+from llama_index.core.schema import TextNode
+from llama_index.core.vector_stores import VectorStoreQuery
+from llama_index.core.vector_stores.types import VectorStoreQueryMode
+from qdrant_client import QdrantClient
+from qdrant_client.http import models as qdrant_models
+
+from gef_ml.utils.local_vectors import LocalVectorStore, export_collection
+from gef_ml.utils.qdrant import get_qdrant_vectorstore
+
+DIM = 16
+
+
+@pytest.fixture(scope="module")
+def stores(tmp_path_factory):
+    rng = np.random.default_rng(0)
+    client = QdrantClient(":memory:")
+    qdrant_store = get_qdrant_vectorstore("chunks", client)
+    nodes = [
+        TextNode(
+            id_=f"00000000-0000-0000-0000-{i:012d}",
+            text=f"chunk {i}",
+            metadata={"project_id": str(1000 + i % 3)},
+            embedding=rng.normal(size=DIM).tolist(),
+        )
+        for i in range(60)
+    ]
+    qdrant_store.add(nodes)
+    directory = export_collection(
+        client, "chunks", str(tmp_path_factory.mktemp("local_vectors"))
+    )
+    return qdrant_store, LocalVectorStore(directory)
+
+
+def project_filter(project_id):
+    return qdrant_models.Filter(
+        must=[
+            qdrant_models.FieldCondition(
+                key="project_id", match=qdrant_models.MatchValue(value=project_id)
+            )
+        ]
+    )
+
+
+@pytest.mark.parametrize(
+    "mode", [VectorStoreQueryMode.DEFAULT, VectorStoreQueryMode.MMR]
+)
+@pytest.mark.parametrize("project_id", ["1000", "1001", "1002"])
+def test_backends_return_the_same_chunks(stores, mode, project_id):
+    qdrant_store, local_store = stores
+    query = VectorStoreQuery(
+        query_embedding=np.random.default_rng(1).normal(size=DIM).tolist(),
+        similarity_top_k=5,
+        mode=mode,
+        mmr_threshold=0.5,
+    )
+
+    expected = qdrant_store.query(query, qdrant_filters=project_filter(project_id))
+    result = local_store.query(query, qdrant_filters=project_filter(project_id))
+
+    assert result.ids == expected.ids
+    assert [n.get_content() for n in result.nodes] == [
+        n.get_content() for n in expected.nodes
+    ]
+    assert np.allclose(result.similarities, expected.similarities, atol=1e-5)
+
+
+def test_missing_project_returns_nothing(stores):
+    _, local_store = stores
+    query = VectorStoreQuery(query_embedding=[1.0] * DIM, similarity_top_k=5)
+
+    result = local_store.query(query, qdrant_filters=project_filter("9999"))
+
+    assert result.ids == [] and result.nodes == []
@@ -0,0 +1,49 @@
+import os
+import subprocess
+import sys
+import textwrap
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+
+# setup_logging configures the root logger once per process, so it runs in a fresh interpreter
+SCRIPT = textwrap.dedent(
+    """
+    import logging
+    import multiprocessing
+    import sys
+    from concurrent.futures import ProcessPoolExecutor
+
+    from gef_ml.utils.log_config import setup_logging
+
+
+    def work(i):
+        logging.getLogger("worker").info(f"record from worker {i}")
+
+
+    if __name__ == "__main__":
+        setup_logging(log_file=sys.argv[1])
+        logging.getLogger("parent").info("record from parent")
+        with ProcessPoolExecutor(2, mp_context=multiprocessing.get_context("fork")) as executor:
+            list(executor.map(work, range(4)))
+    """
+)
+
+
+def test_records_logged_in_forked_workers_are_written(tmp_path):
+    script = tmp_path / "log_from_workers.py"
+    script.write_text(SCRIPT)
+    log_file = tmp_path / "out.log"
+
+    subprocess.run(
+        [sys.executable, str(script), str(log_file)],
+        cwd=ROOT,
+        env={**os.environ, "PYTHONPATH": str(ROOT)},
+        check=True,
+        timeout=60,
+    )
+
+    lines = log_file.read_text().splitlines()
+    assert any("record from parent" in line for line in lines)
+    for i in range(4):
+        assert any(f"record from worker {i}" in line for line in lines)
@@ -0,0 +1,71 @@
+import os
+
+import pytest
+
+from gef_ml.ingestion.manifest import IngestionManifest
+from gef_ml.ingestion.parsing import list_project_files
+
+
+@pytest.fixture
+def project_dir(tmp_path):
+    project_dir = tmp_path / "1234"
+    project_dir.mkdir()
+    (project_dir / "p1234_doc1__report.txt").write_text("First document.")
+    (project_dir / "p1234_doc2__annex.txt").write_text("Second document.")
+    return project_dir
+
+
+@pytest.fixture
+def manifest(tmp_path):
+    manifest = IngestionManifest(str(tmp_path / "manifest.sqlite"))
+    yield manifest
+    manifest.close()
+
+
+def test_fingerprint_covers_the_ingested_files(manifest, project_dir):
+    (project_dir / ".download_state.json").write_text("{}")
+
+    files = manifest.fingerprint_project("1234", str(project_dir))
+
+    assert [f.filename for f in files] == sorted(
+        os.path.basename(p) for p in list_project_files(str(project_dir))
+    )
+
+
+def test_unchanged_project_is_skipped(manifest, project_dir):
+    files = manifest.fingerprint_project("1234", str(project_dir))
+    manifest.mark_started("1234", files)
+    manifest.mark_done("1234", 2)
+
+    files = manifest.fingerprint_project("1234", str(project_dir))
+    assert not manifest.needs_ingestion("1234", files)
+
+
+def test_hidden_files_do_not_mark_a_project_modified(manifest, project_dir):
+    files = manifest.fingerprint_project("1234", str(project_dir))
+    manifest.mark_started("1234", files)
+    manifest.mark_done("1234", 2)
+
+    (project_dir / ".download_state.json").write_text('{"files": {}}')
+
+    files = manifest.fingerprint_project("1234", str(project_dir))
+    assert not manifest.needs_ingestion("1234", files)
+
+
+def test_modified_file_marks_a_project_modified(manifest, project_dir):
+    files = manifest.fingerprint_project("1234", str(project_dir))
+    manifest.mark_started("1234", files)
+    manifest.mark_done("1234", 2)
+
+    (project_dir / "p1234_doc2__annex.txt").write_text("Revised second document.")
+
+    files = manifest.fingerprint_project("1234", str(project_dir))
+    assert manifest.needs_ingestion("1234", files)
+
+
+def test_failed_project_is_retried(manifest, project_dir):
+    files = manifest.fingerprint_project("1234", str(project_dir))
+    manifest.mark_started("1234", files)
+    manifest.mark_failed("1234", "error")
+
+    assert manifest.needs_ingestion("1234", files)
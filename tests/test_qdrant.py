@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+from llama_index.core.schema import TextNode
+from llama_index.core.vector_stores import VectorStoreQuery
+from llama_index.core.vector_stores.types import VectorStoreQueryMode
+from qdrant_client import QdrantClient
+from qdrant_client.http import models as qdrant_models
+
+from gef_ml.utils.qdrant import get_qdrant_vectorstore
+
+DIM = 8
+
+SEARCH_PARAMS = qdrant_models.SearchParams(
+    quantization=qdrant_models.QuantizationSearchParams(rescore=True, oversampling=2.0)
+)
+
+
+@pytest.fixture
+def store(monkeypatch):
+    rng = np.random.default_rng(0)
+    client = QdrantClient(":memory:")
+    store = get_qdrant_vectorstore("chunks", client)
+    store.add(
+        [
+            TextNode(
+                id_=f"00000000-0000-0000-0000-{i:012d}",
+                text=f"chunk {i}",
+                metadata={"project_id": str(i % 2)},
+                embedding=rng.normal(size=DIM).tolist(),
+            )
+            for i in range(20)
+        ]
+    )
+
+    # The local mode ignores quantization, so record the search params it is given
+    calls = []
+    search = client.search
+
+    def recording_search(*args, **kwargs):
+        calls.append(kwargs.get("search_params"))
+        return search(*args, **kwargs)
+
+    monkeypatch.setattr(client, "search", recording_search)
+    return store, calls
+
+
+def test_quantized_search_goes_through_the_query_path(store):
+    store, calls = store
+    query = VectorStoreQuery(
+        query_embedding=[1.0] * DIM,
+        similarity_top_k=4,
+        mode=VectorStoreQueryMode.MMR,
+        mmr_threshold=0.5,
+    )
+    qdrant_filters = qdrant_models.Filter(
+        must=[
+            qdrant_models.FieldCondition(
+                key="project_id", match=qdrant_models.MatchValue(value="1")
+            )
+        ]
+    )
+    expected = store.query(query, qdrant_filters=qdrant_filters)
+
+    store._use_search_params(SEARCH_PARAMS)
+    result = store.query(query, qdrant_filters=qdrant_filters)
+
+    assert calls == [None, SEARCH_PARAMS]
+    assert result.ids == expected.ids
+    assert all(node.metadata["project_id"] == "1" for node in result.nodes)
+
+
+def test_quantized_search_keeps_the_mode_checks(store):
+    store, _ = store
+    store._use_search_params(SEARCH_PARAMS)
+    query = VectorStoreQuery(
+        query_embedding=[1.0] * DIM,
+        similarity_top_k=4,
+        mode=VectorStoreQueryMode.HYBRID,
+    )
+
+    with pytest.raises(ValueError, match="Hybrid search is not enabled"):
+        store.query(query)
@@ -0,0 +1,53 @@
+from llama_index.core.schema import NodeWithScore, TextNode
+from pydantic import create_model
+
+from gef_ml.inference.context import InferenceContext
+from gef_ml.inference.private_sector import _lookup_involvement
+from gef_ml.inference.prompts import PrivSectorClassResponseObj
+from gef_ml.inference.response_cache import LLMResponseCache, prompt_text
+
+NODES = [NodeWithScore(node=TextNode(text="evidence", id_="1"), score=1.0)]
+
+
+class Summarizer:
+    """Stands in for the synthesizer, only its prompts go into the cache key."""
+
+    def get_prompts(self):
+        return {}
+
+
+def cache_key(output_cls):
+    prompt_hash = LLMResponseCache.prompt_hash(prompt_text("query", {}, output_cls))
+    return LLMResponseCache.make_key("model", prompt_hash, NODES), prompt_hash
+
+
+def test_changing_the_response_schema_misses_the_cache(tmp_path):
+    cache = LLMResponseCache(str(tmp_path / "responses.sqlite"))
+    answer = create_model("Answer", level=(str, ...))
+    key, prompt_hash = cache_key(answer)
+    cache.put(key, "model", prompt_hash, raw="raw", parsed='{"level": "high"}')
+
+    assert cache.get(cache_key(answer)[0]) is not None
+    # Same class name, different fields
+    assert cache.get(cache_key(create_model("Answer", level=(int, ...)))[0]) is None
+    cache.close()
+
+
+def test_a_cached_response_that_fails_validation_is_a_miss(tmp_path):
+    cache = LLMResponseCache(str(tmp_path / "responses.sqlite"))
+    context = InferenceContext(llm_model_name="model", response_cache=cache)
+    cache_key, _ = _lookup_involvement(context, Summarizer(), NODES)
+    key, prompt_hash = cache_key
+    cache.put(key, "model", prompt_hash, raw="raw", parsed='{"level": "high"}')
+
+    assert _lookup_involvement(context, Summarizer(), NODES) == (cache_key, None)
+
+    response = PrivSectorClassResponseObj(
+        involvement_level="Finance",
+        secondary_involvement_level=None,
+        reason="reason",
+        extra_info=None,
+    )
+    cache.put(key, "model", prompt_hash, raw="raw", parsed=response.model_dump_json())
+    assert _lookup_involvement(context, Summarizer(), NODES) == (cache_key, response)
+    cache.close()
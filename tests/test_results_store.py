@@ -0,0 +1,93 @@
+import asyncio
+import csv
+from typing import Literal
+
+from pydantic import BaseModel
+
+from gef_ml.inference.batch import BatchInferenceEngine, InferenceTask
+from gef_ml.inference.context import InferenceContext
+from gef_ml.inference.results_store import ResultsStore, prompt_version
+
+TASK = InferenceTask(
+    name="echo",
+    query="query",
+    top_k=1,
+    mmr_threshold=0.5,
+    synthesize=lambda nodes, context: None,
+    header=["project_id", "answer"],
+    to_row=lambda project_id, response: [project_id, response],
+    prompt_version="test",
+)
+
+
+class EchoEngine(BatchInferenceEngine):
+    def __init__(self, **kwargs):
+        super().__init__("collection", context=InferenceContext(), **kwargs)
+        self.attempts = {}
+
+    async def _process(self, task, project_id, executor):
+        self.attempts[project_id] = self.attempts.get(project_id, 0) + 1
+        return f"answer {project_id}"
+
+
+class Answer(BaseModel):
+    level: Literal["low", "high"]
+
+
+class OtherAnswer(BaseModel):
+    level: Literal["low", "medium", "high"]
+
+
+def test_completed_only_counts_results_with_data_for_the_same_key(tmp_path):
+    store = ResultsStore(str(tmp_path / "results.sqlite"))
+    store.append("task", "collection", "v1", "1", "run1", {"answer": "a"})
+    store.append("task", "collection", "v1", "2", "run1", None)
+    store.append("task", "collection", "v2", "3", "run1", {"answer": "c"})
+    store.append("task", "other", "v1", "4", "run1", {"answer": "d"})
+    store.append("other task", "collection", "v1", "5", "run1", {"answer": "e"})
+
+    assert store.completed("task", "collection", "v1") == {"1"}
+
+
+def test_a_retried_project_counts_once_it_has_data(tmp_path):
+    store = ResultsStore(str(tmp_path / "results.sqlite"))
+    store.append("task", "collection", "v1", "1", "run1", None)
+    store.append("task", "collection", "v1", "1", "run2", {"answer": "a"})
+    store.append("task", "collection", "v1", "1", "run3", None)
+
+    assert store.completed("task", "collection", "v1") == {"1"}
+    df = store.to_frame("task", "collection", "v1")
+    assert df[["project_id", "run_id", "answer"]].values.tolist() == [
+        ["1", "run2", "a"]
+    ]
+
+
+def test_prompt_version_covers_the_templates_and_the_response_schema():
+    version = prompt_version("query", "template", output_cls=Answer)
+
+    assert version == prompt_version("query", "template", output_cls=Answer)
+    assert version != prompt_version("query", "other template", output_cls=Answer)
+    assert version != prompt_version("query", "template", output_cls=OtherAnswer)
+    assert version != prompt_version("query", "template")
+
+
+def test_run_skips_the_completed_projects(tmp_path):
+    store = ResultsStore(str(tmp_path / "results.sqlite"))
+    store.append(
+        TASK.name, "collection", TASK.prompt_version, "1", "old", {"answer": "kept"}
+    )
+    store.append(TASK.name, "collection", TASK.prompt_version, "2", "old", None)
+    store.append(TASK.name, "collection", "old version", "3", "old", {"answer": "old"})
+    engine = EchoEngine(results_store=store)
+    output_path = tmp_path / "out.csv"
+
+    asyncio.run(engine.run(TASK, ["1", "2", "3"], str(output_path), run_id="new"))
+
+    assert engine.attempts == {"2": 1, "3": 1}
+    with open(output_path, newline="") as f:
+        assert list(csv.reader(f)) == [
+            ["project_id", "answer"],
+            ["1", "kept"],
+            ["2", "answer 2"],
+            ["3", "answer 3"],
+        ]
@@ -0,0 +1,67 @@
+import random
+from pathlib import Path
+
+import pytest
+from llama_index.core.node_parser import SentenceSplitter
+from llama_index.core.schema import Document
+
+from gef_ml.ingestion.pipeline import deterministic_node_id
+from gef_ml.ingestion.splitter import FastSentenceSplitter
+
+NOTEBOOKS_DIR = Path(__file__).resolve().parents[1] / "notebooks"
+
+WORDS = ["GEF", "project", "private", "sector", "co-financing", "USD", "2,500,000"]
+PUNCTUATION = [" ", " ", " ", ", ", ". ", "; ", "\n", "\n\n\n", "? "]
+
+
+def random_text(rng, length):
+    return "".join(
+        rng.choice(WORDS) + rng.choice(PUNCTUATION) for _ in range(length)
+    ) + "x" * rng.choice([0, 3000])
+
+
+@pytest.fixture(scope="module")
+def documents():
+    rng = random.Random(0)
+    documents = [
+        Document(
+            text=path.read_text(),
+            id_=path.stem,
+            metadata={"file_name": path.name, "project_id": "9336"},
+        )
+        for path in sorted(NOTEBOOKS_DIR.glob("*.md"))
+    ]
+    documents += [
+        Document(
+            text=random_text(rng, rng.randint(0, 800)),
+            id_=f"random{i}",
+            metadata={"file_name": f"random{i}.txt"},
+        )
+        for i in range(20)
+    ]
+    # Repeated texts exercise the token counts reused within a batch
+    documents.append(Document(text=documents[-1].text, id_="repeated"))
+    return documents
+
+
+@pytest.mark.parametrize("chunk_size", [64, 256, 1024])
+@pytest.mark.parametrize("num_threads", [1, 2])
+def test_chunks_match_sentence_splitter(documents, chunk_size, num_threads):
+    kwargs = dict(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_size // 10,
+        id_func=deterministic_node_id,
+    )
+
+    expected = SentenceSplitter(**kwargs)(documents)
+    nodes = FastSentenceSplitter(num_threads=num_threads, **kwargs)(documents)
+
+    assert [n.to_dict() for n in nodes] == [n.to_dict() for n in expected]
+
+
+def test_split_text_matches_sentence_splitter(documents):
+    text = documents[0].text
+
+    assert FastSentenceSplitter(chunk_size=128, chunk_overlap=16).split_text(
+        text
+    ) == SentenceSplitter(chunk_size=128, chunk_overlap=16).split_text(text)
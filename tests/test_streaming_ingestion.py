@@ -0,0 +1,71 @@
+import asyncio
+
+import numpy as np
+from llama_index.core.schema import MetadataMode
+from llama_index.core.vector_stores.utils import metadata_dict_to_node
+from qdrant_client import QdrantClient
+
+from gef_ml.benchmark.fake_api import FakeTogetherServer, fake_embedding
+from gef_ml.benchmark.harness import generate_corpus
+from gef_ml.ingestion.embedding_cache import EmbeddingCache, content_hash
+from gef_ml.ingestion.embedding_service import EmbeddingService
+from gef_ml.ingestion.pipeline import ChunkingConfig
+from gef_ml.ingestion.streaming_ingestion import StreamingIngestion
+from gef_ml.utils.qdrant import get_qdrant_vectorstore
+
+MODEL = "togethercomputer/m2-bert-80M-2k-retrieval"
+
+
+def stored_chunks(client, collection_name):
+    points, _ = client.scroll(
+        collection_name, limit=10_000, with_payload=True, with_vectors=True
+    )
+    return [
+        (
+            str(point.id),
+            metadata_dict_to_node(point.payload).get_content(
+                metadata_mode=MetadataMode.EMBED
+            ),
+            point.vector,
+        )
+        for point in points
+    ]
+
+
+def test_every_config_stores_the_embedding_of_its_own_chunks(tmp_path):
+    corpus_dir = tmp_path / "corpus"
+    generate_corpus(str(corpus_dir), num_projects=1, files_per_project=1)
+    client = QdrantClient(location=":memory:")
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite"))
+
+    async def ingest():
+        async with FakeTogetherServer() as server:
+            ingestion = StreamingIngestion(
+                str(corpus_dir),
+                embedding_service=EmbeddingService(
+                    api_key="test",
+                    embed_endpoint_url=f"{server.url}/embeddings",
+                    cache=cache,
+                ),
+                chunking_configs=[
+                    ChunkingConfig(128, 16, get_qdrant_vectorstore("small", client)),
+                    ChunkingConfig(256, 32, get_qdrant_vectorstore("large", client)),
+                ],
+            )
+            await ingestion.ingest(parse_workers=1)
+            return server.dim
+
+    dim = asyncio.run(ingest())
+
+    small = stored_chunks(client, "small")
+    large = stored_chunks(client, "large")
+    # Chunk i of the document gets a different ID under each config
+    assert not {point_id for point_id, _, _ in small} & {
+        point_id for point_id, _, _ in large
+    }
+    for _, text, vector in small + large:
+        expected = fake_embedding(text, dim)
+        assert np.allclose(vector, expected, atol=1e-6)
+        cached = cache.get_many(MODEL, [content_hash(text)])[content_hash(text)]
+        assert np.allclose(cached, expected, atol=1e-6)
+    cache.close()
@@ -0,0 +1,95 @@
+import random
+
+from llama_index.core.node_parser import TokenTextSplitter
+from llama_index.core.utils import get_tokenizer
+
+from gef_ml.inference.synthesis import SEPARATOR, drop_near_duplicates, pack_chunks
+
+
+def count_words(text):
+    return len(text.split())
+
+
+def split_words(size):
+    def split(text):
+        words = text.split()
+        return [" ".join(words[i : i + size]) for i in range(0, len(words), size)]
+
+    return split
+
+
+def chunk(name, words):
+    return " ".join(f"{name}w{i}" for i in range(words))
+
+
+def test_windows_keep_every_chunk_once_in_order():
+    rng = random.Random(0)
+    chunks = [chunk(f"c{i}", rng.randint(1, 40)) for i in range(30)]
+
+    windows = pack_chunks(chunks, 100, count_words, split_words(100))
+
+    pieces = [piece for window in windows for piece in window.split(SEPARATOR)]
+    assert sorted(pieces) == sorted(chunks)
+    for window in windows:
+        assert count_words(window) <= 100
+        indices = [chunks.index(piece) for piece in window.split(SEPARATOR)]
+        assert indices == sorted(indices)
+    # First-fit decreasing stays within two windows of the lower bound here
+    total = sum(count_words(c) for c in chunks)
+    assert len(windows) <= total // 100 + 2
+
+
+def test_long_chunks_are_split_and_empty_chunks_dropped():
+    long_chunk = chunk("long", 250)
+
+    windows = pack_chunks(["", "  ", long_chunk], 100, count_words, split_words(100))
+
+    assert [count_words(w) for w in windows] == [100, 100, 50]
+    assert " ".join(windows) == long_chunk
+
+
+def test_windows_over_budget_after_joining_are_split():
+    # The separator costs more tokens in the joined text than it was counted for
+    def count_tokens(text):
+        return count_words(text) + 5 * text.count(SEPARATOR)
+
+    chunks = [chunk(f"c{i}", 20) for i in range(10)]
+
+    windows = pack_chunks(chunks, 50, count_tokens, split_words(50))
+
+    assert all(count_tokens(w) <= 50 for w in windows)
+    pieces = [piece for window in windows for piece in window.split(SEPARATOR)]
+    assert sorted(pieces) == sorted(chunks)
+
+
+def test_windows_fit_the_budget_with_the_real_tokenizer():
+    tokenizer = get_tokenizer()
+    count_tokens = lambda text: len(tokenizer(text))
+    splitter = TokenTextSplitter(chunk_size=200, chunk_overlap=0)
+    rng = random.Random(1)
+    words = ["private", "sector", "GEF-7", "US$", "1,000,000", "co-financing", "."]
+    chunks = [
+        " ".join(rng.choice(words) for _ in range(rng.randint(5, 300)))
+        for _ in range(40)
+    ]
+
+    windows = pack_chunks(chunks, 200, count_tokens, splitter.split_text)
+
+    assert all(count_tokens(w) <= 200 for w in windows)
+    # Long chunks are split, so there are more pieces than chunks, but few windows beyond the lower bound
+    total = sum(count_tokens(c) for c in chunks)
+    assert len(windows) <= total // 200 + 3
+
+
+def test_near_duplicates_are_dropped_keeping_the_first():
+    text = " ".join(f"word{i}" for i in range(100))
+    # Two changed words change 10 of the 96 shingles, a Jaccard similarity of 86 / 106
+    near_copy = text.replace("word20 ", "changed ").replace("word70 ", "changed ")
+    other = " ".join(f"other{i}" for i in range(100))
+
+    assert drop_near_duplicates([text, other, text.upper(), near_copy], 0.9) == [
+        text,
+        other,
+        near_copy,
+    ]
+    assert drop_near_duplicates([text, near_copy], 0.8) == [text]
@@ -0,0 +1,68 @@
+import random
+
+import pytest
+from llama_index.core.schema import Document
+
+from gef_ml.benchmark.legacy import legacy_clean
+from gef_ml.ingestion.text_cleaner import TextCleaner, clean_text, clean_texts
+
+# Word characters, whitespace, non-breaking spaces, C0/C1 control characters and characters NFKC changes
+ALPHABET = list("ab1_ \n\t.-") + [
+    "\u00a0",
+    "\x00",
+    "\x0c",
+    "\x1f",
+    "\x7f",
+    "\x85",
+    "\x9f",
+    "\ufb01",  # ligature fi
+    "\uff21",  # full-width A
+    "\u00bd",  # vulgar fraction one half
+    "e\u0301",  # e and a combining acute accent
+    "\u2003",  # em space
+]
+
+
+def random_texts(count, seed=0):
+    rng = random.Random(seed)
+    return [
+        "".join(rng.choice(ALPHABET) for _ in range(rng.randint(0, 40)))
+        for _ in range(count)
+    ]
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "",
+        "\u00a0",
+        "a\u00a0b",
+        "a\u00a0\u00a0b",
+        "\u00a0a\u00a0",
+        "line\x0c\nnext",
+        "\x00\x1f\x7f\x9f",
+        "\ufb01nance \uff21",
+        "  padded\t",
+    ],
+)
+def test_clean_text_matches_the_legacy_cleaner(text):
+    assert clean_text(text) == legacy_clean(text)
+
+
+def test_clean_text_matches_the_legacy_cleaner_on_random_text():
+    for text in random_texts(2000):
+        assert clean_text(text) == legacy_clean(text), repr(text)
+
+
+def test_worker_processes_give_the_same_result():
+    texts = random_texts(300, seed=1)
+
+    assert clean_texts(texts, num_workers=2, batch_size=16) == [
+        legacy_clean(t) for t in texts
+    ]
+
+
+def test_text_cleaner_cleans_the_nodes():
+    nodes = TextCleaner()([Document(text="a\u00a0b\x0c"), Document(text="\ufb01")])
+
+    assert [n.text for n in nodes] == ["a b", "fi"]
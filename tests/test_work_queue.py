@@ -0,0 +1,178 @@
+import asyncio
+import multiprocessing
+import sqlite3
+import time
+
+from gef_ml.ingestion.embedding_service import EmbeddingService
+from gef_ml.ingestion.streaming_ingestion import StreamingIngestion
+from gef_ml.ingestion.work_queue import (
+    STATUS_CLAIMED,
+    STATUS_DONE,
+    STATUS_FAILED,
+    STATUS_PENDING,
+    WorkQueue,
+)
+
+
+def status(path, project_id):
+    with sqlite3.connect(path) as conn:
+        return conn.execute(
+            "SELECT status, worker_id FROM work_items WHERE project_id = ?",
+            (project_id,),
+        ).fetchone()
+
+
+def test_a_valid_lease_is_held_by_one_worker(tmp_path):
+    queue = WorkQueue(str(tmp_path / "queue.sqlite"))
+    queue.enqueue(["1"])
+
+    assert queue.claim("a").project_id == "1"
+    assert queue.claim("b") is None
+    assert queue.heartbeat("a", "1")
+    assert not queue.heartbeat("b", "1")
+    assert not queue.complete("b", "1", 3)
+    assert queue.complete("a", "1", 3)
+    assert queue.summary() == {STATUS_DONE: 1}
+
+
+def test_an_expired_lease_is_reclaimed(tmp_path):
+    path = str(tmp_path / "queue.sqlite")
+    queue = WorkQueue(path, lease_seconds=0.05)
+    queue.enqueue(["1"])
+    queue.claim("a")
+    time.sleep(0.1)
+
+    item = queue.claim("b")
+
+    assert item.project_id == "1" and item.attempts == 2
+    assert not queue.heartbeat("a", "1")
+    assert status(path, "1") == (STATUS_CLAIMED, "b")
+
+
+def test_failed_projects_are_retried_until_out_of_attempts(tmp_path):
+    queue = WorkQueue(str(tmp_path / "queue.sqlite"), max_attempts=2)
+    queue.enqueue(["1"])
+
+    queue.claim("a")
+    queue.fail("a", "1", "error")
+    assert queue.summary() == {STATUS_PENDING: 1}
+    queue.claim("a")
+    queue.fail("a", "1", "error")
+    assert queue.summary() == {STATUS_FAILED: 1}
+    assert queue.claim("a") is None
+
+    assert queue.reset_failed() == 1
+    assert queue.claim("a").attempts == 1
+
+
+def test_lease_reports_a_lost_lease(tmp_path):
+    path = str(tmp_path / "queue.sqlite")
+    queue = WorkQueue(path)
+    queue.enqueue(["1"])
+    queue.claim("a")
+    calls = []
+
+    with queue.lease("a", "1", interval=0.02, on_lost=lambda: calls.append(1)) as lost:
+        with sqlite3.connect(path) as conn:
+            conn.execute("UPDATE work_items SET worker_id = 'b'")
+        assert lost.wait(5)
+
+    assert calls == [1]
+
+
+def claim_all(path, worker_id):
+    queue = WorkQueue(path)
+    claimed = []
+    while (item := queue.claim(worker_id)) is not None:
+        claimed.append(item.project_id)
+        queue.complete(worker_id, item.project_id, 1)
+    queue.close()
+    return claimed
+
+
+def test_workers_in_several_processes_claim_every_project_once(tmp_path):
+    path = str(tmp_path / "queue.sqlite")
+    project_ids = [str(i) for i in range(200)]
+    queue = WorkQueue(path)
+    queue.enqueue(project_ids)
+    # A connection open in the parent must not be inherited by the forked workers
+    queue.close()
+
+    with multiprocessing.get_context("fork").Pool(4) as pool:
+        claimed = pool.starmap(claim_all, [(path, f"worker{i}") for i in range(4)])
+
+    all_claimed = [project_id for worker in claimed for project_id in worker]
+    assert sorted(all_claimed) == sorted(project_ids)
+    assert WorkQueue(path).summary() == {STATUS_DONE: len(project_ids)}
+
+
+class SlowIngestion(StreamingIngestion):
+    """Takes long over the first attempt at project 1, after another worker has taken it over."""
+
+    def __init__(self, path, **kwargs):
+        super().__init__(
+            str(path), embedding_service=EmbeddingService(api_key="test"), **kwargs
+        )
+        self.path = path
+        self.finished = []
+        self.taken_over = False
+
+    async def _ingest_project(self, project_id, executor=None):
+        if project_id == "1" and not self.taken_over:
+            self.taken_over = True
+            with sqlite3.connect(self.path) as conn:
+                conn.execute(
+                    "UPDATE work_items SET worker_id = 'other' WHERE project_id = '1'"
+                )
+            await asyncio.sleep(10)
+        self.finished.append(project_id)
+        return 1
+
+
+def test_ingestion_stops_when_the_lease_is_lost(tmp_path):
+    path = str(tmp_path / "queue.sqlite")
+    queue = WorkQueue(path, lease_seconds=0.3)
+    queue.enqueue(["1", "2"])
+    ingestion = SlowIngestion(path)
+
+    start = time.perf_counter()
+    completed = asyncio.run(ingestion.ingest_from_queue(queue, "a", parse_workers=1))
+
+    assert time.perf_counter() - start < 5
+    # The other worker never sends a heartbeat, so the project is reclaimed once its lease expires
+    assert completed == 2
+    assert ingestion.finished == ["2", "1"]
+    assert status(path, "1") == (STATUS_DONE, "a")
+
+
+def test_a_running_worker_reclaims_the_project_of_a_dead_worker(tmp_path):
+    path = str(tmp_path / "queue.sqlite")
+    queue = WorkQueue(path, lease_seconds=1)
+    queue.enqueue(["1", "2"])
+    # Worker a dies right after claiming, its lease is still valid when b runs out of pending projects
+    queue.claim("a")
+    ingestion = SlowIngestion(path)
+    ingestion.taken_over = True
+
+    start = time.perf_counter()
+    completed = asyncio.run(ingestion.ingest_from_queue(queue, "b", parse_workers=1))
+
+    assert time.perf_counter() - start >= 0.5
+    assert completed == 2
+    assert ingestion.finished == ["2", "1"]
+    assert status(path, "1") == (STATUS_DONE, "b")
+    assert queue.next_expiry() is None
+
+
+def test_a_failure_after_the_lease_was_lost_is_not_recorded(tmp_path):
+    path = str(tmp_path / "queue.sqlite")
+    queue = WorkQueue(path, lease_seconds=0.05, max_attempts=2)
+    queue.enqueue(["1"])
+    queue.claim("a")
+    time.sleep(0.1)
+    queue.claim("b")
+
+    assert not queue.fail("a", "1", "error")
+    assert status(path, "1") == (STATUS_CLAIMED, "b")
+    assert queue.fail("b", "1", "error")
+    assert queue.summary() == {STATUS_FAILED: 1}